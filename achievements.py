@@ -1,30 +1,88 @@
-from fastapi import APIRouter, Depends
+import threading
+import time
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import get_db
-from models import Achievement, ElectricityLog, WaterLog, CleaningLog
-from schemas import AchievementsResponse, AchievementOut
+from database import get_async_read_db, get_read_db
+from households import current_household
+from models import Achievement
+from query_budget import QueryBudget, declare_budgets
+from response_cache import response_cache
+from schemas import AchievementsResponse
+from streaks import read_streak, read_streak_async
+from totals import read_totals, read_totals_async
 
 router = APIRouter()
+async_router = APIRouter()  # same routes on the AsyncEngine, mounted when DB_ASYNC=1
 
+# Badge definitions (when the in-process copy has expired) + the household's totals and streak rows
+QUERY_BUDGETS = declare_budgets(router, async_router, {
+    ("GET", ""): QueryBudget(statements=3),
+})
 
-def _compute_achievements(db: Session):
-    all_achievements = db.query(Achievement).filter(Achievement.is_active == True).all()
+# Badge definitions almost never change, so keep the active list in process.
+# Edits through the ORM invalidate it immediately; the TTL covers edits made
+# with raw SQL (e.g. re-running init_db.sql) or from another process.
+DEFINITIONS_TTL_SECONDS = 300
 
-    electricity_count = db.query(func.count(ElectricityLog.id)).scalar() or 0
-    water_count = db.query(func.count(WaterLog.id)).scalar() or 0
-    cleaning_count = db.query(func.count(CleaningLog.id)).scalar() or 0
-    total_count = electricity_count + water_count + cleaning_count
+_definitions: Optional[List[tuple]] = None
+_definitions_loaded_at = 0.0
+_definitions_lock = threading.Lock()
+
+
+def invalidate_definitions(*_):
+    global _definitions
+    _definitions = None
+    response_cache.bump()
+
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(Achievement, _evt, invalidate_definitions)
+
+
+def _cached_definitions() -> Optional[List[tuple]]:
+    defs = _definitions
+    if defs is not None and time.monotonic() - _definitions_loaded_at < DEFINITIONS_TTL_SECONDS:
+        return defs
+    return None
+
+
+def _store_definitions(rows) -> List[tuple]:
+    global _definitions, _definitions_loaded_at
+    with _definitions_lock:
+        _definitions = [tuple(r) for r in rows]
+        _definitions_loaded_at = time.monotonic()
+        return _definitions
+
+
+_DEFINITIONS_QUERY = select(
+    Achievement.id, Achievement.badge_key, Achievement.title, Achievement.description,
+    Achievement.icon, Achievement.category, Achievement.threshold_value,
+).where(Achievement.is_active == True).order_by(Achievement.id)
 
-    efficient_count = db.query(func.count(ElectricityLog.id)).filter(
-        ElectricityLog.efficiency == "Efficient"
-    ).scalar() or 0
 
-    good_water_count = db.query(func.count(WaterLog.id)).filter(
-        WaterLog.comparison_rating == "Good"
-    ).scalar() or 0
+def _active_definitions(db: Session) -> List[tuple]:
+    defs = _cached_definitions()
+    if defs is None:
+        defs = _store_definitions(db.execute(_DEFINITIONS_QUERY).all())
+    return defs
 
-    total_carbon = db.query(func.coalesce(func.sum(ElectricityLog.carbon_kg), 0)).scalar() or 0
+
+async def _active_definitions_async(db: AsyncSession) -> List[tuple]:
+    defs = _cached_definitions()
+    if defs is None:
+        defs = _store_definitions((await db.execute(_DEFINITIONS_QUERY)).all())
+    return defs
+
+
+def _build_achievements(definitions: List[tuple], t: dict, streak: dict):
+    # Progress comes from the household's running totals and streak rows, updated with every log insert
+    electricity_count = t["electricity_count"]
+    water_count = t["water_count"]
+    cleaning_count = t["cleaning_count"]
+    total_count = electricity_count + water_count + cleaning_count
 
     # Map badge_key → (current_progress_value)
     progress_map = {
@@ -32,42 +90,64 @@ def _compute_achievements(db: Session):
         "eco_warrior":     electricity_count,
         "water_keeper":    water_count,
         "clean_green":     cleaning_count,
-        "efficiency_pro":  efficient_count,
-        "water_saver":     good_water_count,
-        "carbon_fighter":  float(total_carbon),
+        "efficiency_pro":  t["efficient_count"],
+        "water_saver":     t["good_water_count"],
+        "carbon_fighter":  float(t["total_carbon_kg"]),
         "data_analyst":    total_count,
-        "consistent_user": total_count,
+        "consistent_user": streak["longest_streak"],
         "green_home":      min(3, (1 if electricity_count > 0 else 0) +
                                (1 if water_count > 0 else 0) +
                                (1 if cleaning_count > 0 else 0)),
     }
 
     result = []
-    for ach in all_achievements:
-        progress = progress_map.get(ach.badge_key, 0)
-        unlocked = progress >= ach.threshold_value
-        pct = min(100.0, (progress / ach.threshold_value * 100)) if ach.threshold_value > 0 else 100.0
-        result.append(AchievementOut(
-            id=ach.id,
-            badge_key=ach.badge_key,
-            title=ach.title,
-            description=ach.description,
-            icon=ach.icon,
-            category=ach.category,
-            threshold_value=ach.threshold_value,
-            unlocked=unlocked,
-            progress=round(pct, 1),
-        ))
+    for ach_id, badge_key, title, description, icon, category, threshold_value in definitions:
+        progress = progress_map.get(badge_key, 0)
+        unlocked = progress >= threshold_value
+        pct = min(100.0, (progress / threshold_value * 100)) if threshold_value > 0 else 100.0
+        # AchievementOut as a plain dict in field order: built once, serialized by orjson
+        result.append({
+            "id": ach_id,
+            "badge_key": badge_key,
+            "title": title,
+            "description": description,
+            "icon": icon,
+            "category": category,
+            "threshold_value": float(threshold_value),
+            "unlocked": unlocked,
+            "progress": round(pct, 1),
+        })
 
     return result
 
 
+def _response(achievements: List[dict], streak: dict) -> dict:
+    """AchievementsResponse as a plain dict, in the schema's field order."""
+    return {
+        "achievements": achievements,
+        "unlocked_count": sum(1 for a in achievements if a["unlocked"]),
+        "total_count": len(achievements),
+        "current_streak": streak["current_streak"],
+        "longest_streak": streak["longest_streak"],
+    }
+
+
 @router.get("", response_model=AchievementsResponse)
-def get_achievements(db: Session = Depends(get_db)):
-    achievements = _compute_achievements(db)
-    unlocked = sum(1 for a in achievements if a.unlocked)
-    return AchievementsResponse(
-        achievements=achievements,
-        unlocked_count=unlocked,
-        total_count=len(achievements),
-    )
+def get_achievements(request: Request, household: str = Depends(current_household),
+                     db: Session = Depends(get_read_db)):
+    def build():
+        streak = read_streak(db, household)
+        return _response(_build_achievements(_active_definitions(db), read_totals(db, household), streak), streak)
+
+    return response_cache.serve(request, build)
+
+
+@async_router.get("", response_model=AchievementsResponse)
+async def get_achievements_async(request: Request, household: str = Depends(current_household),
+                                 db: AsyncSession = Depends(get_async_read_db)):
+    async def build():
+        definitions = await _active_definitions_async(db)
+        streak = await read_streak_async(db, household)
+        return _response(_build_achievements(definitions, await read_totals_async(db, household), streak), streak)
+
+    return await response_cache.serve_async(request, build)
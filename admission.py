@@ -0,0 +1,282 @@
+"""Admission control and idempotent retries for the log-writing routes.
+
+POST /api/electricity/calculate, /api/water/calculate and /api/cleaning/analyze all
+end in a write, and every write waits for the database's single writer (SQLite's file
+lock, a hot totals row elsewhere). Under a burst they queue until clients time out and
+retry, which only deepens the queue. Before a write route runs, `admit_write` checks, in
+order:
+
+  * the caller's token bucket (household + client address): ADMISSION_RATE writes per
+    second, bursts of ADMISSION_BURST            -> 429, Retry-After: until the next token
+  * writes in flight: ADMISSION_MAX_IN_FLIGHT for the server, split evenly over its
+    WEB_CONCURRENCY workers                      -> 503, Retry-After: ADMISSION_RETRY_AFTER_SECONDS
+  * the database's recent write latency (an exponentially weighted average of the
+    inline writes, decaying with ADMISSION_LATENCY_HALF_LIFE_SECONDS while nothing is
+    written) above ADMISSION_TARGET_MS         -> 503, Retry-After: until it decays below the target
+
+so a request that can't be served soon is refused in microseconds, without touching the
+database. Buckets and the latency average live in shared_state, so every worker of the
+server enforces the same numbers. ADMISSION_RATE=0 / ADMISSION_MAX_IN_FLIGHT=0 /
+ADMISSION_TARGET_MS=0 switch the respective check off.
+
+Idempotency: a client that sends `Idempotency-Key: <up to 128 chars>` may retry the
+same submission safely. The key is stored with the saved log id and the serialized
+response in the same transaction as the log, so a retry (even one racing the original)
+inserts nothing and gets the original response back, byte for byte: the cost, anomaly
+score and percentile computed before the entry was saved, not a re-run against a month
+that now includes it. The same key with a different body is a 422. Keyed writes are
+always inline, also in write-behind mode, since the key needs the id. Keys are kept for
+at least ADMISSION_IDEMPOTENCY_TTL_HOURS.
+
+/api/stats "admission" counts admitted, shed (rate_limited, overloaded, slow_writes) and
+deduplicated requests over all workers.
+"""
+import hashlib
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional, TypeVar
+from fastapi import Depends, Header, HTTPException, Request
+from pydantic import BaseModel
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from households import current_household
+import anomalies
+from models import IdempotencyKey
+from query_budget import unbudgeted
+from shared_state import SharedStats, shared
+import write_buffer
+
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "20"))           # writes/s per client; 0: no limit
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "60"))
+ADMISSION_CLIENT_SLOTS = int(os.getenv("ADMISSION_CLIENT_SLOTS", "4096"))  # hashed buckets; collisions share one
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))  # whole server; 0: no limit
+ADMISSION_TARGET_MS = float(os.getenv("ADMISSION_TARGET_MS", "500"))      # 0: no latency shedding
+ADMISSION_LATENCY_HALF_LIFE_SECONDS = float(os.getenv("ADMISSION_LATENCY_HALF_LIFE_SECONDS", "2"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+ADMISSION_IDEMPOTENCY_TTL_HOURS = float(os.getenv("ADMISSION_IDEMPOTENCY_TTL_HOURS", "24"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+R = TypeVar("R", bound=BaseModel)
+
+_LATENCY_WEIGHT = 0.2  # of each new write in the average
+
+_per_worker_in_flight = math.ceil(ADMISSION_MAX_IN_FLIGHT / max(1, WEB_CONCURRENCY))
+_in_flight = 0  # this worker's; only touched on the event loop
+_next_purge = 0.0
+
+# Token buckets, hashed by client: tokens left, and when they were last refilled (0: never, full)
+_tokens = shared.array("admission:tokens", ADMISSION_CLIENT_SLOTS)
+_refilled = shared.array("admission:refilled", ADMISSION_CLIENT_SLOTS)
+# Write latency average (ms) and when it was last updated
+_latency = shared.array("admission:latency", 2)
+_stats = SharedStats("admission", {
+    "admitted": "count",
+    "rate_limited": "count",
+    "overloaded": "count",
+    "slow_writes": "count",
+    "deduplicated": "count",
+    "key_conflicts": "count",
+})
+
+
+def _take_token(client: str, now: float) -> float:
+    """Spend one of the client's tokens; returns 0, or the seconds until one is available."""
+    i = _tokens.slot(client)
+    with _tokens.locked():
+        last = _refilled.getf(i)
+        tokens = ADMISSION_BURST if last == 0 else min(ADMISSION_BURST, _tokens.getf(i) + (now - last) * ADMISSION_RATE)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / ADMISSION_RATE
+        _tokens.setf(i, tokens)
+        _refilled.setf(i, now)
+    return wait
+
+
+def write_latency_ms(now: Optional[float] = None) -> float:
+    """The write latency average, decayed for the time since the last write."""
+    average, updated = _latency.getf(0), _latency.getf(1)
+    if not average:
+        return 0.0
+    idle = max(0.0, (now or time.time()) - updated)
+    return average * 0.5 ** (idle / ADMISSION_LATENCY_HALF_LIFE_SECONDS)
+
+
+def _record_latency(ms: float):
+    now = time.time()
+    with _latency.locked():
+        average = write_latency_ms(now)
+        _latency.setf(0, ms if not average else average + _LATENCY_WEIGHT * (ms - average))
+        _latency.setf(1, now)
+
+
+def _shed(status: int, counter: str, retry_after: float, detail: str):
+    _stats.incr(counter)
+    raise HTTPException(status_code=status, detail=detail,
+                        headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+class Admission:
+    """An admitted write request: saves its log row, deduplicated by the Idempotency-Key."""
+
+    def __init__(self, household: str, route: str, key: Optional[str]):
+        self.household = household
+        self.route = route
+        self.key = key
+
+    def _digest(self, req: BaseModel) -> str:
+        return hashlib.sha256(f"{self.route}\n{req.model_dump_json()}".encode()).hexdigest()
+
+    def _lookup(self):
+        return select(IdempotencyKey.request_hash, IdempotencyKey.saved_id, IdempotencyKey.response).where(
+            IdempotencyKey.household_id == self.household, IdempotencyKey.key == self.key)
+
+    def _replay(self, row, digest: str, response: R) -> R:
+        if row.request_hash != digest:
+            _stats.incr("key_conflicts")
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        _stats.incr("deduplicated")
+        if row.response is None:  # a key stored before responses were (schema v4): only the id is known
+            return _complete(response, None, row.saved_id)
+        return type(response).model_validate_json(row.response)
+
+    def _key_row(self, digest: str, response: BaseModel) -> IdempotencyKey:
+        return IdempotencyKey(household_id=self.household, key=self.key, route=self.route, request_hash=digest,
+                              saved_id=response.saved_id, response=response.model_dump_json())
+
+    def save_log(self, db: Session, log, req: BaseModel, response: R, durable: bool = False) -> R:
+        """write_buffer.save_log, timed; returns the response with saved_id (and the anomaly score) filled
+        in. With a key, at most once per key: a repeat gets the first request's response."""
+        if self.key is None:
+            started = time.perf_counter()
+            saved_id = write_buffer.save_log(db, log, durable=durable)
+            if saved_id is not None:  # written inline, not queued
+                _record_latency((time.perf_counter() - started) * 1000)
+            return _complete(response, log, saved_id)
+        digest = self._digest(req)
+        row = db.execute(self._lookup()).first()
+        if row is not None:
+            return self._replay(row, digest, response)
+        started = time.perf_counter()
+        try:
+            db.add(log)
+            db.flush()
+            _complete(response, log, log.id)
+            db.add(self._key_row(digest, response))
+            db.commit()
+        except IntegrityError:  # a concurrent retry with the same key committed first, or another violation
+            db.rollback()
+            row = db.execute(self._lookup()).first()
+            if row is None:
+                raise
+            return self._replay(row, digest, response)
+        _record_latency((time.perf_counter() - started) * 1000)
+        if _purge_due():
+            with unbudgeted():
+                db.execute(_purge_statement())
+                db.commit()
+        return response
+
+    async def save_log_async(self, db, log, req: BaseModel, response: R, durable: bool = False) -> R:
+        """save_log for the async routers (db is an AsyncSession)."""
+        if self.key is None:
+            started = time.perf_counter()
+            saved_id = await write_buffer.save_log_async(db, log, durable=durable)
+            if saved_id is not None:
+                _record_latency((time.perf_counter() - started) * 1000)
+            return _complete(response, log, saved_id)
+        digest = self._digest(req)
+        row = (await db.execute(self._lookup())).first()
+        if row is not None:
+            return self._replay(row, digest, response)
+        started = time.perf_counter()
+        try:
+            db.add(log)
+            await db.flush()
+            _complete(response, log, log.id)
+            db.add(self._key_row(digest, response))
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            row = (await db.execute(self._lookup())).first()
+            if row is None:
+                raise
+            return self._replay(row, digest, response)
+        _record_latency((time.perf_counter() - started) * 1000)
+        if _purge_due():
+            with unbudgeted():
+                await db.execute(_purge_statement())
+                await db.commit()
+        return response
+
+
+def _complete(response: R, log, saved_id: Optional[int]) -> R:
+    """Fill in what is only known once the log is saved: its id and the insert hook's anomaly score."""
+    response.saved_id = saved_id
+    if "anomaly" in type(response).model_fields:
+        response.anomaly, response.z_score = anomalies.verdict(log)
+    return response
+
+
+def _purge_due() -> bool:
+    """Expired keys are deleted by a keyed write about once per tenth of the TTL, per worker."""
+    global _next_purge
+    now = time.monotonic()
+    if now < _next_purge:
+        return False
+    _next_purge = now + ADMISSION_IDEMPOTENCY_TTL_HOURS * 360
+    return True
+
+
+def _purge_statement():
+    cutoff = datetime.utcnow() - timedelta(hours=ADMISSION_IDEMPOTENCY_TTL_HOURS)
+    return delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)
+
+
+async def admit_write(
+    request: Request,
+    household: str = Depends(current_household),
+    idempotency_key: Optional[str] = Header(
+        None, min_length=1, max_length=128,
+        description="Client-chosen id of this submission: retries with the same key return the original saved_id"),
+):
+    """Route dependency for the log-writing routes: sheds the request or yields its Admission."""
+    global _in_flight
+    now = time.time()
+    if ADMISSION_RATE > 0:
+        client = f"{household}|{request.client.host if request.client else ''}"
+        wait = _take_token(client, now)
+        if wait:
+            _shed(429, "rate_limited", wait, "Too many writes from this client, retry later")
+    if ADMISSION_MAX_IN_FLIGHT > 0 and _in_flight >= _per_worker_in_flight:
+        _shed(503, "overloaded", ADMISSION_RETRY_AFTER_SECONDS, "Too many writes in progress, retry later")
+    if ADMISSION_TARGET_MS > 0:
+        latency = write_latency_ms(now)
+        if latency > ADMISSION_TARGET_MS:
+            # Until the average has decayed below the target
+            decay = ADMISSION_LATENCY_HALF_LIFE_SECONDS * math.log2(latency / ADMISSION_TARGET_MS)
+            _shed(503, "slow_writes", decay, "Database writes are slow, retry later")
+    _stats.incr("admitted")
+    _in_flight += 1
+    try:
+        yield Admission(household, request.url.path, idempotency_key)
+    finally:
+        _in_flight -= 1
+
+
+def stats() -> dict:
+    s = _stats.snapshot()
+    s.update(
+        write_latency_ms=round(write_latency_ms(), 3),
+        in_flight=_in_flight,  # this worker's
+        max_in_flight_per_worker=_per_worker_in_flight if ADMISSION_MAX_IN_FLIGHT > 0 else None,
+        rate_per_client=ADMISSION_RATE or None,
+        burst=ADMISSION_BURST,
+        target_ms=ADMISSION_TARGET_MS or None,
+    )
+    return s
@@ -1,48 +1,526 @@
-from fastapi import APIRouter, Depends
+import base64
+import csv
+import io
+import json
+import zlib
+import anyio
+import anyio.lowlevel
+from datetime import date, datetime
+from typing import Dict, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import get_db
-from models import ElectricityLog, WaterLog, CleaningLog
-from schemas import AnalysisHistoryResponse, AnalysisSummaryResponse, ElectricityHistoryItem, WaterHistoryItem
+from database import async_read_engine, gather_rows, get_async_read_db, get_read_db, read_engine
+from households import current_household
+from models import ElectricityLog, WaterLog, CleaningLog, UsageAnomaly, UsageRollup
+from query_budget import QueryBudget, declare_budgets
+from response_cache import response_cache
+from rollups import bucket_start
+from totals import read_totals, read_totals_async
+from schemas import (
+    AnalysisHistoryResponse, AnalysisSummaryResponse, AnomaliesResponse, AnomalyItem, CleaningHistoryItem,
+    ElectricityHistoryItem, WaterHistoryItem, TrendPoint, TrendsResponse,
+)
 
 router = APIRouter()
+async_router = APIRouter()  # same routes on the AsyncEngine, mounted when DB_ASYNC=1
+
+QUERY_BUDGETS = declare_budgets(router, async_router, {
+    ("GET", "/history"): QueryBudget(statements=3),  # one keyset page per log table
+    ("GET", "/summary"): QueryBudget(statements=1),  # the totals row
+    ("GET", "/trends"): QueryBudget(statements=1),   # one grouped rollup query
+    ("GET", "/export"): QueryBudget(statements=1),   # one streamed SELECT
+    ("GET", "/anomalies"): QueryBudget(statements=1),  # one index range scan
+})
+
+
+def _encode_cursor(positions: Dict[str, Optional[list]]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(positions, separators=(",", ":")).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Dict[str, Optional[tuple]]:
+    """{list: (created_at, id) of the last item served, or None once the list is exhausted}."""
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(positions, dict) or any(
+            p is not None and not (isinstance(p, list) and len(p) == 2 and isinstance(p[1], int))
+            for p in positions.values()
+        ):
+            raise ValueError
+        return {key: None if p is None else (datetime.fromisoformat(p[0]), p[1]) for key, p in positions.items()}
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+
+
+class _ItemShape:
+    """A history item schema as plain row tuples: the page query selects exactly the
+    schema's fields, in order, so items are built without ORM entities or model_validate."""
+
+    def __init__(self, model, schema):
+        self.fields = tuple(schema.model_fields)
+        self.columns = [getattr(model, name) for name in self.fields]
+        self.id_index = self.fields.index("id")
+        self.created_index = self.fields.index("created_at")
+        # What validation would coerce: floats stay floats in the JSON even if a driver returns ints
+        self._floats = [i for i, f in enumerate(schema.model_fields.values()) if f.annotation is float]
+
+    def item(self, row) -> dict:
+        if self._floats:
+            row = list(row)
+            for i in self._floats:
+                row[i] = float(row[i])
+        return dict(zip(self.fields, row))
+
+
+_SHAPES = {
+    ElectricityLog: _ItemShape(ElectricityLog, ElectricityHistoryItem),
+    WaterLog: _ItemShape(WaterLog, WaterHistoryItem),
+    CleaningLog: _ItemShape(CleaningLog, CleaningHistoryItem),
+}
+
+
+def _page_query(model, filters: list, position: Optional[tuple], limit: int):
+    """One keyset page of `model` ordered by (created_at, id) descending, after `position`."""
+    stmt = select(*_SHAPES[model].columns).where(*filters)
+    if position is not None:
+        stmt = stmt.where(tuple_(model.created_at, model.id) < position)
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def _page_result(shape: _ItemShape, rows, limit: int):
+    items = [shape.item(r) for r in rows[:limit]]
+    next_position = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_position = [last[shape.created_index].isoformat(), last[shape.id_index]]
+    return items, next_position
+
+
+# Every date-filtered endpoint takes the same half-open range: from <= t < to
+FROM_DESCRIPTION = "Start of the range, inclusive"
+TO_DESCRIPTION = "End of the range, exclusive: entries (or buckets starting) at `to` are left out"
+
+
+class HistoryQuery:
+    """Entries created in [from, to), newest first."""
+
+    def __init__(
+        self,
+        limit: int = Query(30, ge=1, le=200),
+        cursor: Optional[str] = None,
+        category: Optional[Literal["electricity", "water", "cleaning"]] = None,
+        appliance_type: Optional[str] = None,
+        efficiency: Optional[str] = None,
+        activity_type: Optional[str] = None,
+        rating: Optional[str] = None,
+        product_type: Optional[str] = None,
+        date_from: Optional[datetime] = Query(None, alias="from", description=FROM_DESCRIPTION),
+        date_to: Optional[datetime] = Query(None, alias="to", description=TO_DESCRIPTION),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.category = category
+        self.appliance_type = appliance_type
+        self.efficiency = efficiency
+        self.activity_type = activity_type
+        self.rating = rating
+        self.product_type = product_type
+        self.date_from = date_from
+        self.date_to = date_to
+
+
+def _history_plan(q: HistoryQuery, household: str):
+    """Returns ({list: page query}, {list: exhausted-position}) for one history request."""
+    # First page starts every list at the top; later pages resume each list from its
+    # own position, and a null position means that list is exhausted.
+    if q.cursor:
+        positions = _decode_cursor(q.cursor)
+    else:
+        positions = {"electricity": None, "water": None, "cleaning": None}
+    if q.category:
+        positions = {q.category: positions.get(q.category)}
+
+    def date_filters(model):
+        # household_id leads every log index, so each page is a range scan of this household's rows
+        f = [model.household_id == household]
+        if q.date_from:
+            f.append(model.created_at >= q.date_from)
+        if q.date_to:
+            f.append(model.created_at < q.date_to)
+        return f
+
+    e_filters = date_filters(ElectricityLog)
+    if q.appliance_type:
+        e_filters.append(ElectricityLog.appliance_type == q.appliance_type)
+    if q.efficiency:
+        e_filters.append(ElectricityLog.efficiency == q.efficiency)
+
+    w_filters = date_filters(WaterLog)
+    if q.activity_type:
+        w_filters.append(WaterLog.activity_type == q.activity_type)
+    if q.rating:
+        w_filters.append(WaterLog.comparison_rating == q.rating)
+
+    c_filters = date_filters(CleaningLog)
+    if q.product_type:
+        c_filters.append(CleaningLog.product_type == q.product_type)
+
+    queries, exhausted = {}, {}
+    for key, model, filters in (
+        ("electricity", ElectricityLog, e_filters),
+        ("water", WaterLog, w_filters),
+        ("cleaning", CleaningLog, c_filters),
+    ):
+        if key not in positions:
+            continue
+        if positions[key] is None and q.cursor:
+            exhausted[key] = None
+            continue
+        queries[key] = _page_query(model, filters, positions[key], q.limit)
+    return queries, exhausted
+
+
+_HISTORY_MODELS = {"electricity": ElectricityLog, "water": WaterLog, "cleaning": CleaningLog}
+
+
+def _history_response(q: HistoryQuery, rows_by_key: dict, exhausted: dict) -> dict:
+    """AnalysisHistoryResponse as a plain dict, in the schema's field order."""
+    pages = {key: _page_result(_SHAPES[_HISTORY_MODELS[key]], rows, q.limit) for key, rows in rows_by_key.items()}
+    next_positions = dict(exhausted)
+    next_positions.update({key: position for key, (_, position) in pages.items()})
+    electricity = pages.get("electricity", ([], None))[0]
+    water = pages.get("water", ([], None))[0]
+    cleaning = pages.get("cleaning", ([], None))[0]
+
+    has_more = any(p is not None for p in next_positions.values())
+    return {
+        "electricity": electricity,
+        "water": water,
+        "cleaning": cleaning,
+        "total_records": len(electricity) + len(water) + len(cleaning),
+        "next_cursor": _encode_cursor(next_positions) if has_more else None,
+    }
 
 
 @router.get("/history", response_model=AnalysisHistoryResponse)
-def get_history(db: Session = Depends(get_db)):
-    electricity = db.query(ElectricityLog).order_by(ElectricityLog.created_at.desc()).limit(30).all()
-    water = db.query(WaterLog).order_by(WaterLog.created_at.desc()).limit(30).all()
-    return AnalysisHistoryResponse(
-        electricity=[ElectricityHistoryItem.model_validate(e) for e in electricity],
-        water=[WaterHistoryItem.model_validate(w) for w in water],
-        total_records=len(electricity) + len(water),
+def get_history(request: Request, q: HistoryQuery = Depends(), household: str = Depends(current_household),
+                db: Session = Depends(get_read_db)):
+    def build():
+        queries, exhausted = _history_plan(q, household)
+        rows_by_key = {key: db.execute(stmt).all() for key, stmt in queries.items()}
+        return _history_response(q, rows_by_key, exhausted)
+
+    return response_cache.serve(request, build)
+
+
+@async_router.get("/history", response_model=AnalysisHistoryResponse)
+async def get_history_async(request: Request, q: HistoryQuery = Depends(),
+                            household: str = Depends(current_household)):
+    async def build():
+        queries, exhausted = _history_plan(q, household)
+        # The per-list pages are independent, so fetch them concurrently
+        results = await gather_rows(*queries.values())
+        return _history_response(q, dict(zip(queries.keys(), results)), exhausted)
+
+    return await response_cache.serve_async(request, build)
+
+
+def _summary_response(t: dict) -> AnalysisSummaryResponse:
+    return AnalysisSummaryResponse(
+        total_electricity_kwh=round(float(t["total_kwh"]), 2),
+        total_electricity_cost=round(float(t["total_electricity_cost"]), 2),
+        total_carbon_kg=round(float(t["total_carbon_kg"]), 2),
+        total_water_liters=round(float(t["total_liters"]), 2),
+        total_water_cost=round(float(t["total_water_cost"]), 2),
+        electricity_count=t["electricity_count"],
+        water_count=t["water_count"],
+        cleaning_count=t["cleaning_count"],
     )
 
 
 @router.get("/summary", response_model=AnalysisSummaryResponse)
-def get_summary(db: Session = Depends(get_db)):
-    e = db.query(
-        func.coalesce(func.sum(ElectricityLog.monthly_kwh), 0).label("total_kwh"),
-        func.coalesce(func.sum(ElectricityLog.monthly_cost), 0).label("total_cost"),
-        func.coalesce(func.sum(ElectricityLog.carbon_kg), 0).label("total_carbon"),
-        func.count(ElectricityLog.id).label("count"),
-    ).one()
-
-    w = db.query(
-        func.coalesce(func.sum(WaterLog.monthly_liters), 0).label("total_liters"),
-        func.coalesce(func.sum(WaterLog.monthly_cost), 0).label("total_cost"),
-        func.count(WaterLog.id).label("count"),
-    ).one()
-
-    cleaning_count = db.query(func.count(CleaningLog.id)).scalar()
+def get_summary(request: Request, household: str = Depends(current_household), db: Session = Depends(get_read_db)):
+    return response_cache.serve(request, lambda: _summary_response(read_totals(db, household)))
 
-    return AnalysisSummaryResponse(
-        total_electricity_kwh=round(float(e.total_kwh), 2),
-        total_electricity_cost=round(float(e.total_cost), 2),
-        total_carbon_kg=round(float(e.total_carbon), 2),
-        total_water_liters=round(float(w.total_liters), 2),
-        total_water_cost=round(float(w.total_cost), 2),
-        electricity_count=e.count,
-        water_count=w.count,
-        cleaning_count=cleaning_count or 0,
+
+@async_router.get("/summary", response_model=AnalysisSummaryResponse)
+async def get_summary_async(request: Request, household: str = Depends(current_household),
+                            db: AsyncSession = Depends(get_async_read_db)):
+    async def build():
+        return _summary_response(await read_totals_async(db, household))
+
+    return await response_cache.serve_async(request, build)
+
+
+class TrendsQuery:
+    """Buckets overlapping [from, to): from the one containing `from` to the last one starting before `to`."""
+
+    def __init__(
+        self,
+        bucket: Literal["day", "week", "month"] = "day",
+        date_from: Optional[date] = Query(None, alias="from", description=FROM_DESCRIPTION),
+        date_to: Optional[date] = Query(None, alias="to", description=TO_DESCRIPTION),
+        category: Optional[Literal["electricity", "water", "cleaning"]] = None,
+        item_type: Optional[str] = None,
+    ):
+        self.bucket = bucket
+        self.date_from = date_from
+        self.date_to = date_to
+        self.category = category
+        self.item_type = item_type
+
+
+def _trends_query(q: TrendsQuery, household: str):
+    r = UsageRollup
+    stmt = select(
+        r.bucket_start,
+        r.category,
+        func.sum(r.entry_count),
+        func.sum(r.kwh),
+        func.sum(r.cost),
+        func.sum(r.carbon_kg),
+        func.sum(r.liters),
+    ).where(r.household_id == household, r.bucket == q.bucket)
+    if q.date_from:
+        stmt = stmt.where(r.bucket_start >= bucket_start(q.bucket, q.date_from))
+    if q.date_to:
+        stmt = stmt.where(r.bucket_start < q.date_to)
+    if q.category:
+        stmt = stmt.where(r.category == q.category)
+    if q.item_type:
+        stmt = stmt.where(r.item_type == q.item_type)
+    return stmt.group_by(r.bucket_start, r.category).order_by(r.bucket_start, r.category)
+
+
+def _trends_response(q: TrendsQuery, rows) -> TrendsResponse:
+    return TrendsResponse(
+        bucket=q.bucket,
+        points=[
+            TrendPoint(
+                bucket_start=start,
+                category=cat,
+                entry_count=count,
+                kwh=round(float(kwh), 2),
+                cost=round(float(cost), 2),
+                carbon_kg=round(float(carbon), 2),
+                liters=round(float(liters), 2),
+            )
+            for start, cat, count, kwh, cost, carbon, liters in rows
+        ],
     )
+
+
+@router.get("/trends", response_model=TrendsResponse)
+def get_trends(request: Request, q: TrendsQuery = Depends(), household: str = Depends(current_household),
+               db: Session = Depends(get_read_db)):
+    return response_cache.serve(
+        request, lambda: _trends_response(q, db.execute(_trends_query(q, household)).all()))
+
+
+@async_router.get("/trends", response_model=TrendsResponse)
+async def get_trends_async(request: Request, q: TrendsQuery = Depends(), household: str = Depends(current_household),
+                           db: AsyncSession = Depends(get_async_read_db)):
+    async def build():
+        return _trends_response(q, (await db.execute(_trends_query(q, household))).all())
+
+    return await response_cache.serve_async(request, build)
+
+
+class AnomaliesQuery:
+    def __init__(
+        self,
+        limit: int = Query(30, ge=1, le=200),
+        before: Optional[int] = Query(None, ge=1, description="next_before of the previous page"),
+        category: Optional[Literal["electricity", "water"]] = None,
+    ):
+        self.limit = limit
+        self.before = before
+        self.category = category
+
+
+_ANOMALY_SHAPE = _ItemShape(UsageAnomaly, AnomalyItem)
+
+
+def _anomalies_query(q: AnomaliesQuery, household: str):
+    """Newest first, by id: a range scan of the (household_id, id) index."""
+    a = UsageAnomaly
+    stmt = select(*_ANOMALY_SHAPE.columns).where(a.household_id == household)
+    if q.before:
+        stmt = stmt.where(a.id < q.before)
+    if q.category:
+        stmt = stmt.where(a.category == q.category)
+    return stmt.order_by(a.id.desc()).limit(q.limit + 1)
+
+
+def _anomalies_response(q: AnomaliesQuery, rows) -> dict:
+    items = [_ANOMALY_SHAPE.item(r) for r in rows[:q.limit]]
+    return {"anomalies": items, "next_before": items[-1]["id"] if len(rows) > q.limit else None}
+
+
+@router.get("/anomalies", response_model=AnomaliesResponse)
+def get_anomalies(request: Request, q: AnomaliesQuery = Depends(), household: str = Depends(current_household),
+                  db: Session = Depends(get_read_db)):
+    return response_cache.serve(
+        request, lambda: _anomalies_response(q, db.execute(_anomalies_query(q, household)).all()))
+
+
+@async_router.get("/anomalies", response_model=AnomaliesResponse)
+async def get_anomalies_async(request: Request, q: AnomaliesQuery = Depends(),
+                              household: str = Depends(current_household),
+                              db: AsyncSession = Depends(get_async_read_db)):
+    async def build():
+        return _anomalies_response(q, (await db.execute(_anomalies_query(q, household))).all())
+
+    return await response_cache.serve_async(request, build)
+
+
+EXPORT_TABLES = {"electricity": ElectricityLog, "water": WaterLog, "cleaning": CleaningLog}
+# household_id is implied by the caller, so the file layout stays the same for every household
+EXPORT_COLUMNS = {
+    table: [c for c in model.__table__.columns if c.key != "household_id"] for table, model in EXPORT_TABLES.items()
+}
+EXPORT_BATCH_ROWS = 2000  # rows fetched, encoded and sent per chunk
+
+
+class ExportQuery:
+    """Entries created in [from, to)."""
+
+    def __init__(
+        self,
+        table: Literal["electricity", "water", "cleaning"],
+        format: Literal["csv", "ndjson"] = "csv",
+        date_from: Optional[datetime] = Query(None, alias="from", description=FROM_DESCRIPTION),
+        date_to: Optional[datetime] = Query(None, alias="to", description=TO_DESCRIPTION),
+    ):
+        self.table = table
+        self.format = format
+        self.date_from = date_from
+        self.date_to = date_to
+
+
+def _export_query(q: ExportQuery, household: str):
+    """Plain column tuples (no ORM instances), fetched in batches from a server-side cursor."""
+    model = EXPORT_TABLES[q.table]
+    stmt = select(*EXPORT_COLUMNS[q.table]).where(model.household_id == household)
+    if q.date_from:
+        stmt = stmt.where(model.created_at >= q.date_from)
+    if q.date_to:
+        stmt = stmt.where(model.created_at < q.date_to)
+    # yield_per implies stream_results, so MySQL/PostgreSQL don't buffer the whole result
+    return stmt.order_by(model.created_at, model.id).execution_options(yield_per=EXPORT_BATCH_ROWS)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class _ExportEncoder:
+    """Turns batches of row tuples into CSV or NDJSON bytes, gzipped on the fly if asked."""
+
+    def __init__(self, fmt: str, columns: list, gzip: bool):
+        self.fmt = fmt
+        self.columns = columns
+        # wbits=31: gzip container; each batch is sync-flushed so the client gets it right away
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def _bytes(self, text: str) -> bytes:
+        data = text.encode()
+        if self.compressor is None:
+            return data
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def header(self) -> bytes:
+        if self.fmt == "csv":
+            buf = io.StringIO()
+            csv.writer(buf).writerow(self.columns)
+            return self._bytes(buf.getvalue())
+        return b""
+
+    def rows(self, rows) -> bytes:
+        if self.fmt == "csv":
+            buf = io.StringIO()
+            csv.writer(buf).writerows(rows)
+            return self._bytes(buf.getvalue())
+        cols = self.columns
+        return self._bytes("".join(
+            json.dumps(dict(zip(cols, row)), default=_json_default, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for row in rows
+        ))
+
+    def finish(self) -> bytes:
+        return self.compressor.flush() if self.compressor is not None else b""
+
+
+def _accepts_gzip(request: Request) -> bool:
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _export_encoder(q: ExportQuery, gzip: bool) -> _ExportEncoder:
+    columns = [c.key for c in EXPORT_COLUMNS[q.table]]
+    return _ExportEncoder(q.format, columns, gzip)
+
+
+def _export_response(q: ExportQuery, gzip: bool, body) -> StreamingResponse:
+    headers = {"Content-Disposition": f'attachment; filename="{q.table}_logs.{q.format}"',
+               "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    media_type = "text/csv; charset=utf-8" if q.format == "csv" else "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+# The stream outlives the request's dependencies, so it opens its own read connection
+# instead of using get_read_db; only one batch of rows is ever held in memory.
+@router.get("/export")
+def export_logs(request: Request, q: ExportQuery = Depends(), household: str = Depends(current_household)):
+    stmt = _export_query(q, household)
+    gzip = _accepts_gzip(request)
+    encoder = _export_encoder(q, gzip)
+
+    def body():
+        yield encoder.header()
+        with read_engine.connect() as conn:
+            for rows in conn.execute(stmt).partitions():
+                yield encoder.rows(rows)
+        yield encoder.finish()
+
+    return _export_response(q, gzip, body())
+
+
+@async_router.get("/export")
+async def export_logs_async(request: Request, q: ExportQuery = Depends(),
+                            household: str = Depends(current_household)):
+    stmt = _export_query(q, household)
+    gzip = _accepts_gzip(request)
+    encoder = _export_encoder(q, gzip)
+
+    async def body():
+        yield encoder.header()
+        # A client disconnect cancels this stream. Cancelling aiosqlite/asyncpg mid-call
+        # leaves the connection half-terminated, so the DB awaits are shielded and the
+        # cancellation is taken at the checkpoint between batches instead.
+        conn = await async_read_engine.connect()
+        try:
+            with anyio.CancelScope(shield=True):
+                result = await conn.stream(stmt)
+            while True:
+                with anyio.CancelScope(shield=True):
+                    rows = await result.fetchmany(EXPORT_BATCH_ROWS)
+                if not rows:
+                    break
+                yield encoder.rows(rows)
+                await anyio.lowlevel.checkpoint()
+        finally:
+            with anyio.CancelScope(shield=True):
+                await conn.close()
+        yield encoder.finish()
+
+    return _export_response(q, gzip, body())
@@ -0,0 +1,230 @@
+"""Per-household anomaly flags on electricity and water logs, from running statistics.
+
+A geyser suddenly logged at 10 hours/day, or a shower at three times its usual liters,
+should stand out against the household's own history — without reading that history on
+every insert. Each (household, appliance) and (household, activity) keeps one
+`usage_baselines` row: the entry count, mean and sum of squared deviations (Welford) of
+its monthly_kwh / daily_liters. A log insert
+
+  * reads the row by its key and scores the new value against it:
+    z = (value - mean) / max(sample standard deviation, ANOMALY_STD_FLOOR * mean),
+    so an item logged identically for weeks doesn't flag every small change;
+  * folds the value in with one UPDATE that merges the batch's own count / mean / m2
+    into the row's (Chan et al.), computed from the row's current values, so concurrent
+    writers never lose each other's entries — only the score may miss a racing entry;
+  * if |z| >= ANOMALY_Z_THRESHOLD and the row already held ANOMALY_MIN_SAMPLES entries,
+    inserts a `usage_anomalies` row: the /api/analysis/anomalies feed, newest first.
+
+All of it runs in the log's transaction, from the insert hook; the calculate responses
+carry the score as z_score / anomaly (null / false while the baseline is too short, or
+when write-behind saves the log after responding).
+
+Rebuild the baselines and the feed by replaying the raw logs in insertion order (rows
+the retention job has compacted no longer count):
+    python anomalies.py rebuild
+"""
+import argparse
+import math
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, delete, insert, inspect, select, update
+from sqlalchemy.orm import Session
+from database import insert_or_update
+from log_hooks import LogBatch, on_logs_inserted
+from models import ElectricityLog, UsageAnomaly, UsageBaseline, WaterLog
+from shared_state import SharedStats
+
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "5"))
+ANOMALY_STD_FLOOR = float(os.getenv("ANOMALY_STD_FLOOR", "0.1"))  # fraction of the mean
+
+# category -> (log model, item type column, scored value column)
+TRACKED = {
+    "electricity": (ElectricityLog, ElectricityLog.appliance_type, ElectricityLog.monthly_kwh),
+    "water": (WaterLog, WaterLog.activity_type, WaterLog.daily_liters),
+}
+
+Stats = Tuple[int, float, float]  # (count, mean, m2)
+
+_stats = SharedStats("anomalies", {"scored": "count", "flagged": "count"})
+
+
+def _add(s: Stats, x: float) -> Stats:
+    """Welford's update: the stats with one more value."""
+    n, mean, m2 = s
+    n += 1
+    delta = x - mean
+    mean += delta / n
+    return n, mean, m2 + delta * (x - mean)
+
+
+def _merge(t, b_n, b_mean, b_m2) -> list:
+    """SET pairs folding the stats (b_n, b_mean, b_m2) into a baseline row (parallel variance,
+    Chan et al.). MySQL evaluates SET left to right with the new values, so each column is
+    assigned before the ones it reads."""
+    n, mean, m2 = t.c.sample_count, t.c.mean, t.c.m2
+    delta = b_mean - mean
+    return [
+        (m2, m2 + b_m2 + delta * delta * n * b_n / (n + b_n)),
+        (mean, mean + delta * b_n / (n + b_n)),
+        (n, n + b_n),
+    ]
+
+
+def z_score(s: Stats, x: float) -> Optional[float]:
+    """How many (floored) standard deviations x is from the mean; None on a short baseline."""
+    n, mean, m2 = s
+    if n < max(2, ANOMALY_MIN_SAMPLES):
+        return None
+    scale = max(math.sqrt(m2 / (n - 1)), ANOMALY_STD_FLOOR * abs(mean))
+    if scale == 0:
+        return 0.0 if x == mean else None
+    return (x - mean) / scale
+
+
+def is_anomaly(z: Optional[float]) -> bool:
+    return z is not None and abs(z) >= ANOMALY_Z_THRESHOLD
+
+
+def verdict(log) -> Tuple[bool, Optional[float]]:
+    """(anomaly, z_score) the insert hook gave a log; (False, None) if it hasn't run on it."""
+    z = getattr(log, "anomaly_z", None)
+    return is_anomaly(z), None if z is None else round(z, 2)
+
+
+def _created_at(log) -> datetime:
+    # Routes leave created_at to the server default; bulk imports set it
+    created = inspect(log).dict.get("created_at")
+    return created if isinstance(created, datetime) else datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _anomaly_row(household: str, category: str, item_type: str, log_id: Optional[int], x: float, before: Stats,
+                 z: float, created_at) -> dict:
+    return dict(household_id=household, category=category, item_type=item_type, log_id=log_id, value=x,
+                baseline_mean=round(before[1], 4), z_score=round(z, 2), created_at=created_at)
+
+
+@on_logs_inserted
+def apply_batch(conn, batch: LogBatch):
+    groups: Dict[Tuple[str, str, str], list] = defaultdict(list)
+    for category, logs in (("electricity", batch.electricity), ("water", batch.water)):
+        item = TRACKED[category][1].key
+        for log in logs:
+            groups[(log.household_id, category, getattr(log, item))].append(log)
+    if not groups:
+        return
+
+    # One keyed read: a single row for a single log
+    t = UsageBaseline.__table__
+    current = {
+        (row[0], row[1], row[2]): (row[3], row[4], row[5])
+        for row in conn.execute(
+            select(t.c.household_id, t.c.category, t.c.item_type, t.c.sample_count, t.c.mean, t.c.m2).where(
+                t.c.household_id.in_({key[0] for key in groups}),
+                t.c.category.in_({key[1] for key in groups}),
+                t.c.item_type.in_({key[2] for key in groups}),
+            )
+        )
+    }
+
+    updates, inserts, anomalies = [], [], []
+    for key, logs in groups.items():
+        household, category, item_type = key
+        value = TRACKED[category][2].key
+        s = current.get(key, (0, 0.0, 0.0))
+        own: Stats = (0, 0.0, 0.0)  # this batch's values alone, merged into the row below
+        for log in sorted(logs, key=lambda log: log.id or 0):  # insertion order
+            x = float(getattr(log, value))
+            z = log.anomaly_z = z_score(s, x)
+            if is_anomaly(z):
+                anomalies.append(_anomaly_row(household, category, item_type, log.id, x, s, z, _created_at(log)))
+            s = _add(s, x)
+            own = _add(own, x)
+        if key in current:
+            updates.append(dict(k_household=household, k_category=category, k_item=item_type,
+                                b_n=own[0], b_mean=own[1], b_m2=own[2]))
+        else:
+            inserts.append(dict(household_id=household, category=category, item_type=item_type,
+                                sample_count=s[0], mean=s[1], m2=s[2]))
+
+    if updates:
+        conn.execute(
+            update(t)
+            .where(t.c.household_id == bindparam("k_household"), t.c.category == bindparam("k_category"),
+                   t.c.item_type == bindparam("k_item"))
+            .ordered_values(*_merge(t, bindparam("b_n"), bindparam("b_mean"), bindparam("b_m2"))),
+            updates,
+        )
+    if inserts:
+        # A concurrent first entry for the same item may create the row meanwhile: merge into it
+        insert_or_update(conn, t, inserts, ["household_id", "category", "item_type"],
+                         lambda inserted: _merge(t, inserted.sample_count, inserted.mean, inserted.m2))
+    if anomalies:
+        conn.execute(insert(UsageAnomaly), anomalies)
+    _stats.record(scored=sum(len(logs) for logs in groups.values()), flagged=len(anomalies))
+
+
+def build(db: Session) -> Tuple[List[dict], List[dict]]:
+    """(baseline rows, anomaly rows) from replaying every raw log in id order."""
+    baselines, anomalies = [], []
+    for category, (model, item_column, value_column) in TRACKED.items():
+        rows = db.execute(
+            select(model.household_id, item_column, model.id, model.created_at, value_column)
+            .order_by(model.household_id, item_column, model.id)
+            .execution_options(yield_per=5000)
+        )
+        for (household, item_type), group in groupby(rows, key=lambda row: (row[0], row[1])):
+            s: Stats = (0, 0.0, 0.0)
+            for _, _, log_id, created_at, x in group:
+                z = z_score(s, x)
+                if is_anomaly(z):
+                    anomalies.append(_anomaly_row(household, category, item_type, log_id, x, s, z, created_at))
+                s = _add(s, x)
+            baselines.append(dict(household_id=household, category=category, item_type=item_type,
+                                  sample_count=s[0], mean=s[1], m2=s[2]))
+    return baselines, anomalies
+
+
+def rebuild(db: Session) -> Tuple[int, int]:
+    """Replace the baselines and the anomaly feed with a replay of the raw logs; returns their row counts."""
+    baselines, anomalies = build(db)
+    db.execute(delete(UsageBaseline))
+    db.execute(delete(UsageAnomaly))
+    if baselines:
+        db.execute(insert(UsageBaseline), baselines)
+    if anomalies:
+        db.execute(insert(UsageAnomaly), anomalies)
+    db.commit()
+    return len(baselines), len(anomalies)
+
+
+def stats() -> dict:
+    s = _stats.snapshot()  # counted at insert, including transactions later rolled back
+    s.update(z_threshold=ANOMALY_Z_THRESHOLD, min_samples=ANOMALY_MIN_SAMPLES, std_floor=ANOMALY_STD_FLOOR)
+    return s
+
+
+def main(argv=None):
+    from bootstrap import ensure_schema
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the EcoSense usage baselines and anomaly feed")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args(argv)
+
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        baselines, anomalies = rebuild(db)
+        print(f"✅ Rebuilt {baselines} baseline(s); {anomalies} anomalous entries flagged")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
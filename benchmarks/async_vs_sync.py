@@ -0,0 +1,119 @@
+"""Throughput of the threadpool (sync) vs AsyncEngine (DB_ASYNC=1) routers.
+
+Starts a real uvicorn server per mode against a throwaway SQLite database, seeds it,
+then drives a read-heavy mix (summary / history / achievements / calculate) at 1, 50
+and 500 concurrent clients and prints requests/sec.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/async_vs_sync.py --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MIX = [
+    ("GET", "/api/analysis/summary", None, 40),
+    ("GET", "/api/analysis/history", None, 25),
+    ("GET", "/api/achievements", None, 20),
+    ("POST", "/api/electricity/calculate", {"appliance_type": "ac", "hours": 6, "occupancy": 0.7}, 15),
+]
+
+
+def start_server(mode: str, port: int, db_path: str) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", DB_ASYNC="1" if mode == "async" else "0",
+               ADMISSION_RATE="0", ADMISSION_MAX_IN_FLIGHT="0", ADMISSION_TARGET_MS="0")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {base} did not start")
+
+
+async def seed(base: str, rows: int):
+    appliances = ["ac", "fan", "light", "tv", "fridge", "washer", "heater", "geyser"]
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+        for start in range(0, rows, 100):
+            batch = [
+                {"appliance_type": random.choice(appliances), "hours": random.uniform(1, 12),
+                 "occupancy": random.random()}
+                for _ in range(min(100, rows - start))
+            ]
+            await client.post("/api/electricity/calculate/batch", json=batch)
+
+
+async def drive(base: str, concurrency: int, duration: float) -> dict:
+    weights = [w for *_, w in MIX]
+    done = errors = 0
+    stop_at = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal done, errors
+            while time.monotonic() < stop_at:
+                method, path, body, _ = random.choices(MIX, weights)[0]
+                try:
+                    r = await client.request(method, path, json=body)
+                    if r.status_code >= 400:
+                        errors += 1
+                except httpx.TransportError:
+                    errors += 1
+                done += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return {"requests": done, "errors": errors, "rps": round(done / elapsed, 1)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--seed-rows", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            proc = start_server(mode, args.port, os.path.join(tmp, "bench.db"))
+            base = f"http://127.0.0.1:{args.port}"
+            try:
+                await wait_ready(base)
+                await seed(base, args.seed_rows)
+                for c in args.concurrency:
+                    results[(mode, c)] = await drive(base, c, args.duration)
+                    print(f"{mode:>5}  c={c:<4} {results[(mode, c)]}", flush=True)
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    print(f"\n{'clients':>8} {'sync rps':>10} {'async rps':>10}")
+    for c in args.concurrency:
+        print(f"{c:>8} {results[('sync', c)]['rps']:>10} {results[('async', c)]['rps']:>10}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
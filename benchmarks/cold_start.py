@@ -0,0 +1,106 @@
+"""Worker cold start: import + lifespan startup, N workers booting at once on one database.
+
+Each worker is a fresh interpreter that imports main and runs the app's startup (as a
+process manager forking N uvicorn workers would), against a throwaway SQLite database
+that is already at the current schema. Compared:
+
+  create_all  — Base.metadata.create_all per worker (what main.py did at import time)
+  bootstrap   — the lifespan's versioned check (SCHEMA_BOOTSTRAP=upgrade, one query)
+
+Reported per strategy and worker count: SQL statements and milliseconds spent on the
+schema per worker, the median worker boot (interpreter start to app ready) and the wall
+time until every worker is ready. --rtt-ms adds a delay per statement to model a database
+across the network, where create_all's per-table round trips dominate.
+
+    python benchmarks/cold_start.py --workers 1,4,8 --rtt-ms 1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STRATEGIES = ("create_all", "bootstrap")
+
+
+def worker(strategy: str, rtt_ms: float):
+    """One worker boot; prints its timings as JSON."""
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import event
+    from database import Base, engine
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+        if rtt_ms:
+            time.sleep(rtt_ms / 1000)
+
+    from fastapi.testclient import TestClient
+    import bootstrap
+    import main
+
+    imported = time.perf_counter()
+    if strategy == "create_all":
+        Base.metadata.create_all(bind=engine)
+    with TestClient(main.app):
+        ready = time.perf_counter()
+        schema_ms = (ready - imported) * 1000 if strategy == "create_all" else bootstrap.stats()["seconds"] * 1000
+    print(json.dumps({"statements": len(statements), "schema_ms": schema_ms, "ready_at": time.time()}))
+
+
+def boot(strategy: str, workers: int, rtt_ms: float, env: dict) -> dict:
+    env = dict(env, SCHEMA_BOOTSTRAP="off" if strategy == "create_all" else "upgrade")
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", strategy, "--rtt-ms", str(rtt_ms)]
+    started = time.time()
+    procs = [subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+             for _ in range(workers)]
+    results = []
+    for proc in procs:
+        out, _ = proc.communicate()
+        if proc.returncode:
+            raise RuntimeError(f"{strategy} worker exited with {proc.returncode}")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return {
+        "statements": statistics.median(r["statements"] for r in results),
+        "schema_ms": statistics.median(r["schema_ms"] for r in results),
+        "boot_ms": statistics.median((r["ready_at"] - started) * 1000 for r in results),
+        "all_ready_ms": (max(r["ready_at"] for r in results) - started) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure worker cold start with create_all vs the schema bootstrap")
+    parser.add_argument("--workers", default="1,4,8", help="comma-separated worker counts")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="simulated database round trip per statement")
+    parser.add_argument("--repeat", type=int, default=3, help="boots per point (the median is kept)")
+    parser.add_argument("--worker", choices=STRATEGIES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(args.worker, args.rtt_ms)
+        return 0
+
+    counts = [int(n) for n in args.workers.split(",")]
+    with tempfile.TemporaryDirectory(prefix="ecosense-bench-") as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}", RETENTION_DAYS="0")
+        subprocess.run([sys.executable, "bootstrap.py", "upgrade"], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        print(f"   {'strategy':<11} {'workers':>7} {'stmts/worker':>12} {'schema ms':>10} {'boot ms':>9} "
+              f"{'all ready ms':>13}")
+        for workers in counts:
+            for strategy in STRATEGIES:
+                runs = [boot(strategy, workers, args.rtt_ms, env) for _ in range(args.repeat)]
+                r = {k: statistics.median(run[k] for run in runs) for k in runs[0]}
+                print(f"   {strategy:<11} {workers:>7} {r['statements']:>12.0f} {r['schema_ms']:>10.1f} "
+                      f"{r['boot_ms']:>9.0f} {r['all_ready_ms']:>13.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Costing throughput: in-memory tariff book vs looking the schedule up in the database.
+
+Loads the tariff file (tariffs.py; --file, default the app's TARIFF_FILE) and costs
+--requests random electricity entries (region, day, kWh, household month-to-date kWh,
+optional time-of-use start hour) four ways:
+
+  flat     kWh x a flat tariff: the calculation before tariffs.py, for reference
+  quote    TariffBook.schedule() + Schedule.quote() per entry: what /calculate does
+  quotes   TariffBook.quotes() over all entries at once: what /calculate/batch and
+           bulk imports do
+  sql      the same slabs and bands in an SQLite table (in memory, indexed on region,
+           kind, effective_from), read per entry and summed in Python: a schedule lookup
+           through the database instead of the book
+
+Reported: microseconds per entry and entries per second for each, and the largest
+difference between the quote, quotes and sql charges (they should agree to rounding).
+
+    python benchmarks/costing.py --requests 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sql_tables(book) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE slabs (region TEXT, kind TEXT, effective_from TEXT, start REAL, rate REAL)")
+    conn.execute("CREATE TABLE bands (region TEXT, effective_from TEXT, start REAL, multiplier REAL)")
+    conn.execute("CREATE INDEX ix_slabs ON slabs (region, kind, effective_from, start)")
+    conn.execute("CREATE INDEX ix_bands ON bands (region, effective_from, start)")
+    for (region, kind), (_, versions) in book._schedules.items():
+        for s in versions:
+            day = s.effective_from.isoformat()
+            conn.executemany("INSERT INTO slabs VALUES (?, ?, ?, ?, ?)",
+                             [(region, kind, day, start, rate) for start, rate in zip(s.slabs.starts, s.slabs.rates)])
+            if kind == "electricity":
+                conn.executemany("INSERT INTO bands VALUES (?, ?, ?, ?)", [
+                    (region, day, start, m) for start, m in zip(s.time_of_use.starts, s.time_of_use.multipliers)])
+    return conn
+
+
+def sql_quote(conn, region: str, day: str, kwh: float, month_kwh: float, start_hour, hours: float) -> float:
+    version = conn.execute(
+        "SELECT COALESCE(MAX(effective_from), (SELECT MIN(effective_from) FROM slabs WHERE region = ? AND kind = ?)) "
+        "FROM slabs WHERE region = ? AND kind = ? AND effective_from <= ?",
+        (region, "electricity", region, "electricity", day)).fetchone()[0]
+    slabs = conn.execute("SELECT start, rate FROM slabs WHERE region = ? AND kind = ? AND effective_from = ? "
+                         "ORDER BY start", (region, "electricity", version)).fetchall()
+    bands = conn.execute("SELECT start, multiplier FROM bands WHERE region = ? AND effective_from = ? ORDER BY start",
+                         (region, version)).fetchall()
+
+    def charge(units):
+        total = 0.0
+        for i, (start, rate) in enumerate(slabs):
+            end = slabs[i + 1][0] if i + 1 < len(slabs) else float("inf")
+            if units <= start:
+                break
+            total += (min(units, end) - start) * rate
+        return total
+
+    def weighted(a, b):  # multiplier-weighted hours in [a, b), 0 <= a <= b <= 24
+        total = 0.0
+        for i, (start, m) in enumerate(bands):
+            end = bands[i + 1][0] if i + 1 < len(bands) else 24.0
+            total += max(0.0, min(b, end) - max(a, start)) * m
+        return total
+
+    if start_hour is None:
+        factor = weighted(0, 24) / 24
+    else:
+        end = start_hour + hours
+        area = weighted(start_hour, end) if end <= 24 else weighted(start_hour, 24) + weighted(0, end - 24)
+        factor = area / hours
+    return (charge(month_kwh + kwh) - charge(month_kwh)) * factor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare tariff costing from the in-memory book with SQL lookups")
+    parser.add_argument("--file", help="tariff file (default: the app's TARIFF_FILE)")
+    parser.add_argument("--requests", type=int, default=200000, help="entries to cost")
+    parser.add_argument("--sql-requests", type=int, default=5000, help="of those, how many also go through SQL")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ROOT)
+    import tariffs
+
+    book = tariffs.load_book(args.file or tariffs.TARIFF_FILE)
+    rng = random.Random(args.seed)
+    n = args.requests
+    regions = [rng.choice(book.regions) for _ in range(n)]
+    days = [date(2024, 1, 1) + timedelta(days=rng.randrange(900)) for _ in range(n)]
+    kwh = np.array([rng.uniform(0, 400) for _ in range(n)])
+    month_kwh = np.array([rng.uniform(0, 1500) for _ in range(n)])
+    hours = np.array([rng.uniform(0.5, 24) for _ in range(n)])
+    start_hour = np.array([rng.uniform(0, 24) if rng.random() < 0.5 else np.nan for _ in range(n)])
+    rows = list(zip(regions, days, kwh.tolist(), month_kwh.tolist(),
+                    [None if np.isnan(s) else s for s in start_hour.tolist()], hours.tolist()))
+
+    results = {}
+    started = time.perf_counter()
+    [k * 6.0 for k in kwh.tolist()]
+    results["flat"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    quoted = [book.electricity(region, day).quote(k, m, s, h)[0] for region, day, k, m, s, h in rows]
+    results["quote"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    charges, _, _ = book.quotes("electricity", kwh, month_kwh, regions, days, start_hour, hours)
+    results["quotes"] = time.perf_counter() - started
+
+    conn = sql_tables(book)
+    m = min(args.sql_requests, n)
+    started = time.perf_counter()
+    via_sql = [sql_quote(conn, region, day.isoformat(), k, mk, s, h) for region, day, k, mk, s, h in rows[:m]]
+    sql_s = time.perf_counter() - started
+
+    print(f"   {n:,} entries · {len(book.regions)} regions · tariff version {book.version or '-'}\n")
+    print(f"   {'method':<8} {'µs/entry':>10} {'entries/s':>14}")
+    for method, seconds in list(results.items()) + [("sql", sql_s * n / m)]:
+        print(f"   {method:<8} {seconds / n * 1e6:>10.2f} {n / seconds:>14,.0f}")
+    agree = max(abs(a - b) for a, b in zip(quoted, charges.tolist()))
+    agree_sql = max(abs(a - b) for a, b in zip(quoted[:m], via_sql))
+    print(f"\n   max |quote - quotes| = {agree:.2e}   max |quote - sql| = {agree_sql:.2e}   (₹)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Per-household latency as the number of households grows.
+
+Runs the endpoint suite (benchmarks/suite.py) with the same number of log rows per
+household — so the table grows from a few thousand rows to a few hundred thousand —
+and every request acting for a random household, with the response cache off so each
+read reaches the database. Because every read is scoped to one household through the
+household_id-leading indexes, p50/p95 of the household-scoped reads should stay flat.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/household_scaling.py --households 10,100,1000 --rows-per-household 200
+
+Exits 1 when a scoped read's p95 at the largest household count is worse than at the
+smallest by more than --threshold (plus --slack-ms, which absorbs timer noise on
+sub-millisecond routes).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import suite  # noqa: E402
+
+# Reads whose cost should depend on the caller's household only
+SCOPED_READS = (
+    "GET /api/analysis/summary",
+    "GET /api/analysis/history",
+    "GET /api/analysis/trends",
+    "GET /api/achievements",
+)
+
+
+def flatness(results: dict, threshold: float, slack_ms: float) -> list:
+    counts = sorted(results)
+    first, last = results[counts[0]]["endpoints"], results[counts[-1]]["endpoints"]
+    regressions = []
+    for key in SCOPED_READS:
+        if key not in first or key not in last:
+            continue
+        before, after = first[key]["p95_ms"], last[key]["p95_ms"]
+        if after > before * (1 + threshold) + slack_ms:
+            regressions.append(f"{key}: p95 {before} ms at {counts[0]:,} households → "
+                               f"{after} ms at {counts[-1]:,}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that per-household latency stays flat")
+    parser.add_argument("--households", default="10,100,1000", help="comma-separated household counts")
+    parser.add_argument("--rows-per-household", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per household count")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--threshold", type=float, default=0.5, help="allowed relative p95 growth (0.5 = 50%%)")
+    parser.add_argument("--slack-ms", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'households':>10} {'rows':>10}   " + "".join(f"{k.split('/')[-1]:>22}" for k in SCOPED_READS))
+    print(f"{'':>10} {'':>10}   " + "".join(f"{'p50 / p95 ms':>22}" for _ in SCOPED_READS))
+    for households in (int(h) for h in args.households.split(",")):
+        run = argparse.Namespace(requests=args.requests, warmup=args.warmup, seed=args.seed, mode=args.mode,
+                                 no_cache=True, households=households)
+        result = suite.spawn_worker(households * args.rows_per_household, run)
+        results[households] = result
+        cells = []
+        for key in SCOPED_READS:
+            e = result["endpoints"].get(key)
+            cells.append(f"{e['p50_ms']:>9.3f} / {e['p95_ms']:<9.3f}" if e else f"{'—':>22}")
+        print(f"{households:>10,} {result['rows']:>10,}   " + " ".join(cells))
+        for key, n in result["errors"].items():
+            print(f"   ⚠️  {n} × {key}")
+
+    regressions = flatness(results, args.threshold, args.slack_ms)
+    if regressions:
+        print(f"\n⚠️  Per-household latency grew beyond {args.threshold:.0%} (+{args.slack_ms} ms):")
+        for r in regressions:
+            print(f"   {r}")
+        return 1
+    print(f"\n✅ Per-household p95 stayed within {args.threshold:.0%} (+{args.slack_ms} ms) "
+          f"from {min(results):,} to {max(results):,} households")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Percentile lookups: quantile sketch vs counting log rows.
+
+Seeds a throwaway SQLite database with --rows log rows (benchmarks/suite.py), builds the
+sketches from them (sketches.rebuild) and then, for --lookups random (item, value) pairs
+per category, compares:
+
+  sketch  sketches.store.percentile(): bisect over the item's cumulative bucket counts
+  sql     SELECT COUNT(*) ... WHERE item = ? AND value < ?, plus the ties and the total,
+          i.e. what the route would run without the sketch
+
+Reported: microseconds per lookup for each, the rebuild time, and the sketch's error in
+percentage points against the exact rank of the same values (mean and max).
+
+    python benchmarks/percentiles.py --rows 100000 --lookups 2000
+"""
+import argparse
+import bisect
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare sketch percentile lookups with SQL counts")
+    parser.add_argument("--rows", type=int, default=100000, help="seeded log rows")
+    parser.add_argument("--lookups", type=int, default=2000, help="lookups per category")
+    parser.add_argument("--sql-lookups", type=int, default=200, help="of those, how many also run as SQL")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="ecosense-bench-") as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        sys.path.insert(0, ROOT)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from sqlalchemy import func, select
+        import suite
+        import sketches
+        from database import SessionLocal
+        from households import DEFAULT_HOUSEHOLD
+
+        rng = random.Random(args.seed)
+        suite.seed(args.rows, rng, [DEFAULT_HOUSEHOLD])
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            sketches.rebuild(db)
+            rebuild_s = time.perf_counter() - started
+            sketches.store.load(db)
+            print(f"   {args.rows:,} rows · sketches rebuilt in {rebuild_s:.2f}s\n")
+            print(f"   {'category':<12} {'sketch µs':>10} {'sql µs':>10} {'speedup':>9} {'mean err':>9} "
+                  f"{'max err':>8}")
+            for category, (model, item_column, value_column) in sketches.SKETCHED.items():
+                values = {}
+                for item, value in db.execute(select(item_column, value_column)):
+                    values.setdefault(item, []).append(value)
+                for v in values.values():
+                    v.sort()
+                items = sorted(values)
+                probes = []
+                for _ in range(args.lookups):
+                    item = rng.choice(items)
+                    probes.append((item, rng.choice(values[item]) * rng.uniform(0.8, 1.2)))
+
+                started = time.perf_counter()
+                ranks = [sketches.store.percentile(category, item, value) for item, value in probes]
+                sketch_us = (time.perf_counter() - started) / len(probes) * 1e6
+
+                count = select(func.count()).select_from(model)
+                started = time.perf_counter()
+                for item, value in probes[:args.sql_lookups]:
+                    db.scalar(count.where(item_column == item, value_column < value))
+                    db.scalar(count.where(item_column == item, value_column == value))
+                    db.scalar(count.where(item_column == item))
+                sql_us = (time.perf_counter() - started) / min(args.sql_lookups, len(probes)) * 1e6
+
+                errors = []
+                for (item, value), rank in zip(probes, ranks):
+                    if rank is None:
+                        continue
+                    v = values[item]
+                    lo = bisect.bisect_left(v, value)
+                    ties = bisect.bisect_right(v, value) - lo
+                    errors.append(abs(rank - 100 * (lo + ties / 2) / len(v)))
+                print(f"   {category:<12} {sketch_us:>10.2f} {sql_us:>10.0f} {sql_us / sketch_us:>8.0f}x "
+                      f"{statistics.fmean(errors):>8.2f}p {max(errors):>7.2f}p")
+        finally:
+            db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
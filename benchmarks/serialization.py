@@ -0,0 +1,160 @@
+"""Per-request cost of building and serializing the /history and /achievements bodies.
+
+Times, in-process against a throwaway SQLite database, the two ways of producing the
+same response body:
+
+  model  — ORM entities, model_validate per item, the response model, then FastAPI's own
+           response_model validation + jsonable_encoder + json.dumps (the previous path)
+  fast   — column tuples into plain dicts in schema order, serialized once by orjson,
+           returned as a Response (what the routes do now)
+
+and checks both produce byte-identical JSON.
+
+    python benchmarks/serialization.py --rows 20000 --iterations 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _timed(fn, iterations: int) -> float:
+    """Median microseconds per call over `iterations` calls, in 10 rounds."""
+    per_round = max(1, iterations // 10)
+    rounds = []
+    for _ in range(10):
+        t0 = time.perf_counter()
+        for _ in range(per_round):
+            fn()
+        rounds.append((time.perf_counter() - t0) / per_round * 1e6)
+    return sorted(rounds)[len(rounds) // 2]
+
+
+def run(rows: int, iterations: int, limit: int):
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import suite
+    from households import DEFAULT_HOUSEHOLD
+
+    suite.seed(rows, random.Random(42), [DEFAULT_HOUSEHOLD])
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import APIRoute, serialize_response
+    from sqlalchemy import String, select, type_coerce
+    import achievements
+    import analysis
+    import main
+    from database import SessionLocal
+    from models import CleaningLog, ElectricityLog, WaterLog
+    from response_cache import render
+    from schemas import (
+        AchievementOut, AchievementsResponse, AnalysisHistoryResponse, CleaningHistoryItem, ElectricityHistoryItem,
+        WaterHistoryItem,
+    )
+    from streaks import read_streak
+    from totals import read_totals
+
+    routes = {r.path: r for r in main.app.routes if isinstance(r, APIRoute)}
+    loop = asyncio.new_event_loop()
+
+    def fastapi_body(path: str, model) -> bytes:
+        """What FastAPI does with a returned model: validate against response_model, encode, dump."""
+        content = loop.run_until_complete(serialize_response(
+            field=routes[path].response_field, response_content=model, is_coroutine=True))
+        return JSONResponse(content).body
+
+    db = SessionLocal()
+    q = analysis.HistoryQuery(limit=limit, cursor=None, category=None, appliance_type=None, efficiency=None,
+                              activity_type=None, rating=None, product_type=None, date_from=None, date_to=None)
+    schemas = ((ElectricityLog, ElectricityHistoryItem), (WaterLog, WaterHistoryItem),
+               (CleaningLog, CleaningHistoryItem))
+
+    def history_model() -> bytes:
+        pages, positions = [], {}
+        for (model, schema), key in zip(schemas, ("electricity", "water", "cleaning")):
+            raw = type_coerce(model.created_at, String).label("created_raw")
+            result = db.execute(
+                select(model, raw).where(model.household_id == DEFAULT_HOUSEHOLD)
+                .order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+            ).all()
+            pages.append([schema.model_validate(r[0]) for r in result[:limit]])
+            positions[key] = [str(result[limit - 1][1]), result[limit - 1][0].id] if len(result) > limit else None
+        has_more = any(p is not None for p in positions.values())
+        response = AnalysisHistoryResponse(
+            electricity=pages[0], water=pages[1], cleaning=pages[2], total_records=sum(map(len, pages)),
+            next_cursor=analysis._encode_cursor(positions) if has_more else None,
+        )
+        return fastapi_body("/api/analysis/history", response)
+
+    def history_fast() -> bytes:
+        queries, exhausted = analysis._history_plan(q, DEFAULT_HOUSEHOLD)
+        rows_by_key = {key: db.execute(stmt).all() for key, stmt in queries.items()}
+        return render(analysis._history_response(q, rows_by_key, exhausted))
+
+    def achievements_model() -> bytes:
+        streak = read_streak(db, DEFAULT_HOUSEHOLD)
+        items = achievements._build_achievements(
+            achievements._active_definitions(db), read_totals(db, DEFAULT_HOUSEHOLD), streak)
+        response = AchievementsResponse(
+            achievements=[AchievementOut(**item) for item in items],
+            unlocked_count=sum(1 for a in items if a["unlocked"]),
+            total_count=len(items),
+            current_streak=streak["current_streak"],
+            longest_streak=streak["longest_streak"],
+        )
+        return fastapi_body("/api/achievements", response)
+
+    def achievements_fast() -> bytes:
+        streak = read_streak(db, DEFAULT_HOUSEHOLD)
+        items = achievements._build_achievements(
+            achievements._active_definitions(db), read_totals(db, DEFAULT_HOUSEHOLD), streak)
+        return render(achievements._response(items, streak))
+
+    results = []
+    try:
+        for name, model_fn, fast_fn in (
+            (f"GET /api/analysis/history (limit={limit})", history_model, history_fast),
+            ("GET /api/achievements", achievements_model, achievements_fast),
+        ):
+            identical = model_fn() == fast_fn()
+            before = _timed(model_fn, iterations)
+            after = _timed(fast_fn, iterations)
+            results.append((name, before, after, identical))
+    finally:
+        db.close()
+        loop.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmark the fast JSON path of /history and /achievements")
+    parser.add_argument("--rows", type=int, default=20000, help="seeded log rows")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=30, help="history page size (per log table)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="ecosense-bench-") as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ.setdefault("RESPONSE_CACHE", "0")
+        results = run(args.rows, args.iterations, args.limit)
+
+    print(f"   {'endpoint':<40} {'model µs':>10} {'fast µs':>10} {'saved':>8}   identical JSON")
+    ok = True
+    for name, before, after, identical in results:
+        print(f"   {name:<40} {before:>10.1f} {after:>10.1f} {1 - after / before:>8.0%}   "
+              f"{'yes' if identical else 'NO'}")
+        ok = ok and identical
+    if not ok:
+        print("\n⚠️  The fast path's JSON differs from the response model's")
+        return 1
+    print("\n✅ Same JSON from both paths")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
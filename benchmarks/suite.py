@@ -0,0 +1,395 @@
+"""Endpoint benchmark suite: latency percentiles, throughput and DB queries per request.
+
+Each data volume runs in its own subprocess with the app imported in-process (FastAPI
+TestClient, no network) against a throwaway SQLite database seeded with that many log
+rows. A seeded, weighted request mix then drives every route mounted in main.py and
+records per endpoint: requests/sec, p50/p95/p99 latency and SQL statements per request.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/suite.py --rows 10000,100000,1000000 --out benchmarks/baseline.json
+    python benchmarks/suite.py --rows 10000,100000 --compare benchmarks/baseline.json
+    python benchmarks/suite.py --rows 100000 --households 100   # rows spread over 100 households
+
+Compare mode exits 1 when an endpoint's p95 latency or throughput is worse than the
+baseline by more than --threshold, or when its queries per request grow by more than
+the threshold plus half a query.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPLIANCES = ["fan", "light", "ac", "tv", "fridge", "washer", "heater", "geyser"]
+ACTIVITIES = ["shower", "bath", "dishwash", "laundry", "gardening", "cooking", "flushing", "cleaning"]
+PRODUCTS = ["bleach", "ammonia", "detergent", "soap", "vinegar", "baking_soda", "lemon", "eco_cleaner"]
+FREQUENCIES = ["daily", "weekly", "monthly", "rarely"]
+
+# Share of the seeded rows per log table
+SEED_SPLIT = (("electricity", 0.5), ("water", 0.35), ("cleaning", 0.15))
+SEED_CHUNK = 20_000
+
+
+# ─────────────────────────────────────────────────
+# Request mix: (method, route path, weight, request builder)
+# Weights approximate the dashboard: mostly polling reads, a steady trickle of logs.
+# ─────────────────────────────────────────────────
+def _electricity_body(rng):
+    return {"appliance_type": rng.choice(APPLIANCES), "hours": rng.randint(1, 12),
+            "count": rng.randint(1, 4), "occupancy": round(rng.random(), 2), "tariff": rng.choice([5, 6, 8])}
+
+
+def _water_body(rng):
+    return {"activity": rng.choice(ACTIVITIES), "flow_rate": rng.randint(4, 15), "duration": rng.randint(2, 20),
+            "sessions": rng.randint(1, 3)}
+
+
+def _import_body(rng, rows=200):
+    """A meter dump: water readings backdated over the last 90 days."""
+    now = datetime.now(timezone.utc)
+    lines = ["activity,flow_rate,duration,sessions,created_at"]
+    for _ in range(rows):
+        b = _water_body(rng)
+        created = now - timedelta(days=rng.randint(0, 90), minutes=rng.randint(0, 1439))
+        lines.append(f"{b['activity']},{b['flow_rate']},{b['duration']},{b['sessions']},"
+                     f"{created.strftime('%Y-%m-%dT%H:%M:%S')}")
+    return "\n".join(lines) + "\n"
+
+
+def _history_params(rng):
+    params = {"limit": rng.choice([10, 30, 50])}
+    roll = rng.random()
+    if roll < 0.3:
+        params["category"] = rng.choice(["electricity", "water", "cleaning"])
+    elif roll < 0.45:
+        params["appliance_type"] = rng.choice(APPLIANCES)
+    return params
+
+
+MIX = [
+    ("GET", "/api/analysis/summary", 20, lambda rng: {}),
+    ("GET", "/api/analysis/history", 15, lambda rng: {"params": _history_params(rng)}),
+    ("GET", "/api/analysis/trends", 10, lambda rng: {"params": {"bucket": rng.choice(["day", "week", "month"])}}),
+    ("GET", "/api/achievements", 15, lambda rng: {}),
+    ("GET", "/api/analysis/export", 1, lambda rng: {"params": {
+        "table": rng.choice(["electricity", "water", "cleaning"]), "format": rng.choice(["csv", "ndjson"]),
+        "from": (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S")}}),
+    ("POST", "/api/electricity/calculate", 12, lambda rng: {"json": _electricity_body(rng)}),
+    ("POST", "/api/electricity/calculate/batch", 3,
+     lambda rng: {"json": [_electricity_body(rng) for _ in range(rng.randint(3, 12))]}),
+    ("POST", "/api/electricity/simulate", 2, lambda rng: {"json": {
+        "appliance_type": rng.choice(APPLIANCES), "hours": {"start": 1, "stop": 12, "step": 0.5},
+        "occupancy": {"start": 0, "stop": 1, "step": 0.1}}}),
+    ("POST", "/api/water/calculate", 10, lambda rng: {"json": _water_body(rng)}),
+    ("POST", "/api/water/simulate", 2, lambda rng: {"json": {
+        "activity": rng.choice(ACTIVITIES), "flow_rate": [6, 9, 12], "duration": {"start": 2, "stop": 20, "step": 1}}}),
+    ("POST", "/api/cleaning/analyze", 6, lambda rng: {"json": {
+        "product_type": rng.choice(PRODUCTS), "usage_frequency": rng.choice(FREQUENCIES), "rooms": rng.randint(1, 8)}}),
+    ("POST", "/api/import", 1, lambda rng: {"params": {"table": "water", "format": "csv"},
+                                            "content": _import_body(rng)}),
+    ("GET", "/api/stats", 1, lambda rng: {}),
+    ("GET", "/api/metrics", 1, lambda rng: {}),
+    ("GET", "/api/health", 2, lambda rng: {}),
+    ("GET", "/", 2, lambda rng: {}),
+]
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+# ─────────────────────────────────────────────────
+# Worker: one data volume, app imported in this process
+# ─────────────────────────────────────────────────
+def _templates(rng, n=256):
+    """Realistic derived-column values, computed by the routes' own engines."""
+    import cleaning
+    import electricity
+    import water
+    from schemas import CleaningRequest, ElectricityRequest, WaterRequest
+
+    def columns(log):
+        return {c.key: getattr(log, c.key) for c in log.__table__.columns
+                if c.key not in ("id", "household_id", "created_at")}
+
+    return {
+        "electricity": [columns(electricity._calculate(ElectricityRequest(**_electricity_body(rng)))[0])
+                        for _ in range(n)],
+        "water": [columns(water._calculate(WaterRequest(**_water_body(rng)))[0]) for _ in range(n)],
+        "cleaning": [columns(cleaning._analyze(CleaningRequest(
+            product_type=rng.choice(PRODUCTS), usage_frequency=rng.choice(FREQUENCIES),
+            rooms=rng.randint(1, 8)))[0]) for _ in range(n)],
+    }
+
+
+def household_ids(n: int) -> list:
+    from households import DEFAULT_HOUSEHOLD
+
+    return [DEFAULT_HOUSEHOLD] if n <= 1 else [f"hh-{i:05d}" for i in range(n)]
+
+
+def seed(rows: int, rng, households: list) -> dict:
+    from sqlalchemy import insert
+    from bootstrap import ensure_schema
+    from database import SessionLocal, engine
+    from models import CleaningLog, ElectricityLog, WaterLog
+    import rollups
+    import sketches
+    import streaks
+    import totals
+
+    models = {"electricity": ElectricityLog, "water": WaterLog, "cleaning": CleaningLog}
+    ensure_schema(mode="upgrade")  # tables, indexes and the badge definitions
+    templates = _templates(rng)
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    year = 365 * 24 * 3600
+
+    started = time.perf_counter()
+    for category, share in SEED_SPLIT:
+        table = models[category].__table__
+        pool = templates[category]
+        remaining = int(rows * share)
+        while remaining > 0:
+            n = min(SEED_CHUNK, remaining)
+            chunk = [dict(rng.choice(pool), household_id=rng.choice(households),
+                          created_at=now - timedelta(seconds=rng.randrange(year)))
+                     for _ in range(n)]
+            with engine.begin() as conn:
+                conn.execute(insert(table), chunk)
+            remaining -= n
+    inserted = time.perf_counter()
+
+    # Derived tables the write path would have maintained
+    db = SessionLocal()
+    try:
+        totals.rebuild(db)
+        rollups.backfill(db)
+        streaks.backfill(db)
+        sketches.rebuild(db)
+    finally:
+        db.close()
+    return {"insert_seconds": round(inserted - started, 2),
+            "derive_seconds": round(time.perf_counter() - inserted, 2)}
+
+
+class QueryCounter:
+    """Counts SQL statements on every engine (sync, read and async) while active."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        event.listen(Engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *_):
+        with self._lock:
+            self.count += 1
+
+    def take(self) -> int:
+        with self._lock:
+            n, self.count = self.count, 0
+        return n
+
+
+def run_worker(args) -> dict:
+    rng = random.Random(args.seed)
+    households = household_ids(args.households)
+    seeding = seed(args.worker_rows, rng, households)
+
+    from fastapi.routing import APIRoute
+    from fastapi.testclient import TestClient
+    import main
+
+    mounted = {(m, r.path) for r in main.app.routes if isinstance(r, APIRoute) for m in r.methods}
+    covered = {(m, p) for m, p, _, _ in MIX}
+    missing = sorted(mounted - covered)
+    if missing:
+        raise SystemExit(f"Routes missing from the benchmark mix: {missing}")
+
+    counter = QueryCounter()
+    counter.install()
+    weights = [w for _, _, w, _ in MIX]
+    samples = {f"{m} {p}": {"latency": [], "queries": []} for m, p, _, _ in MIX}
+    statuses = {}
+
+    with TestClient(main.app) as client:
+        for i in range(args.warmup + args.requests):
+            method, path, _, build = rng.choices(MIX, weights)[0]
+            kwargs = build(rng)
+            # Every request acts for one of the seeded households, as a real client would
+            kwargs["headers"] = {"X-Household-ID": rng.choice(households)}
+            counter.take()
+            t0 = time.perf_counter()
+            resp = client.request(method, path, **kwargs)
+            elapsed = time.perf_counter() - t0
+            queries = counter.take()
+            if resp.status_code >= 400:
+                statuses[f"{method} {path} {resp.status_code}"] = statuses.get(f"{method} {path} {resp.status_code}", 0) + 1
+            if i >= args.warmup:
+                samples[f"{method} {path}"]["latency"].append(elapsed)
+                samples[f"{method} {path}"]["queries"].append(queries)
+
+    endpoints = {}
+    total_time = 0.0
+    total_requests = 0
+    for key, s in samples.items():
+        lat = sorted(s["latency"])
+        if not lat:
+            continue
+        busy = sum(lat)
+        total_time += busy
+        total_requests += len(lat)
+        endpoints[key] = {
+            "requests": len(lat),
+            "rps": round(len(lat) / busy, 1),
+            "p50_ms": round(_percentile(lat, 50) * 1000, 3),
+            "p95_ms": round(_percentile(lat, 95) * 1000, 3),
+            "p99_ms": round(_percentile(lat, 99) * 1000, 3),
+            "queries_per_request": round(sum(s["queries"]) / len(lat), 2),
+            "max_queries": max(s["queries"]),
+        }
+    return {
+        "rows": args.worker_rows,
+        "households": len(households),
+        "seed": seeding,
+        "total_rps": round(total_requests / total_time, 1) if total_time else 0.0,
+        "errors": statuses,
+        "endpoints": endpoints,
+    }
+
+
+def spawn_worker(rows: int, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="ecosense-bench-") as tmp:
+        out = os.path.join(tmp, "result.json")
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            DB_ASYNC="1" if args.mode == "async" else "0",
+            ADMISSION_RATE="0", ADMISSION_MAX_IN_FLIGHT="0", ADMISSION_TARGET_MS="0",  # measure the routes, unthrottled
+        )
+        if args.no_cache:
+            env["RESPONSE_CACHE"] = "0"
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker-rows", str(rows), "--worker-out", out,
+               "--requests", str(args.requests), "--warmup", str(args.warmup), "--seed", str(args.seed),
+               "--households", str(args.households)]
+        subprocess.run(cmd, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(out, encoding="utf-8") as f:
+            return json.load(f)
+
+
+# ─────────────────────────────────────────────────
+# Reporting and baseline comparison
+# ─────────────────────────────────────────────────
+def print_volume(result: dict):
+    print(f"\n── {result['rows']:,} rows  (seed: insert {result['seed']['insert_seconds']}s, "
+          f"derive {result['seed']['derive_seconds']}s)  overall {result['total_rps']} req/s")
+    print(f"   {'endpoint':<40} {'n':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'q/req':>6}")
+    for key, e in sorted(result["endpoints"].items()):
+        print(f"   {key:<40} {e['requests']:>6} {e['rps']:>9} {e['p50_ms']:>9} {e['p95_ms']:>9} "
+              f"{e['p99_ms']:>9} {e['queries_per_request']:>6}")
+    for key, n in result["errors"].items():
+        print(f"   ⚠️  {n} × {key}")
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for rows, vol in current["volumes"].items():
+        base_vol = baseline.get("volumes", {}).get(rows)
+        if base_vol is None:
+            continue
+        for key, e in vol["endpoints"].items():
+            b = base_vol["endpoints"].get(key)
+            if b is None:
+                continue
+            if b["p95_ms"] > 0 and e["p95_ms"] > b["p95_ms"] * (1 + threshold):
+                regressions.append(f"{rows} rows  {key}: p95 {b['p95_ms']} → {e['p95_ms']} ms")
+            if e["rps"] < b["rps"] * (1 - threshold):
+                regressions.append(f"{rows} rows  {key}: {b['rps']} → {e['rps']} req/s")
+            # Averages move a little with the response-cache hit rate; a real N+1 moves them a lot
+            if e["queries_per_request"] > b["queries_per_request"] * (1 + threshold) + 0.5:
+                regressions.append(f"{rows} rows  {key}: queries/request "
+                                   f"{b['queries_per_request']} → {e['queries_per_request']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every EcoSense route in-process")
+    parser.add_argument("--rows", default="10000,100000,1000000", help="comma-separated seeded log row counts")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per volume")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--no-cache", action="store_true", help="disable the GET response cache")
+    parser.add_argument("--households", type=int, default=1, help="spread the seeded rows over this many households")
+    parser.add_argument("--out", help="write results to this JSON baseline file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument("--worker-rows", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-out", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker_rows is not None:
+        sys.path.insert(0, ROOT)
+        result = run_worker(args)
+        with open(args.worker_out, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "mode": args.mode,
+            "response_cache": not args.no_cache,
+            "households": args.households,
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "volumes": {},
+    }
+    for rows in (int(r) for r in args.rows.split(",")):
+        result = spawn_worker(rows, args)
+        report["volumes"][str(rows)] = result
+        print_volume(result)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️  {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for r in regressions:
+                print(f"   {r}")
+            return 1
+        print(f"\n✅ No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Throughput of the gunicorn serving mode from 1 to N workers.
+
+Starts `gunicorn -c gunicorn.conf.py main:app` with 1, 2, 4 ... N workers against a
+throwaway SQLite database seeded with --rows log rows, then drives each endpoint with
+--clients load-generator processes (one keep-alive connection each) for --seconds:
+
+  POST /api/electricity/calculate   validate + calculate + one log insert
+  GET  /api/analysis/summary        running-totals read (RESPONSE_CACHE=0: every request does the work)
+
+and reports requests/sec, the speedup over one worker and the scaling efficiency
+(speedup / workers). The load generator shares the machine: give it spare cores
+(--clients well under the core count minus N) or the curve flattens early. SQLite
+serializes the /calculate commits; point --database-url at MySQL / PostgreSQL to
+measure writes without that.
+
+    python benchmarks/worker_scaling.py --workers 1,2,4,8 --seconds 10
+    python benchmarks/worker_scaling.py --workers 1,4 --min-efficiency 0.7   # exit 1 below it
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = {
+    "POST /api/electricity/calculate": ("POST", "/api/electricity/calculate",
+                                        {"appliance_type": "ac", "hours": 3, "occupancy": 0.9}),
+    "GET /api/analysis/summary": ("GET", "/api/analysis/summary", None),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _client(port: int, endpoint: str, start_at: float, seconds: float, results):
+    method, path, body = ENDPOINTS[endpoint]
+    payload = json.dumps(body) if body else None
+    headers = {"Content-Type": "application/json"} if body else {}
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    ok = errors = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.close()
+    results.put((ok, errors))
+
+
+def _drive(port: int, endpoint: str, clients: int, seconds: float) -> tuple:
+    results = multiprocessing.Queue()
+    start_at = time.time() + 0.5
+    procs = [multiprocessing.Process(target=_client, args=(port, endpoint, start_at, seconds, results))
+             for _ in range(clients)]
+    for p in procs:
+        p.start()
+    totals = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return sum(t[0] for t in totals) / seconds, sum(t[1] for t in totals)
+
+
+def _serve(workers: int, env: dict) -> tuple:
+    port = _free_port()
+    env = dict(env, PORT=str(port), WEB_CONCURRENCY=str(workers))
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"], cwd=ROOT,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                break
+        except OSError:
+            time.sleep(0.2)
+    else:
+        proc.kill()
+        raise RuntimeError(f"gunicorn with {workers} workers did not come up")
+    return proc, port
+
+
+def run(counts, clients: int, seconds: float, env: dict) -> dict:
+    results = {}
+    for workers in counts:
+        proc, port = _serve(workers, env)
+        try:
+            for endpoint in ENDPOINTS:
+                _drive(port, endpoint, clients, min(1.0, seconds))  # warm up every worker
+                results[(endpoint, workers)] = _drive(port, endpoint, clients, seconds)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=60)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure throughput scaling over gunicorn worker counts")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=0, help="load-generator processes (default: 2 x max workers)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="measured seconds per endpoint and worker count")
+    parser.add_argument("--rows", type=int, default=20000, help="seeded log rows")
+    parser.add_argument("--database-url", help="use this database instead of a seeded throwaway SQLite file")
+    parser.add_argument("--min-efficiency", type=float, default=0.0,
+                        help="exit 1 if speedup / workers falls below this at the largest worker count")
+    args = parser.parse_args(argv)
+
+    counts = [int(n) for n in args.workers.split(",")]
+    clients = args.clients or 2 * max(counts)
+    print(f"   {os.cpu_count()} CPUs · {clients} client processes · {args.seconds:g}s per point")
+    with tempfile.TemporaryDirectory(prefix="ecosense-bench-") as tmp:
+        env = {k: v for k, v in os.environ.items() if k not in ("SHARED_STATE_PATH", "PROMETHEUS_MULTIPROC_DIR")}
+        env.update(RESPONSE_CACHE="0", RETENTION_DAYS="0", ADMISSION_RATE="0", ADMISSION_MAX_IN_FLIGHT="0",
+                   ADMISSION_TARGET_MS="0")
+        if args.database_url:
+            env["DATABASE_URL"] = args.database_url
+        else:
+            env["DATABASE_URL"] = os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            sys.path.insert(0, ROOT)
+            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+            import suite
+            from households import DEFAULT_HOUSEHOLD
+
+            suite.seed(args.rows, random.Random(42), [DEFAULT_HOUSEHOLD])
+        results = run(counts, clients, args.seconds, env)
+
+    ok = True
+    print(f"   {'endpoint':<34} {'workers':>7} {'req/s':>9} {'speedup':>8} {'efficiency':>10} {'errors':>7}")
+    for endpoint in ENDPOINTS:
+        base = results[(endpoint, counts[0])][0] / counts[0]
+        for workers in counts:
+            rps, errors = results[(endpoint, workers)]
+            speedup = rps / base if base else 0.0
+            efficiency = speedup / workers
+            print(f"   {endpoint:<34} {workers:>7} {rps:>9.0f} {speedup:>7.2f}x {efficiency:>10.0%} {errors:>7}")
+        top = results[(endpoint, counts[-1])][0] / base / counts[-1] if base else 0.0
+        ok = ok and top >= args.min_efficiency
+    if not ok:
+        print(f"\n⚠️  Scaling efficiency below {args.min_efficiency:.0%} at {counts[-1]} workers")
+        return 1
+    print("\n✅ Done")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""A burst of log writes with client timeouts and retries, with and without admission control.
+
+Starts a uvicorn server per mode against a throwaway SQLite database and has --clients
+households submit --submissions electricity logs each, all at once. A client gives up
+on a request after --timeout seconds and retries it, up to --attempts times: after a
+429 / 503 it waits for Retry-After, after a timeout or connection error for --backoff.
+
+  off  ADMISSION_RATE=0 ADMISSION_MAX_IN_FLIGHT=0 ADMISSION_TARGET_MS=0, no Idempotency-Key:
+       every request queues for the writer, and a timed-out request may still commit,
+       so its retry stores the log twice
+  on   the admission.py settings (ADMISSION_* from the environment, else the defaults),
+       each submission retried under one Idempotency-Key
+
+Every submission has distinct hours, so duplicates are the rows whose hours repeat.
+Reported per mode: submissions saved / abandoned, duplicate rows, the shed responses
+by status, and the time from first attempt to a saved response (p50 / p99).
+
+    python benchmarks/write_burst.py --clients 200 --submissions 5 --timeout 2
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {
+    "off": {"ADMISSION_RATE": "0", "ADMISSION_MAX_IN_FLIGHT": "0", "ADMISSION_TARGET_MS": "0"},
+    "on": {},
+}
+
+
+def start_server(mode: str, port: int, db_path: str) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", RETENTION_DAYS="0", **MODES[mode])
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {base} did not start")
+
+
+async def burst(base: str, mode: str, args) -> dict:
+    statuses = Counter()
+    latencies, abandoned = [], 0
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=args.timeout) as client:
+        async def submit(household: int, n: int):
+            nonlocal abandoned
+            body = {"appliance_type": "ac", "hours": 1 + (household * args.submissions + n) / 100000}
+            headers = {"X-Household-ID": f"burst-{household}"}
+            if mode == "on":
+                headers["Idempotency-Key"] = f"submission-{n}"
+            started = time.monotonic()
+            for _ in range(args.attempts):
+                try:
+                    r = await client.post("/api/electricity/calculate", json=body, headers=headers)
+                except httpx.TransportError as e:
+                    statuses["timeout" if isinstance(e, httpx.TimeoutException) else "connection error"] += 1
+                    await asyncio.sleep(args.backoff)
+                    continue
+                statuses[r.status_code] += 1
+                if r.status_code == 200:
+                    latencies.append(time.monotonic() - started)
+                    return
+                await asyncio.sleep(float(r.headers.get("retry-after", args.backoff)))
+            abandoned += 1
+
+        async def household(i: int):
+            for n in range(args.submissions):
+                await submit(i, n)
+
+        started = time.monotonic()
+        await asyncio.gather(*(household(i) for i in range(args.clients)))
+        elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        "saved": len(latencies),
+        "abandoned": abandoned,
+        "statuses": dict(statuses),
+        "p50_s": round(statistics.median(latencies), 3) if latencies else None,
+        "p99_s": round(latencies[int(len(latencies) * 0.99) - 1], 3) if latencies else None,
+        "seconds": round(elapsed, 2),
+    }
+
+
+def duplicates(db_path: str) -> int:
+    with sqlite3.connect(db_path) as conn:
+        rows, distinct = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT hours_per_day) FROM electricity_logs").fetchone()
+    return rows - distinct
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200, help="households submitting at once")
+    parser.add_argument("--submissions", type=int, default=5, help="logs per household, one after another")
+    parser.add_argument("--timeout", type=float, default=2.0, help="client timeout per attempt (seconds)")
+    parser.add_argument("--attempts", type=int, default=5, help="attempts per submission before giving up")
+    parser.add_argument("--backoff", type=float, default=0.5, help="wait after a timeout (seconds)")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in MODES:
+        with tempfile.TemporaryDirectory(prefix="ecosense-bench-") as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            proc = start_server(mode, args.port, db_path)
+            base = f"http://127.0.0.1:{args.port}"
+            try:
+                await wait_ready(base)
+                results[mode] = await burst(base, mode, args)
+            finally:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=30)
+                except subprocess.TimeoutExpired:  # still draining abandoned requests
+                    proc.kill()
+                    proc.wait()
+            results[mode]["duplicate_rows"] = duplicates(db_path)
+        print(f"{mode:>4}  {results[mode]}", flush=True)
+
+    total = args.clients * args.submissions
+    print(f"\n{'mode':>4} {'saved':>7} {'abandoned':>9} {'dup rows':>8} {'p50 s':>7} {'p99 s':>7} {'seconds':>8}")
+    for mode, r in results.items():
+        print(f"{mode:>4} {r['saved']:>4}/{total:<3} {r['abandoned']:>8} {r['duplicate_rows']:>8} "
+              f"{r['p50_s'] or 0:>7.3f} {r['p99_s'] or 0:>7.3f} {r['seconds']:>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
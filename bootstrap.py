@@ -0,0 +1,330 @@
+"""Versioned schema bootstrap: bring the database up to models.py and seed the badge list.
+
+The one-row `schema_version` table records the SCHEMA_VERSION the database was last
+brought to, so on a current database startup costs one primary-key SELECT instead of
+create_all's per-table round trips. Otherwise (a new database, one from before this
+table, or an older version) the schema is reconciled with the models, then stamped:
+
+  * missing tables are created, with their indexes;
+  * a missing column with a server default (or a nullable one) is added in place, so
+    existing log rows land in the "default" household;
+  * a table whose primary or unique key changed, or that lacks a NOT NULL column without
+    a default, is recreated and its rows copied across (aggregate tables only: the raw
+    log tables are too large for that and need a hand-written migration);
+  * missing indexes are created and superseded `ix_<table>_*` indexes dropped;
+  * on a database that already held logs, the derived tables (totals, rollups, streaks,
+    sketches, baselines and anomalies) that were created or changed are recomputed from the raw logs and archives,
+    all of them if a log table changed;
+  * on SQLite, timestamps stored with fractional seconds (before models.Timestamp bound
+    whole seconds) are cut to whole seconds, so they compare like the rest;
+  * the Achievement definitions are upserted from ACHIEVEMENTS with portable
+    SELECT / UPDATE / INSERT statements (is_active is left as the operator set it).
+
+Bump SCHEMA_VERSION whenever models.py or ACHIEVEMENTS change.
+
+The app runs this from its lifespan hook (SCHEMA_BOOTSTRAP=upgrade, the default); with
+several workers, upgrade once before starting them and let each only check the version:
+    python bootstrap.py upgrade          # e.g. a release step
+    SCHEMA_BOOTSTRAP=check               # workers refuse to start on an outdated schema
+    python bootstrap.py status
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import MetaData, Table, bindparam, func, inspect, insert, select, text, update
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+from database import Base, engine
+from households import DEFAULT_HOUSEHOLD
+from models import (
+    Achievement, ActivityStreak, AnalysisTotals, CleaningLog, ElectricityLog, SchemaVersion, Timestamp, UsageAnomaly,
+    UsageBaseline, UsageRollup, UsageSketch, WaterLog,
+)
+
+SCHEMA_VERSION = 6
+SCHEMA_BOOTSTRAP = os.getenv("SCHEMA_BOOTSTRAP", "upgrade").lower()  # upgrade | check | off
+# How long a worker that lost an upgrade race waits for the winner to stamp the version
+SCHEMA_WAIT_SECONDS = float(os.getenv("SCHEMA_WAIT_SECONDS", "30"))
+
+# (badge_key, title, description, icon, category, threshold_value); init_db.sql seeds the same list
+ACHIEVEMENTS = [
+    ("first_calc", "First Step", "Completed your first energy calculation", "🌱", "general", 1),
+    ("eco_warrior", "Eco Warrior", "Calculated electricity 10 times", "⚡", "electricity", 10),
+    ("water_keeper", "Water Keeper", "Analyzed water usage 10 times", "💧", "water", 10),
+    ("clean_green", "Clean & Green", "Analyzed eco-cleaning 5 times", "🧹", "cleaning", 5),
+    ("efficiency_pro", "Efficiency Pro", 'Achieved "Efficient" rating 5 times in electricity', "🏆",
+     "electricity", 5),
+    ("water_saver", "Water Saver", 'Achieved "Good" rating 5 times in water usage', "💦", "water", 5),
+    ("carbon_fighter", "Carbon Fighter", "Logged total carbon footprint over 100 kg CO₂ tracked", "🌍",
+     "electricity", 100),
+    ("data_analyst", "Data Analyst", "Used the Analysis page (10+ records in history)", "📊", "general", 10),
+    ("consistent_user", "Consistent User", "Logged activity 7 days in a row", "📅", "general", 7),
+    ("green_home", "Green Home", "Used all three analyzers (electricity, water, cleaning)", "🏡", "general", 3),
+]
+_DEFINITION_FIELDS = ("title", "description", "icon", "category", "threshold_value")
+
+# Values for NOT NULL columns without a default when copying rows into a recreated table
+_FILL = {"household_id": DEFAULT_HOUSEHOLD}
+_RAW_TABLES = {m.__tablename__ for m in (ElectricityLog, WaterLog, CleaningLog)}
+# Recomputed from the raw logs in this order (streaks read the day rollups)
+_DERIVED_TABLES = [m.__tablename__ for m in (AnalysisTotals, UsageRollup, ActivityStreak, UsageSketch, UsageBaseline,
+                                              UsageAnomaly)]
+
+_status = {"version": None, "upgraded": False, "steps": [], "seconds": None}
+
+
+class SchemaError(RuntimeError):
+    pass
+
+
+def current_version(bind=engine) -> Optional[int]:
+    """The stamped schema version, or None for a database without the schema_version table."""
+    with bind.connect() as conn:
+        try:
+            return conn.execute(select(SchemaVersion.version).where(SchemaVersion.id == 1)).scalar()
+        except (OperationalError, ProgrammingError):
+            return None
+
+
+def _key_changed(inspector, table) -> bool:
+    pk = tuple(inspector.get_pk_constraint(table.name)["constrained_columns"])
+    if sorted(pk) != sorted(c.name for c in table.primary_key.columns):
+        return True
+    reflected = {tuple(uc["column_names"]) for uc in inspector.get_unique_constraints(table.name)}
+    declared = {tuple(c.name for c in uc.columns) for uc in table.constraints
+                if uc.__visit_name__ == "unique_constraint"}
+    return reflected != declared
+
+
+def _fill_value(column):
+    if column.name in _FILL:
+        return _FILL[column.name]
+    if column.default is not None and column.default.is_scalar:
+        return column.default.arg
+    raise SchemaError(f"{column.table.name}.{column.name}: no value for existing rows")
+
+
+def _copy_rebuild(conn, table, existing_columns: set):
+    """Recreate `table` from the models and copy its rows across."""
+    if table.name in _RAW_TABLES:
+        raise SchemaError(f"{table.name}: key or column change needs a hand-written migration")
+    old = Table(table.name, MetaData(), autoload_with=conn)
+    rows = [row._asdict() for row in conn.execute(select(old))]
+    old.drop(conn)
+    table.create(conn)
+    if rows:
+        keep = [c for c in table.columns if c.name in existing_columns]
+        fill = {c.name: _fill_value(c) for c in table.columns
+                if c.name not in existing_columns and not c.nullable and c.server_default is None}
+        conn.execute(insert(table), [dict({c.name: row[c.name] for c in keep}, **fill) for row in rows])
+    return len(rows)
+
+
+def _add_column(conn, table, column):
+    if not column.nullable and column.server_default is None:
+        raise SchemaError(f"{table.name}.{column.name}: NOT NULL without a server default")
+    spec = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {conn.dialect.identifier_preparer.format_table(table)} ADD COLUMN {spec}"))
+
+
+def _drop_index(conn, table, name: str):
+    preparer = conn.dialect.identifier_preparer
+    on = f" ON {preparer.format_table(table)}" if conn.dialect.name == "mysql" else ""
+    conn.execute(text(f"DROP INDEX {preparer.quote(name)}{on}"))
+
+
+def _reconcile(conn) -> Tuple[List[str], Set[str]]:
+    """Apply the missing DDL; returns what was done and the derived tables to recompute
+    from the existing logs."""
+    steps, touched = [], set()
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            table.create(conn)
+            steps.append(f"created {table.name}")
+            touched.add(table.name)
+            continue
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        missing = [c for c in table.columns if c.name not in columns]
+        needs_copy = _key_changed(inspector, table) or any(
+            not c.nullable and c.server_default is None for c in missing)
+        if needs_copy:
+            steps.append(f"recreated {table.name} ({_copy_rebuild(conn, table, columns)} rows copied)")
+            touched.add(table.name)
+            continue
+        for column in missing:
+            _add_column(conn, table, column)
+            steps.append(f"added {table.name}.{column.name}")
+            touched.add(table.name)
+
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        reflected = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        declared = {ix.name for ix in table.indexes}
+        for name in sorted(reflected - declared):
+            if name.startswith(f"ix_{table.name}_"):
+                _drop_index(conn, table, name)
+                steps.append(f"dropped index {name}")
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name not in reflected:
+                index.create(conn)
+                steps.append(f"created index {index.name}")
+    # Index changes and unrelated new tables leave the derived rows as they are; a changed
+    # log table invalidates all of them
+    if not existing & _RAW_TABLES:
+        return steps, set()
+    return steps, set(_DERIVED_TABLES) if touched & _RAW_TABLES else touched & set(_DERIVED_TABLES)
+
+
+def _whole_seconds(conn) -> List[str]:
+    """SQLite: cut timestamps written with fractional seconds to the whole seconds Timestamp binds."""
+    if conn.dialect.name != "sqlite":
+        return []
+    cut = 0
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            if column.type is Timestamp:
+                cut += conn.execute(
+                    update(table).where(func.length(column) > 19).values({column: func.substr(column, 1, 19)})
+                ).rowcount
+    return [f"cut {cut} timestamps to whole seconds"] if cut else []
+
+
+def _recompute_derived(bind, tables: Set[str]) -> List[str]:
+    import anomalies
+    import rollups
+    import sketches
+    import streaks
+    import totals
+
+    rebuilds = {
+        AnalysisTotals.__tablename__: lambda db: f"totals ({len(totals.rebuild(db))} households)",
+        UsageRollup.__tablename__: lambda db: f"rollups ({rollups.backfill(db)} rows)",
+        ActivityStreak.__tablename__: lambda db: f"streaks ({streaks.backfill(db)} households)",
+        UsageSketch.__tablename__: lambda db: f"sketches ({len(sketches.rebuild(db))} items)",
+        UsageBaseline.__tablename__: lambda db: "baselines ({} rows, {} anomalies)".format(*anomalies.rebuild(db)),
+    }
+    # One replay rebuilds both the baselines and the anomaly feed
+    if UsageAnomaly.__tablename__ in tables:
+        tables = tables | {UsageBaseline.__tablename__}
+    db = Session(bind=bind)
+    try:
+        done = [rebuilds[name](db) for name in _DERIVED_TABLES if name in rebuilds and name in tables]
+    finally:
+        db.close()
+    return [f"recomputed {', '.join(done)}"]
+
+
+def seed_achievements(conn) -> List[str]:
+    """Insert missing badge definitions and update changed ones (dialect-neutral)."""
+    t = Achievement.__table__
+    columns = [t.c.badge_key] + [t.c[f] for f in _DEFINITION_FIELDS]
+    current = {row.badge_key: row for row in conn.execute(select(*columns))}
+    inserts, updates = [], []
+    for badge_key, *values in ACHIEVEMENTS:
+        definition = dict(zip(_DEFINITION_FIELDS, values))
+        row = current.get(badge_key)
+        if row is None:
+            inserts.append(dict(badge_key=badge_key, is_active=True, **definition))
+        elif any(getattr(row, field) != value for field, value in definition.items()):
+            updates.append(dict(key=badge_key, **{f"new_{f}": v for f, v in definition.items()}))
+    if inserts:
+        conn.execute(insert(t), inserts)
+    if updates:
+        conn.execute(
+            update(t).where(t.c.badge_key == bindparam("key"))
+            .values({f: bindparam(f"new_{f}") for f in _DEFINITION_FIELDS}),
+            updates,
+        )
+    steps = []
+    if inserts:
+        steps.append(f"seeded {len(inserts)} achievements")
+    if updates:
+        steps.append(f"updated {len(updates)} achievements")
+    return steps
+
+
+def _stamp(conn):
+    t = SchemaVersion.__table__
+    values = dict(version=SCHEMA_VERSION, applied_at=func.now())
+    if conn.execute(update(t).where(t.c.id == 1).values(values)).rowcount == 0:
+        conn.execute(insert(t).values(id=1, **values))
+
+
+def upgrade(bind=engine) -> List[str]:
+    """Reconcile the schema, recompute derived tables if it changed, upsert the badges, stamp."""
+    with bind.begin() as conn:
+        steps, stale = _reconcile(conn)
+        steps += _whole_seconds(conn)
+    if stale:
+        steps += _recompute_derived(bind, stale)
+    with bind.begin() as conn:
+        steps += seed_achievements(conn)
+        _stamp(conn)
+    return steps
+
+
+def _wait_for_version(bind, deadline: float) -> bool:
+    while time.monotonic() < deadline:
+        if current_version(bind) == SCHEMA_VERSION:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def ensure_schema(bind=engine, mode: str = SCHEMA_BOOTSTRAP) -> Dict:
+    """Make sure the database is at SCHEMA_VERSION (one query when it already is)."""
+    started = time.perf_counter()
+    steps = []
+    if mode != "off":
+        version = current_version(bind)
+        if version is not None and version > SCHEMA_VERSION:
+            raise SchemaError(f"database schema is v{version}, newer than this code's v{SCHEMA_VERSION}")
+        if version != SCHEMA_VERSION:
+            if mode == "check":
+                raise SchemaError(f"database schema is {f'v{version}' if version else 'unversioned'}, "
+                                  f"expected v{SCHEMA_VERSION}: run `python bootstrap.py upgrade`")
+            try:
+                steps = upgrade(bind)
+            except Exception:
+                # Several workers booting on an outdated database: the one that lost the race
+                # (duplicate table / key) waits for the winner instead of failing
+                if not _wait_for_version(bind, time.monotonic() + SCHEMA_WAIT_SECONDS):
+                    raise
+                steps = ["upgraded by another process"]
+    _status.update(version=SCHEMA_VERSION if mode != "off" else None, upgraded=bool(steps), steps=steps,
+                   seconds=round(time.perf_counter() - started, 4))
+    return dict(_status)
+
+
+def stats() -> Dict:
+    return dict(_status, mode=SCHEMA_BOOTSTRAP, code_version=SCHEMA_VERSION)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create or upgrade the EcoSense database schema")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        version = current_version()
+        if version == SCHEMA_VERSION:
+            print(f"✅ Schema is current (v{version})")
+            return 0
+        print(f"⚠️  Schema is {f'v{version}' if version else 'unversioned'}, this code expects v{SCHEMA_VERSION}")
+        return 1
+
+    report = ensure_schema(mode="upgrade")
+    for step in report["steps"]:
+        print(f"   {step}")
+    print(f"✅ Schema v{report['version']} ready in {report['seconds'] * 1000:.0f} ms"
+          + ("" if report["upgraded"] else " (already current)"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
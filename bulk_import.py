@@ -0,0 +1,376 @@
+"""Bulk import of smart-meter / water-meter dumps into the log tables.
+
+Each row carries the same fields as the matching /calculate or /analyze request, plus an
+optional `created_at` (ISO 8601, naive times are UTC) so backdated readings land on the
+right day in trends and badges; rows without one are stamped with the import time.
+Rows belong to the caller's household (see households.py; `--household` on the CLI).
+CSV needs a header row, NDJSON is one JSON object per line:
+
+    curl -X POST 'http://localhost:8000/api/import?table=electricity&format=csv' \\
+         -H 'Content-Type: text/csv' --data-binary @meter.csv
+
+    python bulk_import.py water readings.ndjson
+
+The upload is consumed as a stream, IMPORT_CHUNK_ROWS rows at a time: the rows are
+validated, their derived fields (monthly_kwh, carbon_kg, ratio, comparison_rating, ...)
+computed column-wise by the calculation engine, and the chunk is written with one
+multi-row INSERT plus its totals and rollup updates in its own transaction. Memory and
+transaction size stay bounded whatever the file size. Rows without a tariff / water_rate
+are billed on their own, by their region's schedule in force on their day (tariffs.py).
+
+Invalid rows are skipped and counted; the first IMPORT_MAX_ERRORS are reported with their
+row number. If a chunk fails to commit the import stops there — every earlier chunk stays
+committed, and `skip=<rows already read>` resumes after them. Running imports show up in
+/api/stats.
+"""
+import argparse
+import codecs
+import csv
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Iterator, List, Literal, Optional, Tuple
+import anyio
+import anyio.from_thread
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+import anomalies  # noqa: F401 — registers the baseline / anomaly handler
+import cleaning
+import electricity
+import rollups  # noqa: F401 — registers the rollup handler (needed by the CLI)
+import streaks  # noqa: F401 — registers the streak handler
+import tariffs
+import totals  # noqa: F401 — registers the running-totals handler
+import water
+from calculations import WATTAGE
+from database import SessionLocal
+from households import DEFAULT_HOUSEHOLD, current_household
+from log_hooks import LogBatch, dispatch_bulk
+from models import CleaningLog, ElectricityLog, WaterLog
+from query_budget import UNBOUNDED, declare_budgets
+from schemas import BatchItemError, CleaningRequest, ElectricityRequest, ImportReport, WaterRequest
+from shared_state import SharedStats
+
+logger = logging.getLogger("ecosense.bulk_import")
+
+router = APIRouter()
+async_router = APIRouter()  # same routes on the AsyncEngine, mounted when DB_ASYNC=1
+
+QUERY_BUDGETS = declare_budgets(router, async_router, {
+    ("POST", ""): UNBOUNDED,  # one INSERT + derived-table updates per chunk
+})
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "2000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+
+# table -> (request schema, log model, builder of log rows from validated requests)
+IMPORT_TABLES = {
+    "electricity": (ElectricityRequest, ElectricityLog, lambda reqs, days: electricity.build_logs(reqs, days=days)[0]),
+    "water": (WaterRequest, WaterLog, lambda reqs, days: water.build_logs(reqs, days=days)),
+    "cleaning": (CleaningRequest, CleaningLog, lambda reqs, days: cleaning.build_logs(reqs)),
+}
+
+
+class ImportAborted(Exception):
+    """The import stopped early; `report` covers the chunks committed before it."""
+
+    def __init__(self, report: ImportReport, status_code: int):
+        super().__init__(report.error)
+        self.report = report
+        self.status_code = status_code
+
+
+# ─────────────────────────────────────────────────
+# Parsing
+# ─────────────────────────────────────────────────
+def _records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """(row number, dict or parse error) per data row; row numbers start at 1 after the header."""
+    if fmt == "csv":
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [h.strip() for h in header]
+        for n, values in enumerate(reader, 1):
+            if not values:
+                continue
+            if len(values) > len(header):
+                yield n, ValueError(f"{len(values)} fields, header has {len(header)}")
+                continue
+            # Empty cells fall back to the request defaults
+            yield n, {k: v.strip() for k, v in zip(header, values) if v.strip()}
+        return
+    n = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        n += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield n, ValueError(f"invalid JSON: {e}")
+            continue
+        yield n, record if isinstance(record, dict) else ValueError("expected a JSON object")
+
+
+def _created_at(value) -> datetime:
+    if not isinstance(value, str):
+        raise ValueError("created_at: expected an ISO 8601 string")
+    try:
+        created = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"created_at: invalid datetime {value!r}")
+    if created.tzinfo is not None:
+        created = created.astimezone(timezone.utc).replace(tzinfo=None)
+    return created  # naive UTC, like CURRENT_TIMESTAMP
+
+
+def _validate(table: str, record) -> Tuple[BaseModel, Optional[datetime]]:
+    """Request model and created_at for one record; raises ValueError with a client-facing message."""
+    if isinstance(record, Exception):
+        raise record
+    request_model = IMPORT_TABLES[table][0]
+    created = _created_at(record["created_at"]) if record.get("created_at") is not None else None
+    try:
+        req = request_model.model_validate(record)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+        ))
+    if table == "electricity" and req.appliance_type not in WATTAGE:
+        raise ValueError(f"Unknown appliance type: {req.appliance_type}")
+    if table in tariffs.KINDS:
+        tariffs.store.book.schedule(table, req.region)  # TariffError (a ValueError) for an unknown region
+    return req, created
+
+
+# ─────────────────────────────────────────────────
+# Writing
+# ─────────────────────────────────────────────────
+def _write_chunk(session_factory, table: str, reqs: list, created: List[Optional[datetime]],
+                 household: str = DEFAULT_HOUSEHOLD) -> int:
+    """Insert one chunk with its derived-table updates in a single transaction."""
+    _, model, build = IMPORT_TABLES[table]
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    logs = build(reqs, [(ts or now).date() for ts in created])
+    for log, ts in zip(logs, created):
+        log.household_id = household
+        log.created_at = ts or now
+    columns = [c.name for c in model.__table__.columns if c.name != "id"]
+
+    db = session_factory()
+    try:
+        # Core executemany: no per-row RETURNING. The flush hook never sees these rows,
+        # so run the totals / rollup handlers on the same transaction explicitly.
+        db.connection().execute(insert(model.__table__), [{k: getattr(log, k) for k in columns} for log in logs])
+        batch = LogBatch([], [], [])
+        getattr(batch, table).extend(logs)
+        dispatch_bulk(db, batch)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return len(logs)
+
+
+# Imports in progress, for /api/stats
+_lock = threading.Lock()
+_running: dict = {}  # this worker's
+_totals = SharedStats("imports", {"imports": "count", "rows_imported": "count", "rows_rejected": "count",
+                                  "aborted": "count"})
+
+
+def stats() -> dict:
+    s = _totals.snapshot()
+    with _lock:
+        s["running"] = [r.model_dump(exclude={"errors"}) for r in _running.values()]
+    return s
+
+
+def run_import(lines: Iterable[str], table: str, fmt: str = "csv", skip: int = 0,
+               chunk_rows: int = IMPORT_CHUNK_ROWS, session_factory=SessionLocal,
+               progress: Optional[Callable[[ImportReport], None]] = None,
+               household: str = DEFAULT_HOUSEHOLD) -> ImportReport:
+    """Import every row of `lines` into `table` for `household`, one transaction per chunk.
+
+    Raises ImportAborted (carrying the partial report) when the upload can't be parsed
+    or a chunk fails to commit.
+    """
+    if table not in IMPORT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    started = time.perf_counter()
+    report = ImportReport(table=table, rows_read=0, imported=0, rejected=0, chunks=0, seconds=0.0, errors=[])
+    reqs: list = []
+    created: list = []
+    errors: List[BatchItemError] = []
+    consumed = 0  # rows read since the last commit
+
+    def commit_chunk():
+        nonlocal consumed
+        if consumed == 0:
+            return
+        if reqs:
+            _write_chunk(session_factory, table, reqs, created, household)
+        with _lock:
+            report.rows_read += consumed
+            report.imported += len(reqs)
+            report.rejected += len(errors)
+            report.chunks += 1
+            room = IMPORT_MAX_ERRORS - len(report.errors)
+            report.errors.extend(errors[:room])
+            report.errors_truncated = report.errors_truncated or len(errors) > room
+            report.seconds = round(time.perf_counter() - started, 3)
+        reqs.clear()
+        created.clear()
+        errors.clear()
+        consumed = 0
+        if progress is not None:
+            progress(report)
+
+    key = object()
+    with _lock:
+        _running[key] = report
+    try:
+        try:
+            for n, record in _records(lines, fmt):
+                if n <= skip:
+                    continue
+                consumed += 1
+                try:
+                    req, ts = _validate(table, record)
+                except ValueError as e:
+                    errors.append(BatchItemError(index=n, detail=str(e)))
+                else:
+                    reqs.append(req)
+                    created.append(ts)
+                if consumed >= chunk_rows:
+                    commit_chunk()
+        except (UnicodeDecodeError, csv.Error) as e:
+            report.error = f"Unreadable upload after row {skip + report.rows_read}: {e}"
+            raise ImportAborted(report, 400)
+        commit_chunk()
+    except ImportAborted:
+        _finish(key, report, started, aborted=True)
+        raise
+    except Exception as e:
+        logger.exception("bulk import into %s failed after %d rows", table, report.rows_read)
+        report.error = (f"Chunk after row {skip + report.rows_read} failed to commit ({type(e).__name__}); "
+                        f"rerun with skip={skip + report.rows_read} to resume")
+        _finish(key, report, started, aborted=True)
+        raise ImportAborted(report, 500) from e
+    _finish(key, report, started)
+    return report
+
+
+def _finish(key, report: ImportReport, started: float, aborted: bool = False):
+    report.seconds = round(time.perf_counter() - started, 3)
+    with _lock:
+        _running.pop(key, None)
+    _totals.record(imports=1, rows_imported=report.imported, rows_rejected=report.rejected, aborted=aborted)
+    logger.info("bulk import into %s: %d rows read, %d imported, %d rejected in %.1fs%s", report.table,
+                report.rows_read, report.imported, report.rejected, report.seconds,
+                f" — {report.error}" if report.error else "")
+
+
+# ─────────────────────────────────────────────────
+# HTTP
+# ─────────────────────────────────────────────────
+def _body_lines(request: Request) -> Iterator[str]:
+    """Lines of the request body, pulled from the event loop one chunk at a time.
+
+    Runs in the import's worker thread, so only the current chunk and a partial line
+    are ever held in memory.
+    """
+    chunks = request.stream()
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while True:
+        try:
+            data = anyio.from_thread.run(chunks.__anext__)
+        except StopAsyncIteration:
+            break
+        pending += decoder.decode(data)
+        lines = pending.splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        yield from lines
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+# Not a threadpool def: the body is streamed on the event loop while the parsing and
+# writing run in a worker thread, the same on both routers
+@router.post("", response_model=ImportReport)
+@async_router.post("", response_model=ImportReport)
+async def import_logs(
+    request: Request,
+    table: Literal["electricity", "water", "cleaning"] = Query(...),
+    format: Literal["csv", "ndjson"] = "csv",
+    skip: int = Query(0, ge=0, description="Data rows to skip, to resume an aborted import"),
+    household: str = Depends(current_household),
+):
+    work = functools.partial(run_import, _body_lines(request), table, format, skip, household=household)
+    try:
+        return await anyio.to_thread.run_sync(work)
+    except ImportAborted as e:
+        return JSONResponse(e.report.model_dump(), status_code=e.status_code)
+
+
+# ─────────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────────
+def main(argv=None):
+    from bootstrap import ensure_schema
+
+    parser = argparse.ArgumentParser(description="Bulk import a meter dump (CSV or NDJSON) into EcoSense")
+    parser.add_argument("table", choices=sorted(IMPORT_TABLES))
+    parser.add_argument("path", help="file to import, - for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"],
+                        help="default: from the file extension (.ndjson/.jsonl), else csv")
+    parser.add_argument("--skip", type=int, default=0, help="data rows to skip, to resume an aborted import")
+    parser.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS)
+    parser.add_argument("--household", default=DEFAULT_HOUSEHOLD, help="household the rows belong to")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    ensure_schema()
+    from sketches import store as sketches
+
+    def progress(report: ImportReport):
+        print(f"   … {report.rows_read:,} rows · {report.imported:,} imported · {report.rejected:,} rejected",
+              flush=True)
+
+    f = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    try:
+        report = run_import(f, args.table, fmt, skip=args.skip, chunk_rows=args.chunk_rows, progress=progress,
+                            household=args.household)
+    except ImportAborted as e:
+        report = e.report
+        print(f"⚠️  Import stopped: {report.error}")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+        sketches.flush()  # the imported chunks' values, for the running app's next reload
+
+    for err in report.errors:
+        print(f"   row {err.index}: {err.detail}")
+    if report.errors_truncated:
+        print(f"   … only the first {IMPORT_MAX_ERRORS} bad rows are listed")
+    if report.error:
+        return 1
+    print(f"✅ Imported {report.imported:,} of {report.rows_read:,} rows into {args.table} "
+          f"({report.rejected:,} rejected) in {report.seconds}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Pure calculation engine shared by the /calculate, /calculate/batch and /simulate routes.
+
+Every formula is plain arithmetic, so the same function works on Python floats (one
+request) and on NumPy arrays (a batch or a whole parameter grid) without a loop.
+Nothing here touches the database.
+"""
+import numpy as np
+
+CARBON_FACTOR = 0.85  # Indian grid average, kg CO2/kWh; the routes use their region's (tariffs.py)
+DEFAULT_WATER_BENCHMARK = 50
+
+# Appliance wattage map
+WATTAGE = {
+    "fan": 75,
+    "light": 10,
+    "ac": 1500,
+    "tv": 100,
+    "fridge": 150,
+    "washer": 500,
+    "heater": 2000,
+    "geyser": 3000,
+}
+
+# Benchmark liters per session (based on Indian averages)
+BENCHMARKS = {
+    "shower":    60,
+    "bath":      20,
+    "dishwash":  35,
+    "laundry":   70,
+    "gardening": 150,
+    "cooking":   8,
+    "flushing":  9,
+    "cleaning":  50,
+}
+
+
+def kwh_per_month(watts, hours, days_per_week, count):
+    return (watts * hours * ((days_per_week / 7) * 30) * count) / 1000
+
+
+def electricity_metrics(watts, hours, days_per_week, count, occupancy, tariff, carbon_factor=CARBON_FACTOR) -> dict:
+    kwh = kwh_per_month(watts, hours, days_per_week, count)
+    return {
+        "monthly_kwh": kwh,
+        "wasted_kwh": kwh * (1 - occupancy),
+        "monthly_cost": kwh * tariff,
+        "carbon_kg": kwh * carbon_factor,
+        "waste_percentage": (1 - occupancy) * 100,
+    }
+
+
+def efficiency_label(waste_percentage: float) -> str:
+    if waste_percentage < 20:
+        return "Efficient"
+    elif waste_percentage < 50:
+        return "Moderate"
+    return "Wasteful"
+
+
+def efficiency_labels(waste_percentage: np.ndarray) -> np.ndarray:
+    return np.where(waste_percentage < 20, "Efficient",
+                    np.where(waste_percentage < 50, "Moderate", "Wasteful"))
+
+
+def liters_per_month(flow_rate, duration, sessions, days_per_week):
+    return flow_rate * duration * sessions * ((days_per_week / 7) * 30)
+
+
+def water_metrics(flow_rate, duration, sessions, days_per_week, water_rate, benchmark) -> dict:
+    daily_liters = flow_rate * duration * sessions
+    monthly_liters = liters_per_month(flow_rate, duration, sessions, days_per_week)
+    benchmark_per_day = benchmark * sessions  # benchmarks and sessions are always positive
+    return {
+        "daily_liters": daily_liters,
+        "monthly_liters": monthly_liters,
+        "monthly_cost": (monthly_liters / 1000) * water_rate,
+        "benchmark_per_day": benchmark_per_day,
+        "ratio": daily_liters / benchmark_per_day,
+    }
+
+
+def water_rating(ratio: float) -> str:
+    if ratio < 1.2:
+        return "Good"
+    elif ratio < 1.8:
+        return "Average"
+    return "High"
+
+
+def water_ratings(ratio: np.ndarray) -> np.ndarray:
+    return np.where(ratio < 1.2, "Good", np.where(ratio < 1.8, "Average", "High"))
+
+
+MAX_SIMULATION_POINTS = 100_000
+
+
+def sweep_values(name: str, spec, lo: float, hi: float, integer: bool = False) -> np.ndarray:
+    """Expand a sweep spec (scalar, explicit list, or {start, stop, step}) into values within [lo, hi].
+
+    Raises ValueError with a client-facing message when the sweep is empty, too large or out of range.
+    """
+    if isinstance(spec, dict):
+        start, stop, step = spec["start"], spec["stop"], spec["step"]
+        if stop < start:
+            raise ValueError(f"{name}: stop must be >= start")
+        n = int(np.floor((stop - start) / step + 1e-9)) + 1
+        if n > MAX_SIMULATION_POINTS:
+            raise ValueError(f"{name}: sweep has {n} values, max {MAX_SIMULATION_POINTS}")
+        values = start + step * np.arange(n, dtype=float)
+    else:
+        values = np.atleast_1d(np.asarray(spec, dtype=float))
+    if values.size == 0:
+        raise ValueError(f"{name}: no values to sweep")
+    if values.min() < lo or values.max() > hi:
+        raise ValueError(f"{name}: values must be between {lo} and {hi}")
+    if integer and not np.array_equal(values, np.round(values)):
+        raise ValueError(f"{name}: values must be whole numbers")
+    return values
+
+
+def expand_grid(axes: dict) -> dict:
+    """Cartesian product of the axis values, flattened to equal-length columns."""
+    points = 1
+    for values in axes.values():
+        points *= values.size
+    if points > MAX_SIMULATION_POINTS:
+        raise ValueError(f"Grid has {points} points, max {MAX_SIMULATION_POINTS}")
+    mesh = np.meshgrid(*axes.values(), indexing="ij")
+    return {name: m.ravel() for name, m in zip(axes.keys(), mesh)}
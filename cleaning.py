@@ -1,10 +1,22 @@
+from typing import List, Tuple
 from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_async_db, get_db
+from query_budget import QueryBudget, declare_budgets
+from admission import Admission, admit_write
+from households import current_household
 from models import CleaningLog
 from schemas import CleaningRequest, CleaningResponse
 
 router = APIRouter()
+async_router = APIRouter()  # same routes on the AsyncEngine, mounted when DB_ASYNC=1
+
+QUERY_BUDGETS = declare_budgets(router, async_router, {
+    # LOG_WRITE without the tariff SELECT, the baseline SELECT + UPDATE and the anomaly INSERT:
+    # cleaning logs have no tariff and no anomaly scoring
+    ("POST", "/analyze"): QueryBudget(statements=6, writes=5, first_write=QueryBudget(statements=16, writes=9)),
+})
 
 # Chemical hazard scores (0-10, higher = more toxic)
 PRODUCT_SCORES = {
@@ -44,8 +56,7 @@ PRODUCT_TIPS = {
 }
 
 
-@router.post("/analyze", response_model=CleaningResponse)
-def analyze_cleaning(req: CleaningRequest, db: Session = Depends(get_db)):
+def _analyze(req: CleaningRequest) -> Tuple[CleaningLog, CleaningResponse]:
     base_score = PRODUCT_SCORES.get(req.product_type, 5)
 
     # Penalize for high frequency
@@ -65,13 +76,12 @@ def analyze_cleaning(req: CleaningRequest, db: Session = Depends(get_db)):
         rating = "Needs improvement — high chemical load ⚠️"
 
     alternatives = ALTERNATIVES.get(req.product_type, ["Try plant-based cleaners", "Use microfiber cloths with water"])
-    tips = PRODUCT_TIPS.get(req.product_type, [
+    tips = list(PRODUCT_TIPS.get(req.product_type, [
         "🌿 Ventilate rooms after cleaning",
         "♻️ Buy cleaners in concentrated form to reduce plastic waste",
-    ])
+    ]))
     tips.append(f"🏠 {req.rooms} rooms need ~{req.rooms * 500}ml of cleaner per session — buy in bulk to save")
 
-    # Save to DB
     log = CleaningLog(
         product_type=req.product_type,
         usage_frequency=req.usage_frequency,
@@ -79,15 +89,35 @@ def analyze_cleaning(req: CleaningRequest, db: Session = Depends(get_db)):
         eco_score=eco_score,
         chemical_load=chemical_load,
     )
-    db.add(log)
-    db.commit()
-    db.refresh(log)
-
-    return CleaningResponse(
+    response = CleaningResponse(
         eco_score=eco_score,
         chemical_load=chemical_load,
         rating=rating,
         alternatives=alternatives,
         tips=tips,
-        saved_id=log.id,
     )
+    return log, response
+
+
+def build_logs(reqs: List[CleaningRequest]) -> List[CleaningLog]:
+    """Log rows for bulk imports (scoring is table lookups, nothing to vectorize)."""
+    return [_analyze(req)[0] for req in reqs]
+
+
+@router.post("/analyze", response_model=CleaningResponse)
+def analyze_cleaning(req: CleaningRequest, durable: bool = False,
+                     household: str = Depends(current_household), admission: Admission = Depends(admit_write),
+                     db: Session = Depends(get_db)):
+    log, response = _analyze(req)
+    log.household_id = household
+    return admission.save_log(db, log, req, response, durable=durable)
+
+
+@async_router.post("/analyze", response_model=CleaningResponse)
+async def analyze_cleaning_async(req: CleaningRequest, durable: bool = False,
+                                 household: str = Depends(current_household),
+                                 admission: Admission = Depends(admit_write),
+                                 db: AsyncSession = Depends(get_async_db)):
+    log, response = _analyze(req)
+    log.household_id = household
+    return await admission.save_log_async(db, log, req, response, durable=durable)
@@ -1,28 +1,214 @@
+import asyncio
 import os
-from sqlalchemy import create_engine
+from typing import Any, Callable, Sequence
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os  # ← KEEP THIS!
 
 # Get database URL from environment variable or use SQLite as fallback
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ecosense.db")
+# Optional read replica for the GET endpoints (analysis, achievements). Unset: on a
+# SQLite file a second, query-only engine is opened on the same file (concurrent
+# readers under WAL); on other backends reads share the primary engine.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+# Pool tuning (ignored for in-memory SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # below MySQL's wait_timeout
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+
+# SQLite pragmas applied on every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # safe with WAL
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def _is_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url) -> bool:
+    return _is_sqlite(url) and url.database in (None, "", ":memory:")
+
+
+def _engine_kwargs(url) -> dict:
+    kwargs = {}
+    if _is_sqlite(url):
+        # Sessions are opened in the request threadpool and the write-behind thread
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if not _is_memory_sqlite(url):
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    return kwargs
+
+
+def _install_sqlite_pragmas(sync_engine, read_only: bool = False):
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if not read_only:
+            cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        if read_only:
+            cur.execute("PRAGMA query_only=ON")
+        cur.close()
+
+
+def _make_engine(url: str, read_only: bool = False):
+    # No silent fallback: a bad DATABASE_URL must fail here, not send writes to a local file
+    parsed = make_url(url)
+    eng = create_engine(parsed, **_engine_kwargs(parsed))
+    if _is_sqlite(parsed):
+        _install_sqlite_pragmas(eng, read_only)
+    return eng
 
-# If using MySQL, it will fail without proper credentials - fallback to SQLite
-if DATABASE_URL.startswith("mysql"):
-    try:
-        engine = create_engine(DATABASE_URL)
-    except:
-        # Fallback to SQLite
-        engine = create_engine("sqlite:///./ecosense.db")
-else:
-    engine = create_engine(DATABASE_URL)
+
+def _read_url(primary_url: str):
+    """URL for the read engine, or None when reads should share the primary engine."""
+    if DATABASE_READ_URL:
+        return DATABASE_READ_URL
+    if _is_sqlite(make_url(primary_url)) and not _is_memory_sqlite(make_url(primary_url)):
+        return primary_url
+    return None
+
+
+engine = _make_engine(DATABASE_URL)
+_read_url_value = _read_url(DATABASE_URL)
+read_engine = _make_engine(_read_url_value, read_only=True) if _read_url_value else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
+# Async mode (DB_ASYNC=1): the routers are served by their `async def` variants on an
+# AsyncEngine instead of the threadpool. Driver per backend: aiosqlite locally,
+# asyncpg / aiomysql in production (install the one you deploy with).
+ASYNC_DB = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    backend = scheme.split("+", 1)[0]
+    return f"{ASYNC_DRIVERS.get(backend, scheme)}://{rest}"
+
+
+def _make_async_engine(url: str, read_only: bool = False):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    parsed = make_url(async_url(url))
+    kwargs = _engine_kwargs(parsed)
+    kwargs.pop("connect_args", None)  # aiosqlite runs each connection on its own thread
+    if "pool_size" in kwargs:
+        # The pool sizing needs a queue pool, and SQLAlchemy < 2.1 gives file aiosqlite a NullPool
+        # that rejects it: name the pool rather than depend on the version's default
+        kwargs["poolclass"] = AsyncAdaptedQueuePool
+    eng = create_async_engine(parsed, **kwargs)
+    if _is_sqlite(parsed):
+        _install_sqlite_pragmas(eng.sync_engine, read_only)
+    return eng
+
+
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+if ASYNC_DB:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = _make_async_engine(DATABASE_URL)
+    async_read_engine = _make_async_engine(_read_url_value, read_only=True) if _read_url_value else async_engine
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Session on the read engine — for GET endpoints only; never commit through it."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+async def check_async_engines():
+    """Boot check for DB_ASYNC=1: one round trip on each async engine, so a driver, URL or pool
+    configuration the installed SQLAlchemy rejects fails startup instead of the first request."""
+    for eng in {async_engine, async_read_engine}:
+        async with eng.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+
+async def gather_rows(*stmts):
+    """Run independent read statements concurrently, each on its own read session/connection."""
+    async def run(stmt):
+        async with AsyncReadSessionLocal() as db:
+            return (await db.execute(stmt)).all()
+
+    return await asyncio.gather(*(run(stmt) for stmt in stmts))
+
+
+def insert_or_update(conn, table, rows, key: Sequence[str], on_conflict: Callable[[Any], list]):
+    """INSERT rows into table; a row whose key (a unique constraint's columns) already exists is
+    updated with the (column, expression) pairs of on_conflict(inserted) instead, where
+    inserted.<column> is the value the row would have inserted.
+
+    ON DUPLICATE KEY UPDATE on MySQL, ON CONFLICT DO UPDATE on SQLite and PostgreSQL: two
+    transactions creating the same derived row at once both count, where a plain INSERT would
+    fail the second with an IntegrityError. Pairs are applied in order (MySQL assigns left to right).
+    """
+    dialect = conn.dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update([(column.name, value) for column, value in on_conflict(stmt.inserted)])
+    elif dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c[name] for name in key],
+                                          set_={column.name: value for column, value in on_conflict(stmt.excluded)})
+    else:
+        stmt = insert(table)
+    return conn.execute(stmt, rows)
@@ -1,22 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+from typing import Any, List, Optional, Tuple
+import numpy as np
+from fastapi import APIRouter, Body, Depends, HTTPException
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
+from calculations import (
+    WATTAGE, efficiency_label, efficiency_labels, electricity_metrics, expand_grid, kwh_per_month, sweep_values,
+)
+from database import get_async_db, get_db
+from query_budget import LOG_WRITE, QueryBudget, declare_budgets
+import anomalies
+import rollups
+import tariffs
+from admission import Admission, admit_write
+from households import DEFAULT_HOUSEHOLD, current_household
+from sketches import store as sketches
 from models import ElectricityLog
-from schemas import ElectricityRequest, ElectricityResponse
+from schemas import (
+    BatchItemError, ElectricityBatchResponse, ElectricityRequest, ElectricityResponse,
+    ElectricitySimulationRequest, ElectricitySimulationResponse,
+)
 
 router = APIRouter()
+async_router = APIRouter()  # same routes on the AsyncEngine, mounted when DB_ASYNC=1
 
-# Appliance wattage map
-WATTAGE = {
-    "fan": 75,
-    "light": 10,
-    "ac": 1500,
-    "tv": 100,
-    "fridge": 150,
-    "washer": 500,
-    "heater": 2000,
-    "geyser": 3000,
-}
+MAX_BATCH_SIZE = 100
+
+QUERY_BUDGETS = declare_budgets(router, async_router, {
+    ("POST", "/calculate"): LOG_WRITE,
+    # The household's month-to-date kWh for the slabs; SQLite inserts batch rows one by one
+    # (no ordered multi-row RETURNING), then the totals UPDATE, the rollups' SELECT + UPDATE
+    # + INSERT, the streak UPDATE and the baselines' SELECT + UPDATE + INSERT plus the anomaly INSERT.
+    # A new household's first batch has no baseline or rollup UPDATE and no anomaly (-3), and
+    # seeds its totals (four SELECTs + INSERT) and walks its streak (SELECT, UPDATE, INSERT)
+    ("POST", "/calculate/batch"): QueryBudget(statements=MAX_BATCH_SIZE + 10, writes=MAX_BATCH_SIZE + 7,
+                                              first_write=QueryBudget(statements=MAX_BATCH_SIZE + 15,
+                                                                      writes=MAX_BATCH_SIZE + 7)),
+    ("POST", "/simulate"): QueryBudget(statements=0),
+})
 
 # Tips per appliance
 APPLIANCE_TIPS = {
@@ -53,54 +75,73 @@ APPLIANCE_TIPS = {
 }
 
 
-@router.post("/calculate", response_model=ElectricityResponse)
-def calculate_electricity(req: ElectricityRequest, db: Session = Depends(get_db)):
-    watts = WATTAGE.get(req.appliance_type)
-    if watts is None:
-        raise HTTPException(status_code=400, detail=f"Unknown appliance type: {req.appliance_type}")
-
-    days_per_month = (req.days_per_week / 7) * 30
-    monthly_kwh = (watts * req.hours * days_per_month * req.count) / 1000
-    wasted_kwh = monthly_kwh * (1 - req.occupancy)
-    monthly_cost = monthly_kwh * req.tariff
-    carbon_kg = monthly_kwh * 0.85  # Indian grid average: 0.85 kg CO2/kWh
-
-    waste_percentage = (1 - req.occupancy) * 100
-    if waste_percentage < 20:
-        efficiency = "Efficient"
-    elif waste_percentage < 50:
-        efficiency = "Moderate"
-    else:
-        efficiency = "Wasteful"
-
-    # Build tips
+def _build_tips(appliance_type: str, waste_percentage: float, wasted_kwh: float, tariff: float) -> List[str]:
     tips = []
     if waste_percentage > 30:
-        tips.append(f"🔌 Turn off appliances when not in use — save up to ₹{round(wasted_kwh * req.tariff)}/month")
-    if req.appliance_type in APPLIANCE_TIPS:
-        tips.extend(APPLIANCE_TIPS[req.appliance_type][:2])
+        tips.append(f"🔌 Turn off appliances when not in use — save up to ₹{round(wasted_kwh * tariff)}/month")
+    if appliance_type in APPLIANCE_TIPS:
+        tips.extend(APPLIANCE_TIPS[appliance_type][:2])
     if not tips:
         tips = ["✅ Your usage pattern looks efficient! Keep it up", "📱 Consider smart plugs for automated control"]
+    return tips
+
+
+def _schedule(region: Optional[str]) -> tariffs.Schedule:
+    try:
+        return tariffs.store.book.electricity(region)
+    except tariffs.TariffError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _slabbed(household: str, req: Optional[ElectricityRequest]) -> bool:
+    # Only slabbed costs depend on the rest of the household's month. Every unauthenticated
+    # caller shares the default household, whose month is nobody's own: it starts at slab one
+    return household != DEFAULT_HOUSEHOLD and (req is None or req.tariff is None)
+
+
+def _month_kwh(db: Session, household: str, req: Optional[ElectricityRequest] = None) -> float:
+    return rollups.month_total(db, household, "electricity") if _slabbed(household, req) else 0.0
+
+
+async def _month_kwh_async(db: AsyncSession, household: str, req: Optional[ElectricityRequest] = None) -> float:
+    return await rollups.month_total_async(db, household, "electricity") if _slabbed(household, req) else 0.0
+
+
+def _calculate(req: ElectricityRequest, month_kwh: float = 0.0) -> Tuple[ElectricityLog, ElectricityResponse]:
+    """month_kwh: the household's kWh logged so far this month, which the entry is billed on top of."""
+    watts = WATTAGE.get(req.appliance_type)
+    if watts is None:
+        raise HTTPException(status_code=400, detail=f"Unknown appliance type: {req.appliance_type}")
+
+    schedule = _schedule(req.region)
+    tariff = req.tariff
+    if tariff is None:
+        kwh = kwh_per_month(watts, req.hours, req.days_per_week, req.count)
+        _, tariff = schedule.quote(kwh, month_kwh, req.start_hour, req.hours)
+    m = electricity_metrics(watts, req.hours, req.days_per_week, req.count, req.occupancy, tariff,
+                            schedule.carbon_factor)
+    monthly_kwh = m["monthly_kwh"]
+    wasted_kwh = m["wasted_kwh"]
+    monthly_cost = m["monthly_cost"]
+    carbon_kg = m["carbon_kg"]
+    waste_percentage = m["waste_percentage"]
+    efficiency = efficiency_label(waste_percentage)
+    tips = _build_tips(req.appliance_type, waste_percentage, wasted_kwh, tariff)
 
-    # Save to DB
     log = ElectricityLog(
         appliance_type=req.appliance_type,
         appliance_count=req.count,
         hours_per_day=req.hours,
         days_per_week=req.days_per_week,
         occupancy=req.occupancy,
-        tariff=req.tariff,
+        tariff=round(tariff, 4),  # ₹/kWh this entry was billed at
         monthly_kwh=round(monthly_kwh, 2),
         monthly_cost=round(monthly_cost, 2),
         carbon_kg=round(carbon_kg, 2),
         efficiency=efficiency,
         waste_percentage=round(waste_percentage, 1),
     )
-    db.add(log)
-    db.commit()
-    db.refresh(log)
-
-    return ElectricityResponse(
+    response = ElectricityResponse(
         monthly_kwh=round(monthly_kwh, 2),
         monthly_cost=round(monthly_cost, 2),
         carbon_kg=round(carbon_kg, 2),
@@ -108,5 +149,215 @@ def calculate_electricity(req: ElectricityRequest, db: Session = Depends(get_db)
         waste_percentage=round(waste_percentage, 1),
         wasted_kwh=round(wasted_kwh, 2),
         tips=tips,
-        saved_id=log.id,
+        region=schedule.region,
+        tariff_version=schedule.version if req.tariff is None else None,
     )
+    return log, response
+
+
+def build_logs(reqs: List[ElectricityRequest], month_kwh: Optional[float] = None, days: Optional[List[date]] = None,
+               book: Optional[tariffs.TariffBook] = None) -> Tuple[List[ElectricityLog], dict]:
+    """Log rows for validated requests, computed column-wise; returns (logs, raw metrics).
+
+    With month_kwh, the entries are billed one after another on top of it (a household's
+    batch); without, each on its own (bulk imports). days picks each entry's schedule version.
+    """
+    watts = np.array([WATTAGE[r.appliance_type] for r in reqs], dtype=float)
+    count = np.array([r.count for r in reqs], dtype=float)
+    hours = np.array([r.hours for r in reqs], dtype=float)
+    days_per_week = np.array([r.days_per_week for r in reqs], dtype=float)
+    occupancy = np.array([r.occupancy for r in reqs], dtype=float)
+    flat = np.array([np.nan if r.tariff is None else r.tariff for r in reqs], dtype=float)
+    start_hour = np.array([np.nan if r.start_hour is None else r.start_hour for r in reqs], dtype=float)
+
+    kwh = kwh_per_month(watts, hours, days_per_week, count)
+    before = np.zeros(len(reqs)) if month_kwh is None else month_kwh + np.cumsum(kwh) - kwh
+    _, rates, schedules = (book or tariffs.store.book).quotes(
+        "electricity", kwh, before, [r.region for r in reqs], days, start_hour, hours)
+    scheduled = np.isnan(flat)
+    tariff = np.where(scheduled, rates, flat)
+    carbon_factor = np.array([s.carbon_factor for s in schedules], dtype=float)
+
+    m = electricity_metrics(watts, hours, days_per_week, count, occupancy, tariff, carbon_factor)
+    m["tariff"] = tariff
+    m["schedules"] = schedules
+    m["scheduled"] = scheduled.tolist()
+    efficiency = efficiency_labels(m["waste_percentage"])
+    rows = zip(m["monthly_kwh"].tolist(), m["monthly_cost"].tolist(), m["carbon_kg"].tolist(),
+               m["waste_percentage"].tolist(), efficiency.tolist(), tariff.tolist())
+
+    logs = [
+        ElectricityLog(
+            appliance_type=r.appliance_type,
+            appliance_count=r.count,
+            hours_per_day=r.hours,
+            days_per_week=r.days_per_week,
+            occupancy=r.occupancy,
+            tariff=round(rate, 4),
+            monthly_kwh=round(kwh, 2),
+            monthly_cost=round(cost, 2),
+            carbon_kg=round(carbon, 2),
+            efficiency=eff,
+            waste_percentage=round(waste, 1),
+        )
+        for r, (kwh, cost, carbon, waste, eff, rate) in zip(reqs, rows)
+    ]
+    return logs, m
+
+
+def _calculate_batch(items: List[Any], month_kwh: float = 0.0) -> Tuple[List[int], List[ElectricityLog], list,
+                                                                        List[BatchItemError]]:
+    """Validate and compute a batch; returns (input indexes, logs, results, errors) with ids unset."""
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch too large: max {MAX_BATCH_SIZE} items")
+
+    # Validate each item on its own so one bad appliance doesn't reject the whole home
+    book = tariffs.store.book  # one version of the schedules for the whole batch
+    valid: List[tuple] = []
+    errors: List[BatchItemError] = []
+    for i, raw in enumerate(items):
+        try:
+            req = ElectricityRequest.model_validate(raw)
+        except ValidationError as e:
+            errors.append(BatchItemError(index=i, detail="; ".join(
+                f"{'.'.join(str(p) for p in err['loc']) or 'item'}: {err['msg']}" for err in e.errors()
+            )))
+            continue
+        if req.appliance_type not in WATTAGE:
+            errors.append(BatchItemError(index=i, detail=f"Unknown appliance type: {req.appliance_type}"))
+            continue
+        try:
+            book.electricity(req.region)
+        except tariffs.TariffError as e:
+            errors.append(BatchItemError(index=i, detail=str(e)))
+            continue
+        valid.append((i, req))
+
+    results: List[Any] = [None] * len(items)
+    if not valid:
+        return [], [], results, errors
+
+    logs, m = build_logs([req for _, req in valid], month_kwh=month_kwh, book=book)
+    rows = zip(m["wasted_kwh"].tolist(), m["waste_percentage"].tolist(), m["tariff"].tolist(), m["schedules"],
+               m["scheduled"])
+    for (i, r), log, (wasted, waste, tariff, schedule, scheduled) in zip(valid, logs, rows):
+        results[i] = ElectricityResponse(
+            monthly_kwh=log.monthly_kwh,
+            monthly_cost=log.monthly_cost,
+            carbon_kg=log.carbon_kg,
+            efficiency=log.efficiency,
+            waste_percentage=log.waste_percentage,
+            wasted_kwh=round(wasted, 2),
+            tips=_build_tips(r.appliance_type, waste, wasted, tariff),
+            percentile=sketches.percentile("electricity", r.appliance_type, log.monthly_kwh),
+            region=schedule.region,
+            tariff_version=schedule.version if scheduled else None,
+        )
+    return [i for i, _ in valid], logs, results, errors
+
+
+@router.post("/calculate", response_model=ElectricityResponse)
+def calculate_electricity(req: ElectricityRequest, durable: bool = False,
+                          household: str = Depends(current_household), admission: Admission = Depends(admit_write),
+                          db: Session = Depends(get_db)):
+    log, response = _calculate(req, _month_kwh(db, household, req))
+    log.household_id = household
+    response.percentile = sketches.percentile("electricity", req.appliance_type, response.monthly_kwh)
+    return admission.save_log(db, log, req, response, durable=durable)
+
+
+@router.post("/calculate/batch", response_model=ElectricityBatchResponse)
+def calculate_electricity_batch(items: List[Any] = Body(...), household: str = Depends(current_household),
+                                db: Session = Depends(get_db)):
+    indexes, logs, results, errors = _calculate_batch(items, _month_kwh(db, household))
+    if logs:
+        for log in logs:
+            log.household_id = household
+        # One flush, one commit — the unit of work batches the INSERTs into a multi-row
+        # statement wherever the dialect supports ordered RETURNING (insertmanyvalues)
+        db.add_all(logs)
+        db.flush()
+        for i, log in zip(indexes, logs):
+            results[i].saved_id = log.id  # read before commit expires the instances
+            results[i].anomaly, results[i].z_score = anomalies.verdict(log)
+        db.commit()
+    return ElectricityBatchResponse(results=results, errors=errors)
+
+
+@async_router.post("/calculate", response_model=ElectricityResponse)
+async def calculate_electricity_async(req: ElectricityRequest, durable: bool = False,
+                                      household: str = Depends(current_household),
+                                      admission: Admission = Depends(admit_write),
+                                      db: AsyncSession = Depends(get_async_db)):
+    log, response = _calculate(req, await _month_kwh_async(db, household, req))
+    log.household_id = household
+    response.percentile = sketches.percentile("electricity", req.appliance_type, response.monthly_kwh)
+    return await admission.save_log_async(db, log, req, response, durable=durable)
+
+
+@async_router.post("/calculate/batch", response_model=ElectricityBatchResponse)
+async def calculate_electricity_batch_async(items: List[Any] = Body(...), household: str = Depends(current_household),
+                                            db: AsyncSession = Depends(get_async_db)):
+    indexes, logs, results, errors = _calculate_batch(items, await _month_kwh_async(db, household))
+    if logs:
+        for log in logs:
+            log.household_id = household
+        db.add_all(logs)
+        await db.flush()
+        for i, log in zip(indexes, logs):
+            results[i].saved_id = log.id
+            results[i].anomaly, results[i].z_score = anomalies.verdict(log)
+        await db.commit()
+    return ElectricityBatchResponse(results=results, errors=errors)
+
+
+def _simulate(req: ElectricitySimulationRequest) -> ElectricitySimulationResponse:
+    watts = WATTAGE.get(req.appliance_type)
+    if watts is None:
+        raise HTTPException(status_code=400, detail=f"Unknown appliance type: {req.appliance_type}")
+
+    schedule = _schedule(req.region)
+    spec = req.model_dump()
+    try:
+        # Same bounds as ElectricityRequest, so every grid point is a request /calculate would accept
+        axes = {
+            "hours": sweep_values("hours", spec["hours"], 0, 24),
+            "occupancy": sweep_values("occupancy", spec["occupancy"], 0, 1),
+            "count": sweep_values("count", spec["count"], 1, 20, integer=True),
+        }
+        if req.tariff is not None:
+            axes["tariff"] = sweep_values("tariff", spec["tariff"], 1, 50)
+        grid = expand_grid(axes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    tariff = grid.get("tariff")
+    if tariff is None:  # each point's rate from the schedule, as _calculate quotes it
+        kwh = kwh_per_month(watts, grid["hours"], req.days_per_week, grid["count"])
+        start_hour = np.full(kwh.size, np.nan if req.start_hour is None else req.start_hour)
+        _, tariff = schedule.quotes(kwh, np.full(kwh.size, req.month_kwh), start_hour, grid["hours"])
+    m = electricity_metrics(watts, grid["hours"], req.days_per_week, grid["count"], grid["occupancy"], tariff,
+                            schedule.carbon_factor)
+    return ElectricitySimulationResponse(
+        appliance_type=req.appliance_type,
+        points=grid["hours"].size,
+        hours=grid["hours"].tolist(),
+        occupancy=grid["occupancy"].tolist(),
+        count=grid["count"].tolist(),
+        tariff=np.round(tariff, 4).tolist(),
+        monthly_kwh=np.round(m["monthly_kwh"], 2).tolist(),
+        monthly_cost=np.round(m["monthly_cost"], 2).tolist(),
+        carbon_kg=np.round(m["carbon_kg"], 2).tolist(),
+        waste_percentage=np.round(m["waste_percentage"], 1).tolist(),
+        efficiency=efficiency_labels(m["waste_percentage"]).tolist(),
+        region=schedule.region,
+        tariff_version=schedule.version if req.tariff is None else None,
+    )
+
+
+# Pure computation, nothing saved: a plain def on both routers runs in the threadpool
+# and keeps large grids off the event loop in async mode too.
+@router.post("/simulate", response_model=ElectricitySimulationResponse)
+@async_router.post("/simulate", response_model=ElectricitySimulationResponse)
+def simulate_electricity(req: ElectricitySimulationRequest):
+    return _simulate(req)
@@ -0,0 +1,75 @@
+"""Production serving: gunicorn managing uvicorn workers, one per core, app preloaded.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+    WEB_CONCURRENCY=4               # workers (default: the CPU cores this process may use)
+    GUNICORN_TIMEOUT=60             # a worker silent for this long is killed and replaced
+    GUNICORN_GRACEFUL_TIMEOUT=30    # on restart / shutdown, time to finish in-flight requests
+    GUNICORN_MAX_REQUESTS=0         # >0: recycle each worker after about this many requests
+
+The app is imported once in the master (preload_app) and the workers are forked from
+it, so each starts in milliseconds instead of re-importing FastAPI / SQLAlchemy, and the
+schema bootstrap runs once before the fork; every worker's lifespan then only checks the
+version (one query).
+
+Graceful restarts:
+    kill -HUP <master>      replace the workers; the old ones finish their requests first
+                            (the preloaded code is kept: deploy new code with USR2 or a restart)
+    kill -USR2 <master>     start a new master with the new code beside the old one, then
+                            kill -TERM the old master once the new workers are up
+
+Cross-worker state: unless already set, a fresh SHARED_STATE_PATH (shared_state.py: cache
+versions, /api/stats counters, rate limits, job leadership) and PROMETHEUS_MULTIPROC_DIR
+(metrics.py) are created here for this server, before the app is imported.
+"""
+import os
+import tempfile
+
+
+def _cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS
+        return os.cpu_count() or 1
+
+
+# Config is re-read on HUP: keep the state files of the running server
+if "SHARED_STATE_PATH" not in os.environ or "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    _state_dir = tempfile.mkdtemp(prefix="ecosense-")
+    os.environ.setdefault("SHARED_STATE_PATH", os.path.join(_state_dir, "shared_state"))
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(_state_dir, "prometheus"))
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(_cores())))
+os.environ["WEB_CONCURRENCY"] = str(workers)  # admission.py splits its in-flight limit over the workers
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+
+def on_starting(server):
+    import bootstrap
+    from database import engine
+
+    report = bootstrap.ensure_schema()
+    server.log.info("schema v%s ready%s", report["version"], " (upgraded)" if report["upgraded"] else "")
+    # No pooled connection may be inherited by the forked workers
+    engine.dispose()
+
+
+def post_fork(server, worker):
+    from database import engine, read_engine
+
+    for e in {engine, read_engine}:
+        e.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,86 @@
+"""Which household a request belongs to.
+
+Every log row carries a `household_id`, and every read (history, summary, trends,
+export, badges) is scoped to the caller's household through composite indexes that
+lead with it, so a household's response time depends on its own data only.
+
+Resolution, per request:
+  * HOUSEHOLD_TOKEN_SECRET set: `Authorization: Bearer <token>` is required, where the
+    token is `<household_id>.<signature>` as minted by `python households.py token <id>`.
+  * otherwise (development, or behind a trusted gateway): the `X-Household-ID` header,
+    falling back to the "default" household, which also owns rows logged before
+    households existed.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import re
+import sys
+from typing import Optional
+from fastapi import Header, HTTPException, Request
+
+DEFAULT_HOUSEHOLD = "default"
+HOUSEHOLD_TOKEN_SECRET = os.getenv("HOUSEHOLD_TOKEN_SECRET", "")
+
+_VALID_ID = re.compile(r"[A-Za-z0-9_:-]{1,64}")
+
+
+def _signature(household_id: str, secret: str) -> str:
+    digest = hmac.new(secret.encode(), household_id.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def make_token(household_id: str, secret: str = HOUSEHOLD_TOKEN_SECRET) -> str:
+    if not _VALID_ID.fullmatch(household_id):
+        raise ValueError(f"Invalid household id: {household_id!r}")
+    return f"{household_id}.{_signature(household_id, secret)}"
+
+
+def household_from_token(token: str, secret: str = HOUSEHOLD_TOKEN_SECRET) -> Optional[str]:
+    """The household a token was minted for, or None if it doesn't verify."""
+    household_id, _, signature = token.rpartition(".")
+    if not _VALID_ID.fullmatch(household_id):
+        return None
+    if not hmac.compare_digest(signature, _signature(household_id, secret)):
+        return None
+    return household_id
+
+
+def current_household(
+    request: Request,
+    x_household_id: Optional[str] = Header(None, description="Household to act for (when tokens are not required)"),
+) -> str:
+    """Route dependency: the caller's household id. Also kept on request.state for the response cache."""
+    if HOUSEHOLD_TOKEN_SECRET:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        household_id = household_from_token(token.strip()) if scheme.lower() == "bearer" else None
+        if household_id is None:
+            raise HTTPException(status_code=401, detail="Missing or invalid household token",
+                                headers={"WWW-Authenticate": "Bearer"})
+    elif x_household_id is None:
+        household_id = DEFAULT_HOUSEHOLD
+    elif _VALID_ID.fullmatch(x_household_id):
+        household_id = x_household_id
+    else:
+        raise HTTPException(status_code=400, detail="Invalid X-Household-ID: use 1-64 letters, digits, _ : -")
+    request.state.household = household_id
+    return household_id
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mint EcoSense household tokens")
+    parser.add_argument("command", choices=["token"])
+    parser.add_argument("household_id")
+    args = parser.parse_args(argv)
+
+    if not HOUSEHOLD_TOKEN_SECRET:
+        print("⚠️  Set HOUSEHOLD_TOKEN_SECRET to the server's secret first")
+        return 1
+    print(make_token(args.household_id))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ USE ecosense;
 -- Electricity usage logs
 CREATE TABLE IF NOT EXISTS electricity_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    household_id VARCHAR(64) NOT NULL DEFAULT 'default',
     appliance_type VARCHAR(50) NOT NULL,
     appliance_count INT NOT NULL DEFAULT 1,
     hours_per_day FLOAT NOT NULL,
@@ -18,12 +19,15 @@ CREATE TABLE IF NOT EXISTS electricity_logs (
     carbon_kg FLOAT NOT NULL,
     efficiency VARCHAR(20) NOT NULL,
     waste_percentage FLOAT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_electricity_logs_household_created_id (household_id, created_at, id),
+    INDEX ix_electricity_logs_household_appliance_created_id (household_id, appliance_type, created_at, id)
 );
 
 -- Water usage logs
 CREATE TABLE IF NOT EXISTS water_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    household_id VARCHAR(64) NOT NULL DEFAULT 'default',
     activity_type VARCHAR(50) NOT NULL,
     flow_rate FLOAT NOT NULL,
     duration_minutes FLOAT NOT NULL,
@@ -35,18 +39,134 @@ CREATE TABLE IF NOT EXISTS water_logs (
     monthly_cost FLOAT NOT NULL,
     comparison_rating VARCHAR(20) NOT NULL,
     ratio FLOAT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_water_logs_household_created_id (household_id, created_at, id),
+    INDEX ix_water_logs_household_activity_created_id (household_id, activity_type, created_at, id)
 );
 
 -- Eco-cleaning logs
 CREATE TABLE IF NOT EXISTS cleaning_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    household_id VARCHAR(64) NOT NULL DEFAULT 'default',
     product_type VARCHAR(100) NOT NULL,
     usage_frequency VARCHAR(50) NOT NULL,
     rooms INT NOT NULL DEFAULT 1,
     eco_score INT NOT NULL,
     chemical_load VARCHAR(20) NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_cleaning_logs_household_created_id (household_id, created_at, id),
+    INDEX ix_cleaning_logs_household_product_created_id (household_id, product_type, created_at, id)
+);
+
+-- Databases created by an older EcoSense (e.g. before households existed) are upgraded in
+-- place, derived tables recomputed, by the app on startup or by: python bootstrap.py upgrade
+
+-- Running totals behind /api/analysis/summary and /api/achievements (one row per household)
+CREATE TABLE IF NOT EXISTS analysis_totals (
+    household_id VARCHAR(64) PRIMARY KEY,
+    electricity_count INT NOT NULL DEFAULT 0,
+    total_kwh DOUBLE NOT NULL DEFAULT 0,
+    total_electricity_cost DOUBLE NOT NULL DEFAULT 0,
+    total_carbon_kg DOUBLE NOT NULL DEFAULT 0,
+    efficient_count INT NOT NULL DEFAULT 0,
+    water_count INT NOT NULL DEFAULT 0,
+    total_liters DOUBLE NOT NULL DEFAULT 0,
+    total_water_cost DOUBLE NOT NULL DEFAULT 0,
+    good_water_count INT NOT NULL DEFAULT 0,
+    cleaning_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Daily-activity streaks behind the consistent_user badge (one row per household)
+CREATE TABLE IF NOT EXISTS activity_streaks (
+    household_id VARCHAR(64) PRIMARY KEY,
+    last_active_day DATE NOT NULL,
+    current_streak INT NOT NULL DEFAULT 1,
+    longest_streak INT NOT NULL DEFAULT 1
+);
+
+-- Daily / weekly / monthly rollups behind /api/analysis/trends
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    household_id VARCHAR(64) NOT NULL,
+    bucket VARCHAR(5) NOT NULL,
+    bucket_start DATE NOT NULL,
+    category VARCHAR(20) NOT NULL,
+    item_type VARCHAR(100) NOT NULL,
+    entry_count INT NOT NULL DEFAULT 0,
+    kwh DOUBLE NOT NULL DEFAULT 0,
+    cost DOUBLE NOT NULL DEFAULT 0,
+    carbon_kg DOUBLE NOT NULL DEFAULT 0,
+    liters DOUBLE NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_usage_rollups_key (household_id, bucket, bucket_start, category, item_type)
+);
+
+-- Monthly per-item sums of raw log rows compacted away by the retention job (retention.py)
+CREATE TABLE IF NOT EXISTS log_archives (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    household_id VARCHAR(64) NOT NULL,
+    month DATE NOT NULL,
+    category VARCHAR(20) NOT NULL,
+    item_type VARCHAR(100) NOT NULL,
+    entry_count INT NOT NULL DEFAULT 0,
+    kwh DOUBLE NOT NULL DEFAULT 0,
+    cost DOUBLE NOT NULL DEFAULT 0,
+    carbon_kg DOUBLE NOT NULL DEFAULT 0,
+    liters DOUBLE NOT NULL DEFAULT 0,
+    efficient_count INT NOT NULL DEFAULT 0,
+    good_water_count INT NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_log_archives_key (household_id, month, category, item_type)
+);
+
+-- Quantile sketch of monthly_kwh per appliance / daily_liters per activity (sketches.py)
+CREATE TABLE IF NOT EXISTS usage_sketches (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    category VARCHAR(20) NOT NULL,
+    item_type VARCHAR(100) NOT NULL,
+    value_count INT NOT NULL DEFAULT 0,
+    sketch TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_usage_sketches_key (category, item_type)
+);
+
+-- Running mean / variance of each household's monthly_kwh per appliance and daily_liters
+-- per activity, and the entries flagged against them (anomalies.py)
+CREATE TABLE IF NOT EXISTS usage_baselines (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    household_id VARCHAR(64) NOT NULL,
+    category VARCHAR(20) NOT NULL,
+    item_type VARCHAR(100) NOT NULL,
+    sample_count INT NOT NULL DEFAULT 0,
+    mean DOUBLE NOT NULL DEFAULT 0,
+    m2 DOUBLE NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_usage_baselines_key (household_id, category, item_type)
+);
+
+CREATE TABLE IF NOT EXISTS usage_anomalies (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    household_id VARCHAR(64) NOT NULL,
+    category VARCHAR(20) NOT NULL,
+    item_type VARCHAR(100) NOT NULL,
+    log_id INT NULL,
+    value DOUBLE NOT NULL,
+    baseline_mean DOUBLE NOT NULL,
+    z_score DOUBLE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_usage_anomalies_household_id (household_id, id)
+);
+
+-- Idempotency-Key header of a log write -> the id it saved, replayed on retries (admission.py)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    household_id VARCHAR(64) NOT NULL,
+    `key` VARCHAR(128) NOT NULL,
+    route VARCHAR(100) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    saved_id INT NOT NULL,
+    response TEXT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_idempotency_keys_key (household_id, `key`),
+    INDEX ix_idempotency_keys_created_at (created_at)
 );
 
 -- Achievements / Badges table
@@ -61,7 +181,7 @@ CREATE TABLE IF NOT EXISTS achievements (
     is_active BOOLEAN DEFAULT TRUE
 );
 
--- Seed achievements
+-- Seed achievements (same list as bootstrap.ACHIEVEMENTS, which the app upserts on startup)
 INSERT IGNORE INTO achievements (badge_key, title, description, icon, category, threshold_value) VALUES
 ('first_calc',       'First Step',         'Completed your first energy calculation',                  '🌱', 'general',     1),
 ('eco_warrior',      'Eco Warrior',         'Calculated electricity 10 times',                         '⚡', 'electricity',  10),
@@ -73,3 +193,11 @@ INSERT IGNORE INTO achievements (badge_key, title, description, icon, category,
 ('data_analyst',     'Data Analyst',        'Used the Analysis page (10+ records in history)',         '📊', 'general',      10),
 ('consistent_user',  'Consistent User',     'Logged activity 7 days in a row',                        '📅', 'general',      7),
 ('green_home',       'Green Home',          'Used all three analyzers (electricity, water, cleaning)', '🏡', 'general',      3);
+
+-- Schema version stamped by bootstrap.py (left empty here: the first startup checks the
+-- tables above against the models, upserts the badges and stamps it)
+CREATE TABLE IF NOT EXISTS schema_version (
+    id INT PRIMARY KEY,
+    version INT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,93 @@
+from typing import Callable, Dict, List, NamedTuple, Set
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from models import ElectricityLog, WaterLog, CleaningLog
+
+
+class LogBatch(NamedTuple):
+    electricity: List[ElectricityLog]
+    water: List[WaterLog]
+    cleaning: List[CleaningLog]
+
+    def households(self) -> Set[str]:
+        return {log.household_id for logs in self for log in logs}
+
+    def by_household(self) -> Dict[str, "LogBatch"]:
+        """Split into one sub-batch per household (derived rows are kept per household)."""
+        parts: Dict[str, LogBatch] = {}
+        for i, logs in enumerate(self):
+            for log in logs:
+                part = parts.get(log.household_id)
+                if part is None:
+                    part = parts[log.household_id] = LogBatch([], [], [])
+                part[i].append(log)
+        return parts
+
+
+# Handlers maintaining derived tables (running totals, rollups, ...). Each one is called
+# with the flush's connection, so its writes commit or roll back together with the logs.
+_handlers: List[Callable[[Connection, LogBatch], None]] = []
+
+
+# Callbacks run once the transaction that inserted log rows has committed (cache
+# invalidation and other work that must not see uncommitted data), with the set of
+# households those rows belong to.
+_commit_handlers: List[Callable[[Set[str]], None]] = []
+
+
+def on_logs_inserted(fn: Callable[[Connection, LogBatch], None]):
+    """Register fn(connection, batch) to run after every flush that inserts log rows."""
+    _handlers.append(fn)
+    return fn
+
+
+def on_logs_committed(fn: Callable[[Set[str]], None]):
+    """Register fn(households) to run after every commit that included new log rows."""
+    _commit_handlers.append(fn)
+    return fn
+
+
+@event.listens_for(Session, "after_flush")
+def _dispatch(session: Session, flush_context):
+    if not (_handlers or _commit_handlers) or not session.new:
+        return
+    # session.new still reflects the pre-flush state here, i.e. the rows just inserted
+    batch = LogBatch([], [], [])
+    for obj in session.new:
+        if isinstance(obj, ElectricityLog):
+            batch.electricity.append(obj)
+        elif isinstance(obj, WaterLog):
+            batch.water.append(obj)
+        elif isinstance(obj, CleaningLog):
+            batch.cleaning.append(obj)
+    if not (batch.electricity or batch.water or batch.cleaning):
+        return
+    session.info.setdefault("logs_inserted", set()).update(batch.households())
+    conn = session.connection()
+    for handler in _handlers:
+        handler(conn, batch)
+
+
+def dispatch_bulk(session: Session, batch: LogBatch):
+    """Run the insert handlers for rows written with a Core bulk INSERT (bulk import),
+    which the flush hook never sees. Call inside the transaction that inserted them."""
+    if not (batch.electricity or batch.water or batch.cleaning):
+        return
+    session.info.setdefault("logs_inserted", set()).update(batch.households())
+    conn = session.connection()
+    for handler in _handlers:
+        handler(conn, batch)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_commit(session: Session):
+    households = session.info.pop("logs_inserted", None)
+    if households:
+        for handler in _commit_handlers:
+            handler(households)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session):
+    session.info.pop("logs_inserted", None)
@@ -1,18 +1,62 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from database import Base, engine
+from database import ASYNC_DB, async_engine, check_async_engines
+from metrics import MetricsMiddleware, metrics_response
+import admission
+import anomalies
+import bootstrap
+import query_budget
+from query_budget import QueryBudget
+import retention
+import shared_state
+import sketches
+import tariffs
+import write_buffer
+from response_cache import response_cache
 import electricity
 import water
 import cleaning
 import analysis
 import achievements
+import bulk_import
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One version query when the schema is current; creates / upgrades it otherwise
+    # (SCHEMA_BOOTSTRAP=check|off for workers started after `python bootstrap.py upgrade`)
+    try:
+        report = bootstrap.ensure_schema()
+    except Exception as e:
+        print(f"⚠️  EcoSense: database schema not ready — check DATABASE_URL / DB_PASSWORD in backend/.env\n"
+              f"   Error: {e}")
+        raise
+    if report["upgraded"]:
+        print(f"✅ EcoSense: Database schema upgraded to v{report['version']}: {'; '.join(report['steps'])}")
+    if ASYNC_DB:
+        try:
+            await check_async_engines()
+        except Exception as e:
+            print(f"⚠️  EcoSense: DB_ASYNC=1 but the async engine can't connect — check the async driver for "
+                  f"DATABASE_URL\n   Error: {e}")
+            raise
+    # Tariff schedules: an invalid TARIFF_FILE fails startup; later edits are reloaded in place
+    tariffs.store.start()
+    if write_buffer.WRITE_BEHIND:
+        write_buffer.buffer.start()
+    # Percentile sketches: one SELECT here, then merged with the other workers' every SKETCH_FLUSH_SECONDS
+    sketches.store.start()
+    # RETENTION_DAYS > 0: compact old raw logs into monthly archives in the background
+    retention.job.start()
+    yield
+    retention.job.stop()
+    # Drain queued log rows before the worker exits
+    write_buffer.buffer.stop()
+    sketches.store.stop()
+    tariffs.store.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
 
-# Auto-create all tables on startup (non-fatal if DB not yet configured)
-try:
-    Base.metadata.create_all(bind=engine)
-    print("✅ EcoSense: Database tables ready")
-except Exception as e:
-    print(f"⚠️  EcoSense: DB not connected — update DB_PASSWORD in backend/.env\n   Error: {e}")
 
 app = FastAPI(
     title="EcoSense API",
@@ -20,6 +64,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
+    lifespan=lifespan,
 )
 
 # Allow all origins for hackathon (tighten for production)
@@ -35,13 +80,30 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# QUERY_BUDGETS=warn|raise: check every request against its route's declared SQL budget
+query_budget.install(app)
+# Added last, so it is outermost and times the whole request
+app.add_middleware(MetricsMiddleware)
+
+# Mount routers — the async variants when DB_ASYNC=1, otherwise the threadpool ones
+def _router(module):
+    return module.async_router if ASYNC_DB else module.router
+
+
+app.include_router(_router(electricity),   prefix="/api/electricity",   tags=["Electricity"])
+app.include_router(_router(water),         prefix="/api/water",         tags=["Water"])
+app.include_router(_router(cleaning),      prefix="/api/cleaning",      tags=["Cleaning"])
+app.include_router(_router(analysis),      prefix="/api/analysis",      tags=["Analysis"])
+app.include_router(_router(achievements),  prefix="/api/achievements",  tags=["Achievements"])
+app.include_router(_router(bulk_import),   prefix="/api/import",        tags=["Import"])
 
-# Mount routers
-app.include_router(electricity.router,   prefix="/api/electricity",   tags=["Electricity"])
-app.include_router(water.router,         prefix="/api/water",         tags=["Water"])
-app.include_router(cleaning.router,      prefix="/api/cleaning",      tags=["Cleaning"])
-app.include_router(analysis.router,      prefix="/api/analysis",      tags=["Analysis"])
-app.include_router(achievements.router,  prefix="/api/achievements",  tags=["Achievements"])
+
+query_budget.declare_budgets(app.router, None, {
+    ("GET", "/"): QueryBudget(statements=0),
+    ("GET", "/api/health"): QueryBudget(statements=0),
+    ("GET", "/api/metrics"): QueryBudget(statements=0),
+    ("GET", "/api/stats"): QueryBudget(statements=0),
+})
 
 
 @app.get("/")
@@ -51,3 +113,22 @@ def root():
 @app.get("/api/health")
 def health_check():
     return {"status": "ok", "message": "Backend is running!"}
+
+@app.get("/api/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/api/stats")
+def stats():
+    return {
+        "admission": admission.stats(),
+        "write_buffer": write_buffer.buffer.stats(),
+        "response_cache": response_cache.stats(),
+        "imports": bulk_import.stats(),
+        "sketches": sketches.store.stats(),
+        "anomalies": anomalies.stats(),
+        "tariffs": tariffs.store.stats(),
+        "retention": retention.job.stats(),
+        "schema": bootstrap.stats(),
+        "server": shared_state.stats(),
+    }
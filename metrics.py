@@ -0,0 +1,184 @@
+"""Per-route request metrics, exported in Prometheus text format at /api/metrics.
+
+An ASGI middleware opens a RequestStats for every HTTP request and keeps it in a
+context variable; SQLAlchemy cursor hooks on every engine add each statement's time
+and row count to it. When the response finishes, the middleware records per route
+(the path template, not the raw URL):
+
+    ecosense_http_request_duration_seconds   histogram  {method, route, status}
+    ecosense_db_duration_seconds             histogram  {method, route}   DB time per request
+    ecosense_db_statements_total             counter    {method, route}
+    ecosense_db_rows_total                   counter    {method, route}
+    ecosense_slow_requests_total             counter    {method, route}
+
+Rows are what the driver reports in cursor.rowcount: rows affected by writes, and rows
+returned by SELECTs on MySQL/PostgreSQL; sqlite3 reports no count for SELECTs.
+
+Slow-request log: set METRICS_SLOW_REQUEST_MS to log every request slower than that
+(with the SQL it ran, parameters omitted) to the "ecosense.metrics" logger. SQL text is
+only kept while this is enabled.
+
+Several workers: point PROMETHEUS_MULTIPROC_DIR at an empty directory shared by the
+workers (wiped on deploy; gunicorn.conf.py creates one per server); every worker then
+writes its samples there and any worker answers /api/metrics with the sum across all of them.
+"""
+import contextvars
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from sqlalchemy import event
+from starlette.routing import NoMatchFound
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("ecosense.metrics")
+
+METRICS_ENABLED = os.getenv("METRICS", "1").lower() in ("1", "true", "yes")
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", "0"))  # 0 = slow log off
+METRICS_SLOW_SQL_MAX = 50  # statements kept per request for the slow log
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REQUEST_LATENCY = Histogram(
+    "ecosense_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+DB_TIME = Histogram(
+    "ecosense_db_duration_seconds", "Time spent in SQL per request",
+    ["method", "route"], buckets=DB_BUCKETS,
+)
+DB_STATEMENTS = Counter("ecosense_db_statements", "SQL statements executed", ["method", "route"])
+DB_ROWS = Counter("ecosense_db_rows", "Rows returned or affected, as reported by the driver", ["method", "route"])
+SLOW_REQUESTS = Counter("ecosense_slow_requests", "Requests slower than METRICS_SLOW_REQUEST_MS", ["method", "route"])
+
+
+class RequestStats:
+    __slots__ = ("db_seconds", "statements", "rows", "sql")
+
+    def __init__(self, capture_sql: bool):
+        self.db_seconds = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.sql: Optional[List[Tuple[float, str]]] = [] if capture_sql else None
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("ecosense_request_stats",
+                                                                                  default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Stats of the request being served in this context, or None outside a request."""
+    return _current.get()
+
+
+# Registered on the Engine class, so the primary, read and async engines are all covered.
+# Statements run outside a request (write-behind thread, CLIs) find no stats and are skipped.
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "_metrics_started", None)
+    if stats is None or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats.db_seconds += elapsed
+    stats.statements += 1
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+    if stats.sql is not None and len(stats.sql) < METRICS_SLOW_SQL_MAX:
+        stats.sql.append((elapsed, statement))
+
+
+_route_paths = {}  # endpoint function -> full path template, filled on first use
+
+
+def _route_label(scope) -> str:
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"  # 404s: never label by raw URL, it would explode the series count
+    path = _route_paths.get(endpoint)
+    if path is None:
+        # The matched route may be the router's own copy, without the include_router
+        # prefix, so ask the app for the mounted path by route name
+        route = scope.get("route")
+        name = getattr(route, "name", None) or endpoint.__name__
+        try:
+            path = scope["app"].url_path_for(name)
+        except NoMatchFound:  # route with path parameters
+            path = getattr(route, "path", "unmatched")
+        _route_paths[endpoint] = path
+    return path
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering, unlike BaseHTTPMiddleware)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(capture_sql=METRICS_SLOW_REQUEST_MS > 0)
+        token = _current.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._record(scope, stats, status, time.perf_counter() - started)
+
+    @staticmethod
+    def _record(scope, stats: RequestStats, status: int, elapsed: float):
+        method = scope["method"]
+        route = _route_label(scope)
+        REQUEST_LATENCY.labels(method, route, str(status)).observe(elapsed)
+        DB_TIME.labels(method, route).observe(stats.db_seconds)
+        if stats.statements:
+            DB_STATEMENTS.labels(method, route).inc(stats.statements)
+        if stats.rows:
+            DB_ROWS.labels(method, route).inc(stats.rows)
+
+        if METRICS_SLOW_REQUEST_MS > 0 and elapsed * 1000 >= METRICS_SLOW_REQUEST_MS:
+            SLOW_REQUESTS.labels(method, route).inc()
+            sql = "\n".join(f"    {secs * 1000:8.2f} ms  {stmt}" for secs, stmt in stats.sql or [])
+            logger.warning(
+                "Slow request %s %s → %s in %.1f ms (db %.1f ms, %d statements, %d rows)\n%s",
+                method, route, status, elapsed * 1000, stats.db_seconds * 1000, stats.statements, stats.rows, sql,
+            )
+
+
+def _registry():
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    from prometheus_client import REGISTRY
+
+    return REGISTRY
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(_registry()), media_type=CONTENT_TYPE_LATEST)
+
@@ -1,12 +1,20 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Float, Boolean, Text, Date, TIMESTAMP, Index, UniqueConstraint
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from database import Base
+from households import DEFAULT_HOUSEHOLD
+
+# SQLite keeps timestamps as text, and CURRENT_TIMESTAMP writes whole seconds: bind them the
+# same way (MySQL's TIMESTAMP keeps whole seconds too), so a comparison with a datetime agrees
+# with ORDER BY on the column
+Timestamp = TIMESTAMP().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite")
 
 
 class ElectricityLog(Base):
     __tablename__ = "electricity_logs"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    household_id = Column(String(64), nullable=False, default=DEFAULT_HOUSEHOLD, server_default=DEFAULT_HOUSEHOLD)
     appliance_type = Column(String(50), nullable=False)
     appliance_count = Column(Integer, nullable=False, default=1)
     hours_per_day = Column(Float, nullable=False)
@@ -18,13 +26,22 @@ class ElectricityLog(Base):
     carbon_kg = Column(Float, nullable=False)
     efficiency = Column(String(20), nullable=False)
     waste_percentage = Column(Float, nullable=False)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+
+    # Every read is one household's: keyset pagination on (created_at, id) for
+    # /api/analysis/history and the export, optionally filtered by appliance
+    __table_args__ = (
+        Index("ix_electricity_logs_household_created_id", "household_id", "created_at", "id"),
+        Index("ix_electricity_logs_household_appliance_created_id", "household_id", "appliance_type", "created_at",
+              "id"),
+    )
 
 
 class WaterLog(Base):
     __tablename__ = "water_logs"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    household_id = Column(String(64), nullable=False, default=DEFAULT_HOUSEHOLD, server_default=DEFAULT_HOUSEHOLD)
     activity_type = Column(String(50), nullable=False)
     flow_rate = Column(Float, nullable=False)
     duration_minutes = Column(Float, nullable=False)
@@ -36,25 +53,36 @@ class WaterLog(Base):
     monthly_cost = Column(Float, nullable=False)
     comparison_rating = Column(String(20), nullable=False)
     ratio = Column(Float, nullable=False)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_water_logs_household_created_id", "household_id", "created_at", "id"),
+        Index("ix_water_logs_household_activity_created_id", "household_id", "activity_type", "created_at", "id"),
+    )
 
 
 class CleaningLog(Base):
     __tablename__ = "cleaning_logs"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    household_id = Column(String(64), nullable=False, default=DEFAULT_HOUSEHOLD, server_default=DEFAULT_HOUSEHOLD)
     product_type = Column(String(100), nullable=False)
     usage_frequency = Column(String(50), nullable=False)
     rooms = Column(Integer, nullable=False, default=1)
     eco_score = Column(Integer, nullable=False)
     chemical_load = Column(String(20), nullable=False)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_cleaning_logs_household_created_id", "household_id", "created_at", "id"),
+        Index("ix_cleaning_logs_household_product_created_id", "household_id", "product_type", "created_at", "id"),
+    )
 
 
 class Achievement(Base):
     __tablename__ = "achievements"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     badge_key = Column(String(50), unique=True, nullable=False)
     title = Column(String(100), nullable=False)
     description = Column(Text, nullable=False)
@@ -62,3 +90,158 @@ class Achievement(Base):
     category = Column(String(30), nullable=False)
     threshold_value = Column(Float, nullable=False, default=0)
     is_active = Column(Boolean, default=True)
+
+
+class AnalysisTotals(Base):
+    """Per-household running totals behind /summary and /achievements, maintained by totals.py."""
+    __tablename__ = "analysis_totals"
+
+    household_id = Column(String(64), primary_key=True)
+    electricity_count = Column(Integer, nullable=False, default=0)
+    total_kwh = Column(Float, nullable=False, default=0)
+    total_electricity_cost = Column(Float, nullable=False, default=0)
+    total_carbon_kg = Column(Float, nullable=False, default=0)
+    efficient_count = Column(Integer, nullable=False, default=0)
+    water_count = Column(Integer, nullable=False, default=0)
+    total_liters = Column(Float, nullable=False, default=0)
+    total_water_cost = Column(Float, nullable=False, default=0)
+    good_water_count = Column(Integer, nullable=False, default=0)
+    cleaning_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+
+
+class ActivityStreak(Base):
+    """Per-household daily-activity streak behind the consistent_user badge, maintained by streaks.py."""
+    __tablename__ = "activity_streaks"
+
+    household_id = Column(String(64), primary_key=True)
+    last_active_day = Column(Date, nullable=False)       # UTC day of the latest log
+    current_streak = Column(Integer, nullable=False, default=1)  # consecutive days ending on last_active_day
+    longest_streak = Column(Integer, nullable=False, default=1)
+
+
+class UsageRollup(Base):
+    """Pre-aggregated usage per (household, bucket, bucket_start, category, item_type), maintained by rollups.py."""
+    __tablename__ = "usage_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    household_id = Column(String(64), nullable=False)
+    bucket = Column(String(5), nullable=False)           # day | week | month
+    bucket_start = Column(Date, nullable=False)
+    category = Column(String(20), nullable=False)        # electricity | water | cleaning
+    item_type = Column(String(100), nullable=False)      # appliance / activity / product
+    entry_count = Column(Integer, nullable=False, default=0)
+    kwh = Column(Float, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0)
+    carbon_kg = Column(Float, nullable=False, default=0)
+    liters = Column(Float, nullable=False, default=0)
+
+    # Also serves the /trends range scan: household_id = ? AND bucket = ? AND bucket_start BETWEEN ? AND ?
+    __table_args__ = (
+        UniqueConstraint("household_id", "bucket", "bucket_start", "category", "item_type",
+                         name="uq_usage_rollups_key"),
+    )
+
+
+class LogArchive(Base):
+    """Monthly per-item sums of raw log rows removed by the retention job (retention.py)."""
+    __tablename__ = "log_archives"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    household_id = Column(String(64), nullable=False)
+    month = Column(Date, nullable=False)                 # first day of the month
+    category = Column(String(20), nullable=False)        # electricity | water | cleaning
+    item_type = Column(String(100), nullable=False)      # appliance / activity / product
+    entry_count = Column(Integer, nullable=False, default=0)
+    kwh = Column(Float, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0)
+    carbon_kg = Column(Float, nullable=False, default=0)
+    liters = Column(Float, nullable=False, default=0)
+    efficient_count = Column(Integer, nullable=False, default=0)
+    good_water_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("household_id", "month", "category", "item_type", name="uq_log_archives_key"),
+    )
+
+
+class SchemaVersion(Base):
+    """Single row recording the bootstrap.SCHEMA_VERSION the database was last brought to."""
+    __tablename__ = "schema_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False)
+    applied_at = Column(Timestamp, server_default=func.now())
+
+
+class IdempotencyKey(Base):
+    """Saved id and response of a log written with an Idempotency-Key header, replayed on retries (admission.py)."""
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    household_id = Column(String(64), nullable=False)
+    key = Column(String(128), nullable=False)
+    route = Column(String(100), nullable=False)
+    request_hash = Column(String(64), nullable=False)    # sha256 of route + request body
+    saved_id = Column(Integer, nullable=False)
+    response = Column(Text, nullable=True)               # the JSON sent the first time; null on keys from v4
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("household_id", "key", name="uq_idempotency_keys_key"),
+        Index("ix_idempotency_keys_created_at", "created_at"),  # expiry purge
+    )
+
+
+class UsageSketch(Base):
+    """Quantile sketch of one appliance's monthly_kwh / activity's daily_liters, maintained by sketches.py."""
+    __tablename__ = "usage_sketches"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    category = Column(String(20), nullable=False)        # electricity | water
+    item_type = Column(String(100), nullable=False)      # appliance / activity
+    value_count = Column(Integer, nullable=False, default=0)  # values in the sketch; the flush's version check
+    sketch = Column(Text, nullable=False)                # JSON: gamma, zeros, [bucket, count] pairs
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("category", "item_type", name="uq_usage_sketches_key"),
+    )
+
+
+class UsageBaseline(Base):
+    """Running mean / variance of one household's monthly_kwh per appliance or daily_liters per
+    activity (Welford), maintained by anomalies.py."""
+    __tablename__ = "usage_baselines"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    household_id = Column(String(64), nullable=False)
+    category = Column(String(20), nullable=False)        # electricity | water
+    item_type = Column(String(100), nullable=False)      # appliance / activity
+    sample_count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0)
+    m2 = Column(Float, nullable=False, default=0)        # sum of squared deviations from the mean
+
+    __table_args__ = (
+        UniqueConstraint("household_id", "category", "item_type", name="uq_usage_baselines_key"),
+    )
+
+
+class UsageAnomaly(Base):
+    """A log entry far from its household's baseline, behind /api/analysis/anomalies (anomalies.py)."""
+    __tablename__ = "usage_anomalies"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    household_id = Column(String(64), nullable=False)
+    category = Column(String(20), nullable=False)        # electricity | water
+    item_type = Column(String(100), nullable=False)
+    log_id = Column(Integer, nullable=True)              # null for bulk-imported rows
+    value = Column(Float, nullable=False)                # monthly_kwh / daily_liters
+    baseline_mean = Column(Float, nullable=False)        # the mean before this entry
+    z_score = Column(Float, nullable=False)
+    created_at = Column(Timestamp, server_default=func.now())  # the log's
+
+    # The feed: household_id = ? [AND id < ?] ORDER BY id DESC
+    __table_args__ = (
+        Index("ix_usage_anomalies_household_id", "household_id", "id"),
+    )
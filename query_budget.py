@@ -0,0 +1,329 @@
+"""Per-route SQL query budgets, enforced in development and tests.
+
+Each router module declares, next to its `router` definition, how many SQL statements
+(and how many of them writes) one request to each of its routes may issue:
+
+    router = APIRouter()
+    async_router = APIRouter()
+    QUERY_BUDGETS = declare_budgets(router, async_router, {
+        ("GET", "/summary"): QueryBudget(statements=1),
+    })
+
+With QUERY_BUDGETS=raise (dev/test) a cursor hook raises QueryBudgetExceeded at the first
+statement over budget, so the offending query shows up in the traceback; QUERY_BUDGETS=warn
+logs it instead; off (the default) installs nothing. Budgets are the worst case of normal
+operation. A write that creates a household's derived rows (its first log, or its first of a
+new day) calls `first_write()` and is held to the route's separate `first_write` budget
+instead. One-off maintenance inside a request (the summary's scan fallback on a database from
+before the totals table, the Idempotency-Key purge) runs under `unbudgeted()`.
+
+Check every registered route against a throwaway SQLite database:
+    python query_budget.py check
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import sys
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import APIRouter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("ecosense.query_budget")
+
+QUERY_BUDGETS_MODE = os.getenv("QUERY_BUDGETS", "off").lower()  # off | warn | raise
+
+_WRITE_VERBS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    statements: int
+    writes: Optional[int] = None  # None: writes only count towards `statements`
+    # Budget for the whole request once it has called first_write(); None: no separate allowance
+    first_write: Optional["QueryBudget"] = None
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# One log row through the write path, steady state (the household's derived rows exist):
+#    1 SELECT  the household's month-to-date usage for the tariff slabs (tariffs.py)
+#    2 SELECT  the Idempotency-Key, when one is sent (admission.py)
+#    3 INSERT  the log
+#    4 SELECT  its baseline row (anomalies.py)
+#    5 UPDATE  the baseline, or INSERT it for a new item
+#    6 INSERT  the anomaly, when the log is flagged
+#    7 UPDATE  its day/week/month rollup rows, one statement (rollups.py)
+#    8 UPDATE  the totals row (totals.py)
+#    9 UPDATE  the streak row (streaks.py)
+#   10 INSERT  the Idempotency-Key with its response
+# A request that creates derived rows calls first_write() and gets the second budget. The
+# first log of a new household has no anomaly (-1) but adds the rollups' SELECT of existing
+# buckets and INSERT of the missing ones (+2), the totals row seeded from four SELECTs over
+# the raw and archive tables and INSERTed (+5), and the streak walked from the day rollups,
+# UPDATEd and INSERTed (+3). The first log of a new day for a known household adds only the
+# rollups' +2. Every derived table is maintained in the log's own transaction by its insert
+# hook (log_hooks.py), so a log write is 7 writes, not 1. The periodic purge of expired
+# Idempotency-Keys runs unbudgeted.
+LOG_WRITE = QueryBudget(statements=10, writes=7, first_write=QueryBudget(statements=19, writes=10))
+
+# Routes whose SQL grows with the upload by design (bulk import); they bound their own
+# transactions instead
+UNBOUNDED = QueryBudget(statements=sys.maxsize)
+
+
+# (router, method, path within the router, budget) as declared by the router modules
+_declared: list = []
+# endpoint function -> budget, resolved on first use (routes are added after the declaration)
+_by_endpoint: Dict[tuple, Optional[QueryBudget]] = {}
+
+
+def declare_budgets(router: APIRouter, async_router: Optional[APIRouter],
+                    budgets: Dict[Tuple[str, str], QueryBudget]) -> Dict[Tuple[str, str], QueryBudget]:
+    """Declare budgets keyed by (method, path) for the routes of router and its async twin."""
+    for r in (router, async_router):
+        if r is None:
+            continue
+        for (method, path), budget in budgets.items():
+            _declared.append((r, method, path, budget))
+    return budgets
+
+
+def budget_for(endpoint, method: str) -> Optional[QueryBudget]:
+    """Budget declared for this endpoint and method, or None."""
+    key = (endpoint, method)
+    if key not in _by_endpoint:
+        _by_endpoint[key] = next((
+            budget for r, m, path, budget in _declared
+            if m == method and any(getattr(route, "endpoint", None) is endpoint and route.path == path
+                                   for route in r.routes)
+        ), None)
+    return _by_endpoint[key]
+
+
+class _Usage:
+    __slots__ = ("scope", "statements", "writes", "paused", "first_write")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.statements = 0
+        self.writes = 0
+        self.paused = 0
+        self.first_write = False
+
+
+_usage: contextvars.ContextVar[Optional[_Usage]] = contextvars.ContextVar("ecosense_query_budget", default=None)
+
+
+@contextlib.contextmanager
+def unbudgeted():
+    """Statements in this block don't count towards the current request's budget."""
+    usage = _usage.get()
+    if usage is not None:
+        usage.paused += 1
+    try:
+        yield
+    finally:
+        if usage is not None:
+            usage.paused -= 1
+
+
+def first_write():
+    """The current request creates derived rows (a new household, or its first log of a new
+    period): from here on it is held to its route's `first_write` budget."""
+    usage = _usage.get()
+    if usage is not None:
+        usage.first_write = True
+
+
+def _is_write(statement: str, context) -> bool:
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        return True
+    return statement.lstrip()[:7].upper().startswith(_WRITE_VERBS)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    usage = _usage.get()
+    if usage is None or usage.paused or QUERY_BUDGETS_MODE == "off":
+        return
+    endpoint = usage.scope.get("endpoint")
+    budget = budget_for(endpoint, usage.scope["method"]) if endpoint is not None else None
+    if budget is None:
+        return
+    if usage.first_write and budget.first_write is not None:
+        budget = budget.first_write
+    usage.statements += 1
+    if _is_write(statement, context):
+        usage.writes += 1
+    problem = None
+    if usage.statements > budget.statements:
+        problem = f"{usage.statements} statements, budget {budget.statements}"
+    elif budget.writes is not None and usage.writes > budget.writes:
+        problem = f"{usage.writes} writes, budget {budget.writes}"
+    if problem is None:
+        return
+    message = (f"Query budget exceeded on {usage.scope['method']} {usage.scope['path']}: {problem}\n"
+               f"    statement: {statement}")
+    if QUERY_BUDGETS_MODE == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryBudgetMiddleware:
+    """Opens a per-request usage counter; the cursor hook resolves the route's budget lazily."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _usage.set(_Usage(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _usage.reset(token)
+
+
+_installed = False
+
+
+def install(app):
+    """Enable enforcement on app when QUERY_BUDGETS is warn or raise."""
+    global _installed
+    if QUERY_BUDGETS_MODE not in ("warn", "raise"):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    app.add_middleware(QueryBudgetMiddleware)
+    _installed = True
+
+
+def _api_routes(app) -> Iterable:
+    from fastapi.routing import APIRoute
+
+    return [r for r in app.routes if isinstance(r, APIRoute)]
+
+
+def unbudgeted_routes(app) -> list:
+    """'METHOD path' of every API route without a declared budget."""
+    return sorted(
+        f"{method} {route.path}"
+        for route in _api_routes(app) for method in route.methods
+        if budget_for(route.endpoint, method) is None
+    )
+
+
+def assert_query_budgets(app, client, samples: Dict[Tuple[str, str], dict]):
+    """Test helper: every API route must declare a budget and stay within it.
+
+    `samples` maps (method, full path) to the keyword arguments for client.request(), a list
+    of them sent in order, or a callable returning either, called once per pass for values
+    that must differ between passes (an Idempotency-Key). The app must have been built with
+    QUERY_BUDGETS=warn or raise. Every sample runs once unchecked to warm caches and bootstrap
+    rows, then again with enforcement raising, so a route over budget fails with the statement
+    that broke it.
+    """
+    global QUERY_BUDGETS_MODE
+
+    if not _installed:
+        raise RuntimeError("Query budgets are not installed: build the app with QUERY_BUDGETS=raise")
+    missing = unbudgeted_routes(app)
+    if missing:
+        raise QueryBudgetExceeded(f"Routes without a declared query budget: {missing}")
+    mounted = {(m, r.path) for r in _api_routes(app) for m in r.methods}
+    untested = sorted(f"{m} {p}" for m, p in mounted - set(samples))
+    if untested:
+        raise QueryBudgetExceeded(f"Routes without a sample request: {untested}")
+
+    previous = QUERY_BUDGETS_MODE
+    try:
+        for mode in ("off", "raise"):
+            QUERY_BUDGETS_MODE = mode
+            for (method, path), sample in sorted(samples.items()):
+                sample = sample() if callable(sample) else sample
+                for kwargs in sample if isinstance(sample, list) else [sample]:
+                    resp = client.request(method, path, **kwargs)
+                    if resp.status_code >= 400:
+                        raise QueryBudgetExceeded(f"{method} {path} failed with {resp.status_code}: {resp.text}")
+    finally:
+        QUERY_BUDGETS_MODE = previous
+
+
+def _log_writes(base: dict, spike: dict) -> list:
+    """Log writes by a household new to this pass: a keyed first write, four more of `base`
+    to give its baseline the samples anomaly scoring needs, a keyed `spike` that gets
+    flagged, and that request's replay."""
+    household = {"X-Household-ID": f"budget-check-{uuid.uuid4().hex[:16]}"}
+    first = dict(household, **{"Idempotency-Key": str(uuid.uuid4())})
+    keyed = dict(household, **{"Idempotency-Key": str(uuid.uuid4())})
+    return ([{"json": base, "headers": first}] + [{"json": base, "headers": household}] * 4
+            + [{"json": spike, "headers": keyed}] * 2)
+
+
+def _batches() -> list:
+    """A full batch for a household new to this pass, then a full batch that adds an
+    appliance it hasn't logged and one flagged entry."""
+    household = {"X-Household-ID": f"budget-check-{uuid.uuid4().hex[:16]}"}
+    known = [{"appliance_type": a, "hours": 4} for a in ("ac", "fan", "fridge", "light", "tv", "washer", "heater")]
+    first = (known * 15)[:100]
+    second = first[:98] + [{"appliance_type": "geyser", "hours": 1}, {"appliance_type": "ac", "hours": 24}]
+    return [{"json": first, "headers": household}, {"json": second, "headers": household}]
+
+
+SAMPLE_REQUESTS = {
+    ("GET", "/"): {},
+    ("GET", "/api/health"): {},
+    ("GET", "/api/stats"): {},
+    ("GET", "/api/metrics"): {},
+    ("POST", "/api/electricity/calculate"): lambda: _log_writes({"appliance_type": "ac", "hours": 1},
+                                                                 {"appliance_type": "ac", "hours": 24}),
+    ("POST", "/api/electricity/calculate/batch"): _batches,
+    ("POST", "/api/electricity/simulate"): {"json": {"appliance_type": "ac", "hours": [2, 4, 8]}},
+    ("POST", "/api/water/calculate"): lambda: _log_writes({"activity": "shower", "flow_rate": 9, "duration": 2},
+                                                           {"activity": "shower", "flow_rate": 9, "duration": 60}),
+    ("POST", "/api/water/simulate"): {"json": {"activity": "shower", "flow_rate": [6, 9], "duration": 8}},
+    ("POST", "/api/cleaning/analyze"): lambda: _log_writes({"product_type": "bleach", "usage_frequency": "weekly"},
+                                                            {"product_type": "bleach", "usage_frequency": "daily"}),
+    ("GET", "/api/analysis/history"): {"params": {"limit": 5}},
+    ("GET", "/api/analysis/summary"): {},
+    ("GET", "/api/analysis/trends"): {"params": {"bucket": "week"}},
+    ("GET", "/api/analysis/export"): {"params": {"table": "electricity", "format": "ndjson"}},
+    ("GET", "/api/analysis/anomalies"): {"params": {"limit": 5}},
+    ("GET", "/api/achievements"): {},
+    ("POST", "/api/import"): {"params": {"table": "electricity", "format": "csv"},
+                              "content": "appliance_type,hours,created_at\nac,6,2025-01-15T20:00:00\n"},
+}
+
+
+def main(argv=None):
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Check every route against its declared query budget")
+    parser.add_argument("command", choices=["check"])
+    parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="ecosense-budget-") as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'budget.db')}"
+        os.environ["QUERY_BUDGETS"] = "raise"
+        os.environ["RESPONSE_CACHE"] = "0"  # measure the queries, not the cache
+        os.environ["WRITE_BEHIND"] = "0"
+        os.environ["ANOMALY_MIN_SAMPLES"] = "5"  # the samples' sixth log write is the one flagged
+        from fastapi.testclient import TestClient
+        import main as app_module
+        import query_budget  # the module the app registered with, not this __main__ copy
+
+        with TestClient(app_module.app) as client:
+            query_budget.assert_query_budgets(app_module.app, client, SAMPLE_REQUESTS)
+    print(f"✅ All {len(SAMPLE_REQUESTS)} routes within their query budgets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Response cache with strong ETags for the dashboard's polled GET endpoints.
+
+Entries are keyed by household + route path + query string and hold the serialized
+JSON body. They are valid until the TTL expires or their household's write version
+moves — every commit that inserts log rows bumps it for the households it wrote to —
+so a poll with a matching If-None-Match is answered 304 without touching the database
+or re-serializing the Pydantic models, and one household's writes never evict another's.
+
+Cached or not, the body is serialized exactly once and returned as a Response, so FastAPI
+doesn't validate and encode it a second time against the route's response_model (which
+still documents the schema in OpenAPI). Builders return either the Pydantic model or, on
+the hottest routes, plain dicts in the schema's field order, which go through orjson.
+
+Entries are per worker, but the write versions and the hit / miss counters live in
+shared_state, so a write served by one gunicorn worker invalidates every worker's copy.
+Households are hashed onto RESPONSE_CACHE_HOUSEHOLD_SLOTS version slots; two households
+sharing a slot only invalidate each other's entries now and then.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional, Union
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+from log_hooks import on_logs_committed
+from shared_state import SharedStats, shared
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+RESPONSE_CACHE_HOUSEHOLD_SLOTS = int(os.getenv("RESPONSE_CACHE_HOUSEHOLD_SLOTS", "4096"))
+
+
+Payload = Union[BaseModel, dict]
+
+
+def render(payload: Payload) -> bytes:
+    """JSON body of a route's response: the model's own serializer, or orjson for dicts
+    built straight from rows (same output for the str / int / float / datetime they hold)."""
+    if isinstance(payload, BaseModel):
+        return payload.model_dump_json().encode()
+    return orjson.dumps(payload)
+
+
+def json_response(payload: Payload) -> Response:
+    return Response(content=render(payload), media_type="application/json")
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+                 enabled: bool = RESPONSE_CACHE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        # Slot 0: global write version; then one slot per hashed household
+        self._versions = shared.array("response_cache:versions", 1 + RESPONSE_CACHE_HOUSEHOLD_SLOTS)
+        # key -> (write_version, expires_at, etag, body)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = SharedStats("response_cache", {
+            "hits": "count", "misses": "count", "not_modified": "count", "evictions": "count",
+        })
+
+    @property
+    def write_version(self) -> int:
+        return self._versions.get(0)
+
+    def bump(self, households: Optional[Iterable[str]] = None):
+        """Invalidate the entries of these households (all entries when None), in every
+        worker; called after each commit that wrote log rows."""
+        if households is None:
+            self._versions.add(0)
+            return
+        v = self._versions
+        with v.locked():
+            for slot in {v.slot(household, start=1) for household in households}:
+                v.set(slot, v.get(slot) + 1)
+
+    def _version(self, household: Optional[str]) -> tuple:
+        v = self._versions
+        return v.get(0), v.get(v.slot(household or "", start=1))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        s = self._stats.snapshot()
+        with self._lock:
+            s["entries"] = len(self._entries)
+        s["enabled"] = self.enabled
+        s["capacity"] = self.max_entries
+        s["write_version"] = self.write_version
+        lookups = s["hits"] + s["misses"]
+        s["hit_ratio"] = round(s["hits"] / lookups, 3) if lookups else 0.0
+        return s
+
+    @staticmethod
+    def _key(request: Request) -> tuple:
+        # request.state.household is set by the households.current_household dependency
+        return (getattr(request.state, "household", None), request.url.path,
+                tuple(sorted(request.query_params.multi_items())))
+
+    @staticmethod
+    def _etag_matches(request: Request, etag: str) -> bool:
+        header = request.headers.get("if-none-match")
+        if not header:
+            return False
+        candidates = [c.strip() for c in header.split(",")]
+        return "*" in candidates or etag in candidates
+
+    @staticmethod
+    def _response(request: Request, etag: str, body: bytes) -> Response:
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if ResponseCache._etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def _lookup(self, key: tuple) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, expires_at, etag, body = entry
+                if version != self._version(key[0]) or expires_at < time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+        if entry is None:
+            self._stats.incr("misses")
+            return None
+        self._stats.incr("hits")
+        return etag, body
+
+    def _store(self, key: tuple, version: tuple, payload: Payload) -> tuple:
+        body = render(payload)
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, etag, body)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._stats.incr("evictions", evicted)
+        return etag, body
+
+    def _count_not_modified(self, request: Request, etag: str):
+        if self._etag_matches(request, etag):
+            self._stats.incr("not_modified")
+
+    def serve(self, request: Request, build: Callable[[], Payload]) -> Response:
+        """Return the cached body for this request, or build(), cache and return it."""
+        if not self.enabled:
+            return json_response(build())
+        key = self._key(request)
+        cached = self._lookup(key)
+        if cached is None:
+            # Read the version before building, so a write racing the build invalidates it
+            version = self._version(key[0])
+            cached = self._store(key, version, build())
+        self._count_not_modified(request, cached[0])
+        return self._response(request, *cached)
+
+    async def serve_async(self, request: Request, build: Callable[[], Awaitable[Payload]]) -> Response:
+        if not self.enabled:
+            return json_response(await build())
+        key = self._key(request)
+        cached = self._lookup(key)
+        if cached is None:
+            version = self._version(key[0])
+            cached = self._store(key, version, await build())
+        self._count_not_modified(request, cached[0])
+        return self._response(request, *cached)
+
+
+response_cache = ResponseCache()
+on_logs_committed(response_cache.bump)
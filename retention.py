@@ -0,0 +1,286 @@
+"""Retention: compact old raw log rows into monthly per-item archives.
+
+Raw rows older than RETENTION_DAYS (rounded down to a month boundary) are folded into
+one `log_archives` row per (household, month, category, appliance / activity / product) holding
+the counts and sums the running totals are made of, then deleted. The totals and
+rollup rows are left alone, so /summary, /trends and badge progress read exactly the
+same afterwards, while history and export only cover what is still raw. `python
+totals.py verify` and `python rollups.py backfill` take the archives into account.
+
+The job runs in transactions of RETENTION_BATCH_ROWS rows, each archiving and deleting
+the same rows, so it never holds the write lock for long and can stop at any point.
+Freed SQLite pages are reused by new inserts, so the file stops growing; VACUUM in a
+maintenance window gives the space back to the OS.
+
+    RETENTION_DAYS=365              # 0 (default) keeps raw rows forever
+    RETENTION_INTERVAL_HOURS=24     # how often the app runs the job
+
+Under gunicorn every worker starts the job, but only the one holding the shared_state
+leader lock runs it; the others retry the lock every RETENTION_LEADER_RETRY_SECONDS,
+so the job moves to another worker when its leader exits.
+
+    python retention.py compact --days 365 [--dry-run]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import CleaningLog, ElectricityLog, LogArchive, WaterLog
+from shared_state import SharedStats, shared
+
+logger = logging.getLogger("ecosense.retention")
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+RETENTION_BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "1000"))
+RETENTION_PAUSE_MS = int(os.getenv("RETENTION_PAUSE_MS", "10"))  # between batches, lets request writes in
+RETENTION_LEADER_RETRY_SECONDS = float(os.getenv("RETENTION_LEADER_RETRY_SECONDS", "60"))
+
+ARCHIVE_METRICS = ("entry_count", "kwh", "cost", "carbon_kg", "liters", "efficient_count", "good_water_count")
+
+# category -> (model, SELECT of id, household, created_at, item type, then the columns _metrics reads)
+_SOURCES = {
+    "electricity": (ElectricityLog, select(
+        ElectricityLog.id, ElectricityLog.household_id, ElectricityLog.created_at, ElectricityLog.appliance_type,
+        ElectricityLog.monthly_kwh, ElectricityLog.monthly_cost, ElectricityLog.carbon_kg, ElectricityLog.efficiency,
+    )),
+    "water": (WaterLog, select(
+        WaterLog.id, WaterLog.household_id, WaterLog.created_at, WaterLog.activity_type, WaterLog.monthly_cost,
+        WaterLog.monthly_liters, WaterLog.comparison_rating,
+    )),
+    "cleaning": (CleaningLog, select(
+        CleaningLog.id, CleaningLog.household_id, CleaningLog.created_at, CleaningLog.product_type,
+    )),
+}
+
+
+def _metrics(category: str, row) -> tuple:
+    """ARCHIVE_METRICS of one raw row, in the same terms as totals._batch_deltas."""
+    if category == "electricity":
+        return 1, row[4], row[5], row[6], 0.0, int(row[7] == "Efficient"), 0
+    if category == "water":
+        return 1, 0.0, row[4], 0.0, row[5], 0, int(row[6] == "Good")
+    return 1, 0.0, 0.0, 0.0, 0.0, 0, 0
+
+
+def cutoff_for(days: int, now: Optional[datetime] = None) -> datetime:
+    """Rows created before this are compacted: `days` ago, rounded down to the month start."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    day = (now - timedelta(days=days)).date()
+    return datetime(day.year, day.month, 1)
+
+
+def _merge_archives(conn, acc: Dict[Tuple[str, date, str, str], list]):
+    """Add the accumulated sums into log_archives: one executemany UPDATE, one INSERT."""
+    t = LogArchive.__table__
+    months = [key[1] for key in acc]
+    existing = set(tuple(row) for row in conn.execute(
+        select(t.c.household_id, t.c.month, t.c.category, t.c.item_type).where(
+            t.c.household_id.in_({key[0] for key in acc}),
+            t.c.month.between(min(months), max(months)),
+            t.c.category.in_({key[2] for key in acc}),
+        )
+    ))
+
+    updates = [
+        dict(k_household=key[0], k_month=key[1], k_category=key[2], k_item=key[3],
+             **{f"d_{k}": v for k, v in zip(ARCHIVE_METRICS, m)})
+        for key, m in acc.items() if key in existing
+    ]
+    if updates:
+        conn.execute(
+            update(t)
+            .where(t.c.household_id == bindparam("k_household"), t.c.month == bindparam("k_month"),
+                   t.c.category == bindparam("k_category"), t.c.item_type == bindparam("k_item"))
+            .values({t.c[k]: t.c[k] + bindparam(f"d_{k}") for k in ARCHIVE_METRICS}),
+            updates,
+        )
+    inserts = [
+        dict(household_id=key[0], month=key[1], category=key[2], item_type=key[3],
+             **dict(zip(ARCHIVE_METRICS, m)))
+        for key, m in acc.items() if key not in existing
+    ]
+    if inserts:
+        conn.execute(insert(t), inserts)
+
+
+def compact_batch(db: Session, category: str, cutoff: datetime, limit: int = RETENTION_BATCH_ROWS,
+                  after_id: int = 0) -> Tuple[int, int]:
+    """Archive and delete up to `limit` rows before cutoff with ids above after_id, in
+    one transaction. The scan walks the primary key, since the created_at indexes lead
+    with household_id.
+
+    Returns (rows compacted, the id to resume after); (0, after_id) when nothing is left.
+    """
+    model, stmt = _SOURCES[category]
+    rows = db.execute(
+        stmt.where(model.id > after_id, model.created_at < cutoff).order_by(model.id).limit(limit)
+    ).all()
+    if not rows:
+        db.rollback()
+        return 0, after_id
+
+    ids = [r[0] for r in rows]
+    deleted = db.execute(delete(model).where(model.id.in_(ids))).rowcount
+    if deleted != len(ids):
+        # Another worker compacted some of these rows first: archiving them again
+        # would count them twice
+        db.rollback()
+        raise RuntimeError(f"{category}: {len(ids) - deleted} rows were compacted concurrently")
+
+    acc: Dict[Tuple[str, date, str, str], list] = defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0.0, 0, 0])
+    for row in rows:
+        created = row[2]
+        m = acc[(row[1], date(created.year, created.month, 1), category, row[3])]
+        for i, v in enumerate(_metrics(category, row)):
+            m[i] += v
+    _merge_archives(db.connection(), acc)
+    db.commit()
+    return len(rows), ids[-1]
+
+
+def pending(db: Session, cutoff: datetime) -> Dict[str, int]:
+    """Raw rows per category that a compaction with this cutoff would archive."""
+    return {
+        category: db.execute(select(func.count(model.id)).where(model.created_at < cutoff)).scalar()
+        for category, (model, _) in _SOURCES.items()
+    }
+
+
+def compact(days: int, session_factory=SessionLocal, batch_rows: int = RETENTION_BATCH_ROWS,
+            stop: Optional[threading.Event] = None) -> Dict[str, int]:
+    """Compact every log table batch by batch; returns rows compacted per category."""
+    cutoff = cutoff_for(days)
+    done = {category: 0 for category in _SOURCES}
+    for category in _SOURCES:
+        last_id = 0
+        while stop is None or not stop.is_set():
+            db = session_factory()
+            try:
+                n, last_id = compact_batch(db, category, cutoff, batch_rows, last_id)
+            finally:
+                db.close()
+            done[category] += n
+            if n < batch_rows:
+                break
+            if RETENTION_PAUSE_MS:
+                time.sleep(RETENTION_PAUSE_MS / 1000)
+    if any(done.values()):
+        from response_cache import response_cache
+
+        response_cache.bump()  # history and export pages of any household just lost rows
+    return done
+
+
+class RetentionJob:
+    """Runs compact() every RETENTION_INTERVAL_HOURS in a background thread."""
+
+    def __init__(self, days: int = RETENTION_DAYS, interval_hours: float = RETENTION_INTERVAL_HOURS):
+        self.days = days
+        self.interval = interval_hours * 3600
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Epoch seconds for the two timestamps; 0 until the first run
+        self._stats = SharedStats("retention", {
+            "runs": "count",
+            "failed_runs": "count",
+            "rows_compacted": "count",
+            "last_run_at": "last",
+            "last_run_ms": "last",
+            "last_cutoff": "last",
+        })
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.days <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ecosense-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop after the batch in progress (every batch is its own transaction)."""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        s = self._stats.snapshot()
+        s["last_run_at"] = (datetime.fromtimestamp(s["last_run_at"], timezone.utc).isoformat(timespec="seconds")
+                            if s["last_run_at"] else None)
+        s["last_run_ms"] = round(s["last_run_ms"], 3)
+        s["last_cutoff"] = (datetime.fromtimestamp(s["last_cutoff"], timezone.utc).date().isoformat()
+                            if s["last_cutoff"] else None)
+        s["retention_days"] = self.days
+        s["running"] = self.running
+        return s
+
+    def run_once(self):
+        started = time.perf_counter()
+        ok = True
+        try:
+            done = compact(self.days, stop=self._stop)
+        except Exception:
+            logger.exception("retention run failed")
+            ok = False
+            done = {}
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if any(done.values()):
+            logger.info("retention: compacted %s rows older than %s", done, cutoff_for(self.days).date())
+        cutoff = cutoff_for(self.days).replace(tzinfo=timezone.utc)
+        self._stats.record(runs=1, failed_runs=not ok, rows_compacted=sum(done.values()), last_run_at=time.time(),
+                           last_run_ms=elapsed_ms, last_cutoff=cutoff.timestamp())
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not shared.leader("retention"):
+                self._stop.wait(min(self.interval, RETENTION_LEADER_RETRY_SECONDS))
+                continue
+            self.run_once()
+            self._stop.wait(self.interval)
+
+
+job = RetentionJob()
+
+
+def main(argv=None):
+    from bootstrap import ensure_schema
+
+    parser = argparse.ArgumentParser(description="Compact old EcoSense raw logs into monthly archives")
+    parser.add_argument("command", choices=["compact"])
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS or None, required=not RETENTION_DAYS,
+                        help="keep raw rows for this many days (default: RETENTION_DAYS)")
+    parser.add_argument("--batch-rows", type=int, default=RETENTION_BATCH_ROWS)
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would be compacted")
+    args = parser.parse_args(argv)
+
+    ensure_schema()
+    cutoff = cutoff_for(args.days)
+    if args.dry_run:
+        db = SessionLocal()
+        try:
+            counts = pending(db, cutoff)
+        finally:
+            db.close()
+        print(f"Rows older than {cutoff.date()}: " + ", ".join(f"{k}={v:,}" for k, v in counts.items()))
+        return 0
+    done = compact(args.days, batch_rows=args.batch_rows)
+    print(f"✅ Compacted rows older than {cutoff.date()}: " + ", ".join(f"{k}={v:,}" for k, v in done.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""Time-bucketed rollups behind /api/analysis/trends.
+
+Every log insert adds its kWh / cost / carbon / liters into its household's
+`usage_rollups` row per bucket size (day, week, month) in the same transaction — one UPDATE covers all three
+in the steady state, and a batch spanning many days (bulk import) costs three statements
+— so a year of daily points is a few hundred pre-aggregated rows instead of a scan of
+the raw logs.
+
+Backfill (or rebuild) from the existing raw logs:
+    python rollups.py backfill
+"""
+import argparse
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import and_, bindparam, delete, func, inspect, insert, or_, select, update
+from sqlalchemy.orm import Session
+from database import insert_or_update
+from log_hooks import LogBatch, on_logs_inserted
+from models import CleaningLog, ElectricityLog, LogArchive, UsageRollup, WaterLog
+from query_budget import first_write
+
+BUCKETS = ("day", "week", "month")
+METRICS = ("entry_count", "kwh", "cost", "carbon_kg", "liters")
+KEY_COLUMNS = ("household_id", "bucket", "bucket_start", "category", "item_type")  # uq_usage_rollups_key
+
+RollupKey = Tuple[str, str, date, str, str]  # (household_id, bucket, bucket_start, category, item_type)
+
+
+def bucket_start(bucket: str, day: date) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())  # ISO week, starting Monday
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _created_day(obj) -> date:
+    # created_at is a server default, so freshly flushed rows usually don't carry it;
+    # CURRENT_TIMESTAMP is UTC, so fall back to today's UTC date
+    created = inspect(obj).dict.get("created_at")
+    if isinstance(created, datetime):
+        return created.date()
+    return datetime.now(timezone.utc).date()
+
+
+def _accumulate(acc: Dict[RollupKey, list], household: str, day: date, category: str, item_type: str,
+                kwh: float = 0.0, cost: float = 0.0, carbon_kg: float = 0.0, liters: float = 0.0):
+    for bucket in BUCKETS:
+        m = acc[(household, bucket, bucket_start(bucket, day), category, item_type)]
+        m[0] += 1
+        m[1] += kwh
+        m[2] += cost
+        m[3] += carbon_kg
+        m[4] += liters
+
+
+def _new_acc() -> Dict[RollupKey, list]:
+    return defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0.0])
+
+
+@on_logs_inserted
+def apply_batch(conn, batch: LogBatch):
+    # A log adds the same amounts to its day, week and month rows, so group by
+    # (household, day, category, item_type) and update all three bucket rows in one statement
+    groups: Dict[Tuple[str, date, str, str], list] = defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0.0])
+    for e in batch.electricity:
+        m = groups[(e.household_id, _created_day(e), "electricity", e.appliance_type)]
+        m[0] += 1
+        m[1] += e.monthly_kwh
+        m[2] += e.monthly_cost
+        m[3] += e.carbon_kg
+    for w in batch.water:
+        m = groups[(w.household_id, _created_day(w), "water", w.activity_type)]
+        m[0] += 1
+        m[2] += w.monthly_cost
+        m[4] += w.monthly_liters
+    for c in batch.cleaning:
+        groups[(c.household_id, _created_day(c), "cleaning", c.product_type)][0] += 1
+
+    if len(groups) > 1:
+        _apply_groups(conn, groups)
+        return
+    t = UsageRollup.__table__
+    for (household, day, category, item_type), m in groups.items():
+        starts = {bucket: bucket_start(bucket, day) for bucket in BUCKETS}
+        key = and_(
+            t.c.household_id == household,
+            t.c.category == category,
+            t.c.item_type == item_type,
+            or_(*(and_(t.c.bucket == bucket, t.c.bucket_start == start) for bucket, start in starts.items())),
+        )
+        result = conn.execute(update(t).where(key).values({t.c[k]: t.c[k] + v for k, v in zip(METRICS, m)}))
+        if result.rowcount == len(BUCKETS):
+            continue
+        # First entry of a new day/week/month: the rows that existed were just updated,
+        # create the missing ones
+        first_write()
+        existing = set(conn.execute(select(t.c.bucket).where(key)).scalars())
+        _insert_or_add(conn, [
+            dict(household_id=household, bucket=bucket, bucket_start=start, category=category,
+                 item_type=item_type, **dict(zip(METRICS, m)))
+            for bucket, start in starts.items() if bucket not in existing
+        ])
+
+
+def _insert_or_add(conn, rows: list):
+    # A concurrent transaction may create the same new bucket row: add into it instead
+    t = UsageRollup.__table__
+    insert_or_update(conn, t, rows, KEY_COLUMNS,
+                     lambda inserted: [(t.c[k], t.c[k] + inserted[k]) for k in METRICS])
+
+
+def _apply_groups(conn, groups: Dict[Tuple[str, date, str, str], list]):
+    """Batches spanning several groups (batch route, bulk imports of backdated readings):
+    fold them into bucket rows, find the existing ones with one range query, then one
+    executemany UPDATE and one executemany INSERT, however many days the batch covers."""
+    acc = _new_acc()
+    for (household, day, category, item_type), m in groups.items():
+        for bucket in BUCKETS:
+            row = acc[(household, bucket, bucket_start(bucket, day), category, item_type)]
+            for i, v in enumerate(m):
+                row[i] += v
+
+    t = UsageRollup.__table__
+    starts = [key[2] for key in acc]
+    existing = set(tuple(row) for row in conn.execute(
+        select(t.c.household_id, t.c.bucket, t.c.bucket_start, t.c.category, t.c.item_type).where(
+            t.c.household_id.in_({key[0] for key in acc}),
+            t.c.bucket_start.between(min(starts), max(starts)),
+            t.c.category.in_({key[3] for key in acc}),
+        )
+    ))
+
+    updates = [
+        dict(k_household=key[0], k_bucket=key[1], k_start=key[2], k_category=key[3], k_item=key[4],
+             **{f"d_{k}": v for k, v in zip(METRICS, m)})
+        for key, m in acc.items() if key in existing
+    ]
+    if updates:
+        conn.execute(
+            update(t)
+            .where(t.c.household_id == bindparam("k_household"), t.c.bucket == bindparam("k_bucket"),
+                   t.c.bucket_start == bindparam("k_start"),
+                   t.c.category == bindparam("k_category"), t.c.item_type == bindparam("k_item"))
+            .values({t.c[k]: t.c[k] + bindparam(f"d_{k}") for k in METRICS}),
+            updates,
+        )
+    inserts = [
+        dict(household_id=key[0], bucket=key[1], bucket_start=key[2], category=key[3], item_type=key[4],
+             **dict(zip(METRICS, m)))
+        for key, m in acc.items() if key not in existing
+    ]
+    if inserts:
+        _insert_or_add(conn, inserts)
+
+
+def _month_query(household: str, category: str):
+    r = UsageRollup
+    column = r.kwh if category == "electricity" else r.liters
+    month = bucket_start("month", datetime.now(timezone.utc).date())
+    return select(func.coalesce(func.sum(column), 0.0)).where(
+        r.household_id == household, r.bucket == "month", r.bucket_start == month, r.category == category)
+
+
+def month_total(db: Session, household: str, category: str) -> float:
+    """kWh (electricity) or liters (water) of the household's entries logged this UTC month."""
+    return float(db.execute(_month_query(household, category)).scalar())
+
+
+async def month_total_async(db, household: str, category: str) -> float:
+    return float((await db.execute(_month_query(household, category))).scalar())
+
+
+def _scan(db: Session) -> Iterable[tuple]:
+    """Stream (household_id, created_at, category, item_type, kwh, cost, carbon, liters) from the raw logs."""
+    queries = (
+        ("electricity", select(ElectricityLog.household_id, ElectricityLog.created_at, ElectricityLog.appliance_type,
+                               ElectricityLog.monthly_kwh, ElectricityLog.monthly_cost, ElectricityLog.carbon_kg)),
+        ("water", select(WaterLog.household_id, WaterLog.created_at, WaterLog.activity_type, WaterLog.monthly_cost,
+                         WaterLog.monthly_liters)),
+        ("cleaning", select(CleaningLog.household_id, CleaningLog.created_at, CleaningLog.product_type)),
+    )
+    for category, stmt in queries:
+        for row in db.execute(stmt.execution_options(yield_per=5000)):
+            if category == "electricity":
+                yield row[0], row[1], category, row[2], row[3], row[4], row[5], 0.0
+            elif category == "water":
+                yield row[0], row[1], category, row[2], 0.0, row[3], 0.0, row[4]
+            else:
+                yield row[0], row[1], category, row[2], 0.0, 0.0, 0.0, 0.0
+
+
+def _archive_horizon(db: Session) -> Optional[date]:
+    """First day after the months the retention job has compacted, or None."""
+    last = db.execute(select(func.max(LogArchive.month))).scalar()
+    if last is None:
+        return None
+    return (last.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def backfill(db: Session) -> int:
+    """Rebuild the rollup rows from the raw logs in one transaction; returns the row count.
+
+    Rows starting before the retention job's horizon are kept as they are: their raw
+    logs are gone (only monthly archives remain), so they can't be recomputed.
+    """
+    horizon = _archive_horizon(db)
+    acc = _new_acc()
+    for household, created_at, category, item_type, kwh, cost, carbon_kg, liters in _scan(db):
+        day = created_at.date() if created_at else datetime.now(timezone.utc).date()
+        _accumulate(acc, household, day, category, item_type, kwh=kwh, cost=cost, carbon_kg=carbon_kg,
+                    liters=liters)
+
+    if horizon is None:
+        db.execute(delete(UsageRollup))
+    else:
+        db.execute(delete(UsageRollup).where(UsageRollup.bucket_start >= horizon))
+    rows = [
+        dict(household_id=key[0], bucket=key[1], bucket_start=key[2], category=key[3], item_type=key[4],
+             **dict(zip(METRICS, m)))
+        for key, m in acc.items()
+        if horizon is None or key[2] >= horizon
+    ]
+    if rows:
+        db.execute(insert(UsageRollup), rows)
+    db.commit()
+    return len(rows)
+
+
+def main(argv=None):
+    from bootstrap import ensure_schema
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Backfill the EcoSense trend rollups")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args(argv)
+
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        print(f"✅ Rollups rebuilt: {backfill(db)} rows")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
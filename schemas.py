@@ -1,6 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Union
+from datetime import date, datetime
+
+# saved_id on the calculate/analyze responses is None when the server runs in
+# write-behind mode (WRITE_BEHIND=1): the row was queued and will be committed
+# by the background flusher within WRITE_BEHIND_INTERVAL_MS. Call with
+# ?durable=true to wait for the commit and get the real id back.
 
 
 # ─────────────────────────────────────────────────
@@ -12,7 +17,11 @@ class ElectricityRequest(BaseModel):
     hours: float = Field(..., ge=0, le=24)
     days_per_week: int = Field(7, ge=1, le=7)
     occupancy: float = Field(1.0, ge=0, le=1)
-    tariff: float = Field(6.0, ge=1, le=50)
+    # Flat ₹/kWh; without one the region's slab / time-of-use schedule applies (tariffs.py), on top of the
+    # household's month-to-date kWh (from zero for the shared default household)
+    tariff: Optional[float] = Field(None, ge=1, le=50)
+    region: Optional[str] = Field(None, max_length=32, example="IN-MH")
+    start_hour: Optional[float] = Field(None, ge=0, lt=24)  # when the daily use starts, for time-of-use bands
 
 
 class ElectricityResponse(BaseModel):
@@ -23,9 +32,69 @@ class ElectricityResponse(BaseModel):
     waste_percentage: float
     wasted_kwh: float
     tips: List[str]
+    percentile: Optional[float] = None  # % of logged entries of this appliance below monthly_kwh (sketches.py)
+    # monthly_kwh against this household's history of the appliance (anomalies.py)
+    anomaly: bool = False
+    z_score: Optional[float] = None
+    region: Optional[str] = None
+    tariff_version: Optional[str] = None  # schedule behind monthly_cost; null for a flat `tariff`
     saved_id: Optional[int] = None
 
 
+class BatchItemError(BaseModel):
+    index: int
+    detail: str
+
+
+class ElectricityBatchResponse(BaseModel):
+    # Aligned with the request list; failed items are null and listed in `errors`
+    results: List[Optional[ElectricityResponse]]
+    errors: List[BatchItemError]
+
+
+# ─────────────────────────────────────────────────
+# What-if simulation (nothing is saved)
+# ─────────────────────────────────────────────────
+class SweepRange(BaseModel):
+    start: float
+    stop: float
+    step: float = Field(..., gt=0)
+
+
+# A swept parameter: one value, an explicit list, or an inclusive start/stop/step range
+Sweep = Union[float, List[float], SweepRange]
+
+
+class ElectricitySimulationRequest(BaseModel):
+    appliance_type: str = Field(..., example="ac")
+    hours: Sweep = Field(..., example={"start": 1, "stop": 12, "step": 1})
+    occupancy: Sweep = 1.0
+    count: Sweep = 1
+    # Flat ₹/kWh; without one every point is priced by the region's schedule, as /calculate does
+    tariff: Optional[Sweep] = None
+    days_per_week: int = Field(7, ge=1, le=7)
+    region: Optional[str] = Field(None, max_length=32, example="IN-MH")
+    start_hour: Optional[float] = Field(None, ge=0, lt=24)
+    month_kwh: float = Field(0, ge=0)  # already used this month, which the points are billed on top of
+
+
+class ElectricitySimulationResponse(BaseModel):
+    # Column-oriented: entry i of every list belongs to grid point i
+    appliance_type: str
+    points: int
+    hours: List[float]
+    occupancy: List[float]
+    count: List[float]
+    tariff: List[float]  # ₹/kWh each point is billed at
+    monthly_kwh: List[float]
+    monthly_cost: List[float]
+    carbon_kg: List[float]
+    waste_percentage: List[float]
+    efficiency: List[str]
+    region: str
+    tariff_version: Optional[str] = None  # schedule behind monthly_cost; null for a flat `tariff`
+
+
 # ─────────────────────────────────────────────────
 # Water
 # ─────────────────────────────────────────────────
@@ -35,7 +104,10 @@ class WaterRequest(BaseModel):
     duration: float = Field(..., ge=1, le=120)
     sessions: int = Field(1, ge=1, le=20)
     days_per_week: int = Field(7, ge=1, le=7)
-    water_rate: float = Field(10.0, ge=1, le=200)
+    # Flat ₹/kL; without one the region's slab schedule applies (tariffs.py), on top of the household's
+    # month-to-date liters (from zero for the shared default household)
+    water_rate: Optional[float] = Field(None, ge=1, le=200)
+    region: Optional[str] = Field(None, max_length=32, example="IN-MH")
 
 
 class WaterResponse(BaseModel):
@@ -46,9 +118,43 @@ class WaterResponse(BaseModel):
     comparison_desc: str
     ratio: float
     tips: List[str]
+    percentile: Optional[float] = None  # % of logged entries of this activity below daily_liters (sketches.py)
+    # daily_liters against this household's history of the activity (anomalies.py)
+    anomaly: bool = False
+    z_score: Optional[float] = None
+    region: Optional[str] = None
+    tariff_version: Optional[str] = None  # schedule behind monthly_cost; null for a flat `water_rate`
     saved_id: Optional[int] = None
 
 
+class WaterSimulationRequest(BaseModel):
+    activity: str = Field(..., example="shower")
+    flow_rate: Sweep = Field(..., example=[6, 9, 12])
+    duration: Sweep = Field(..., example={"start": 2, "stop": 20, "step": 1})
+    sessions: Sweep = 1
+    days_per_week: int = Field(7, ge=1, le=7)
+    # Flat ₹/kL; without one every point is priced by the region's slab schedule, as /calculate does
+    water_rate: Optional[float] = Field(None, ge=1, le=200)
+    region: Optional[str] = Field(None, max_length=32, example="IN-MH")
+    month_liters: float = Field(0, ge=0)  # already used this month, which the points are billed on top of
+
+
+class WaterSimulationResponse(BaseModel):
+    activity: str
+    points: int
+    flow_rate: List[float]
+    duration: List[float]
+    sessions: List[float]
+    daily_liters: List[float]
+    monthly_liters: List[float]
+    monthly_cost: List[float]
+    water_rate: List[float]  # ₹/kL each point is billed at
+    ratio: List[float]
+    comparison_rating: List[str]
+    region: str
+    tariff_version: Optional[str] = None  # schedule behind monthly_cost; null for a flat `water_rate`
+
+
 # ─────────────────────────────────────────────────
 # Cleaning
 # ─────────────────────────────────────────────────
@@ -96,10 +202,26 @@ class WaterHistoryItem(BaseModel):
         from_attributes = True
 
 
+class CleaningHistoryItem(BaseModel):
+    id: int
+    product_type: str
+    usage_frequency: str
+    rooms: int
+    eco_score: int
+    chemical_load: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class AnalysisHistoryResponse(BaseModel):
     electricity: List[ElectricityHistoryItem]
     water: List[WaterHistoryItem]
+    cleaning: List[CleaningHistoryItem] = []
     total_records: int
+    # Opaque keyset cursor for the next page; null once every list is exhausted
+    next_cursor: Optional[str] = None
 
 
 class AnalysisSummaryResponse(BaseModel):
@@ -113,6 +235,38 @@ class AnalysisSummaryResponse(BaseModel):
     cleaning_count: int
 
 
+class TrendPoint(BaseModel):
+    bucket_start: date
+    category: str
+    entry_count: int
+    kwh: float
+    cost: float
+    carbon_kg: float
+    liters: float
+
+
+class TrendsResponse(BaseModel):
+    bucket: str
+    points: List[TrendPoint]
+
+
+class AnomalyItem(BaseModel):
+    id: int
+    category: str
+    item_type: str
+    log_id: Optional[int] = None
+    value: float          # monthly_kwh / daily_liters
+    baseline_mean: float  # the household's mean for the item before this entry
+    z_score: float
+    created_at: datetime
+
+
+class AnomaliesResponse(BaseModel):
+    anomalies: List[AnomalyItem]
+    # Pass as ?before= for the next (older) page; null on the last one
+    next_before: Optional[int] = None
+
+
 # ─────────────────────────────────────────────────
 # Achievements
 # ─────────────────────────────────────────────────
@@ -135,3 +289,20 @@ class AchievementsResponse(BaseModel):
     achievements: List[AchievementOut]
     unlocked_count: int
     total_count: int
+    current_streak: int = 0   # consecutive active days up to today (or yesterday)
+    longest_streak: int = 0
+
+
+# ─────────────────────────────────────────────────
+# Bulk import
+# ─────────────────────────────────────────────────
+class ImportReport(BaseModel):
+    table: str
+    rows_read: int
+    imported: int
+    rejected: int
+    chunks: int
+    seconds: float
+    errors: List[BatchItemError]  # index = data row number in the file, first IMPORT_MAX_ERRORS only
+    errors_truncated: bool = False
+    error: Optional[str] = None  # why the import stopped early; rows_read covers the committed chunks
@@ -0,0 +1,203 @@
+"""Counters and versions shared by every worker process of one server.
+
+Under gunicorn each worker is its own process, so module-level dicts only describe the
+worker that happens to answer: a write in one worker must invalidate response-cache
+entries in all of them, /api/stats should add up the whole server, and rate limits must
+count every worker's requests. Such state lives here instead, as named arrays of 8-byte
+slots (int64 or float64) in one memory-mapped file that all workers map.
+
+  * reads are a plain memory read, no lock and no syscall;
+  * updates take a threading lock plus a POSIX record lock on the file, so a
+    read-modify-write (an increment, a token-bucket refill) is atomic across workers;
+  * arrays are found by name in a small directory at the head of the file, so workers
+    agree on the layout whatever order they import modules in;
+  * leader(name) elects one worker for jobs that must run once per server (retention);
+    the lock is the OS's, so it moves on when the leader dies.
+
+SHARED_STATE_PATH  file to map; gunicorn.conf.py creates a fresh one per server.
+                   Unset (uvicorn, CLIs, tests): anonymous memory, same API, per process.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Optional, Sequence
+
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH")
+SHARED_STATE_BYTES = int(os.getenv("SHARED_STATE_BYTES", str(1 << 20)))
+
+_MAGIC = b"ECOSHM01"
+_DIR_ENTRIES = 128
+_ENTRY = struct.Struct("<48sqq")   # name, offset, slots
+_HEADER = 16                       # magic, next free offset
+_DATA = _HEADER + _DIR_ENTRIES * _ENTRY.size
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_LEADER_BYTES = 1 << 30            # lock offsets for leader(); beyond the mapped size
+
+
+class SharedRegion:
+    def __init__(self, path: Optional[str] = SHARED_STATE_PATH, size: int = SHARED_STATE_BYTES):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0  # nesting of _locked() in the thread holding it: POSIX locks don't nest
+        self._leading: Dict[str, bool] = {}
+        if path:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._buf = mmap.mmap(self._fd, size, mmap.MAP_SHARED)
+        else:
+            self._fd = None
+            self._buf = mmap.mmap(-1, size, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+        self.size = size
+        with self._locked():
+            if self._buf[:8] != _MAGIC:
+                self._buf[:8] = _MAGIC
+                _INT.pack_into(self._buf, 8, _DATA)
+
+    @property
+    def cross_process(self) -> bool:
+        return self._fd is not None
+
+    def _locked(self):
+        return _Lock(self)
+
+    def array(self, name: str, slots: int) -> "SharedArray":
+        """The named array of `slots` zero-initialised slots, allocated on first use."""
+        raw = name.encode()
+        if len(raw) > 48:
+            raise ValueError(f"shared array name too long: {name}")
+        with self._locked():
+            for i in range(_DIR_ENTRIES):
+                at = _HEADER + i * _ENTRY.size
+                entry, offset, length = _ENTRY.unpack_from(self._buf, at)
+                entry = entry.rstrip(b"\0")
+                if entry == raw:
+                    if length != slots:
+                        raise ValueError(f"shared array {name} exists with {length} slots, not {slots}")
+                    return SharedArray(self, offset, slots)
+                if not entry:
+                    offset = _INT.unpack_from(self._buf, 8)[0]
+                    if offset + slots * 8 > self.size:
+                        raise MemoryError(f"SHARED_STATE_BYTES too small for {name}")
+                    _INT.pack_into(self._buf, 8, offset + slots * 8)
+                    _ENTRY.pack_into(self._buf, at, raw, offset, slots)
+                    return SharedArray(self, offset, slots)
+        raise MemoryError("shared state directory is full")
+
+    def leader(self, name: str) -> bool:
+        """True if this process is (or just became) the one running `name` for the server."""
+        if not self.cross_process:
+            return True
+        with self._thread_lock:
+            if not self._leading.get(name):
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1,
+                                _LEADER_BYTES + zlib.crc32(name.encode()))
+                    self._leading[name] = True
+                except OSError:
+                    return False
+            return True
+
+
+class _Lock:
+    __slots__ = ("region",)
+
+    def __init__(self, region: SharedRegion):
+        self.region = region
+
+    def __enter__(self):
+        region = self.region
+        region._thread_lock.acquire()
+        region._depth += 1
+        if region._depth == 1 and region._fd is not None:
+            fcntl.lockf(region._fd, fcntl.LOCK_EX, 1, 0)
+
+    def __exit__(self, *exc):
+        region = self.region
+        region._depth -= 1
+        if region._depth == 0 and region._fd is not None:
+            fcntl.lockf(region._fd, fcntl.LOCK_UN, 1, 0)
+        region._thread_lock.release()
+
+
+class SharedArray:
+    """Fixed-size array of 8-byte slots in the shared region."""
+
+    def __init__(self, region: SharedRegion, offset: int, slots: int):
+        self.region = region
+        self.offset = offset
+        self.slots = slots
+        self._buf = region._buf
+
+    def locked(self):
+        """Hold the cross-process lock around several reads and writes."""
+        return self.region._locked()
+
+    def get(self, i: int) -> int:
+        return _INT.unpack_from(self._buf, self.offset + i * 8)[0]
+
+    def set(self, i: int, value: int):
+        _INT.pack_into(self._buf, self.offset + i * 8, value)
+
+    def getf(self, i: int) -> float:
+        return _FLOAT.unpack_from(self._buf, self.offset + i * 8)[0]
+
+    def setf(self, i: int, value: float):
+        _FLOAT.pack_into(self._buf, self.offset + i * 8, value)
+
+    def add(self, i: int, n: int = 1) -> int:
+        with self.region._locked():
+            value = self.get(i) + n
+            self.set(i, value)
+        return value
+
+    def slot(self, key: str, start: int = 0) -> int:
+        """Slot for a key hashed into [start, slots): collisions share a slot."""
+        return start + zlib.crc32(key.encode()) % (self.slots - start)
+
+
+class SharedStats:
+    """Named counters for a module's /api/stats section, summed over all workers.
+
+    kinds: "count" (int, add), "sum" (float, add), "max" (float, keep the largest),
+    "last" (float, overwrite).
+    """
+
+    def __init__(self, name: str, fields: Dict[str, str], region: Optional[SharedRegion] = None):
+        self.fields = fields
+        self._index = {f: i for i, f in enumerate(fields)}
+        self._array = (region or shared).array(f"stats:{name}", len(fields))
+
+    def incr(self, field: str, n: int = 1):
+        self._array.add(self._index[field], n)
+
+    def record(self, **values):
+        """Apply several updates atomically, each according to its field's kind."""
+        a = self._array
+        with a.locked():
+            for field, value in values.items():
+                i, kind = self._index[field], self.fields[field]
+                if kind == "count":
+                    a.set(i, a.get(i) + int(value))
+                elif kind == "sum":
+                    a.setf(i, a.getf(i) + value)
+                elif kind == "max":
+                    a.setf(i, max(a.getf(i), value))
+                else:
+                    a.setf(i, value)
+
+    def snapshot(self, fields: Optional[Sequence[str]] = None) -> dict:
+        a = self._array
+        return {f: a.get(self._index[f]) if self.fields[f] == "count" else a.getf(self._index[f])
+                for f in (fields or self.fields)}
+
+
+shared = SharedRegion()
+
+
+def stats() -> dict:
+    return {"shared_across_workers": shared.cross_process, "pid": os.getpid()}
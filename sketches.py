@@ -0,0 +1,389 @@
+"""Percentile ranks against every stored log, from mergeable quantile sketches.
+
+/api/electricity/calculate reports where its monthly_kwh falls among all logged
+entries of the same appliance, and /api/water/calculate does the same for daily_liters
+per activity ("more than 72% of showers logged"). Neither sorts nor counts log rows:
+each (category, item type) keeps a DDSketch-style quantile sketch, i.e. counts per
+logarithmic bucket of width SKETCH_RELATIVE_ACCURACY, so
+
+  * adding a value is one dict increment, and a rank is a bisect over the cumulative
+    counts of a few hundred buckets (cached until the next add): microseconds;
+  * any value's rank is off by at most the share of entries in its own bucket, i.e.
+    entries within ±1% of it;
+  * two sketches merge by adding their counts, so workers can sketch independently.
+
+Each worker holds the merged sketch of the `usage_sketches` table plus the values its
+own commits added since (collected by the log insert hook, applied when the transaction
+commits). Every SKETCH_FLUSH_SECONDS it adds those to the table rows (an UPDATE
+conditional on the row's value_count, retried after a concurrent flush) and reloads the
+rows, which brings in the other workers' values.
+
+A value is only ranked once its sketch holds SKETCH_MIN_VALUES entries; until then the
+response's percentile is null.
+
+Rebuild every sketch from the raw logs (after a bulk load with the app stopped, or a
+change of SKETCH_RELATIVE_ACCURACY); rows the retention job has compacted are only in
+sketches built before the compaction:
+    python sketches.py rebuild
+    python sketches.py show         # count and p10 / p50 / p90 per sketch
+"""
+import argparse
+import bisect
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from log_hooks import LogBatch, on_logs_inserted
+from models import ElectricityLog, UsageSketch, WaterLog
+from shared_state import SharedStats
+
+logger = logging.getLogger("ecosense.sketches")
+
+SKETCH_RELATIVE_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.01"))
+SKETCH_FLUSH_SECONDS = float(os.getenv("SKETCH_FLUSH_SECONDS", "30"))
+SKETCH_MIN_VALUES = int(os.getenv("SKETCH_MIN_VALUES", "20"))
+
+_MIN_VALUE = 1e-9  # this and below (zero usage) share one bucket under every other
+_FLUSH_RETRIES = 5
+
+# category -> (log model, item type column, sketched value column)
+SKETCHED = {
+    "electricity": (ElectricityLog, ElectricityLog.appliance_type, ElectricityLog.monthly_kwh),
+    "water": (WaterLog, WaterLog.activity_type, WaterLog.daily_liters),
+}
+
+Key = Tuple[str, str]  # (category, item type)
+
+
+class QuantileSketch:
+    """Counts per logarithmic bucket: bucket k holds values in (gamma^(k-1), gamma^k]."""
+
+    __slots__ = ("gamma", "count", "zeros", "buckets", "_log_gamma", "_keys", "_cumulative")
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.zeros = 0
+        self.buckets: Dict[int, int] = {}
+        self._keys: Optional[List[int]] = None
+        self._cumulative: List[int] = []
+
+    def _bucket(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value: float, n: int = 1):
+        if value <= _MIN_VALUE:
+            self.zeros += n
+        else:
+            k = self._bucket(value)
+            self.buckets[k] = self.buckets.get(k, 0) + n
+        self.count += n
+        self._keys = None
+
+    def merge(self, other: "QuantileSketch"):
+        if not math.isclose(other.gamma, self.gamma):
+            raise ValueError("cannot merge sketches of different accuracy")
+        for k, n in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        self._keys = None
+
+    def copy(self) -> "QuantileSketch":
+        c = QuantileSketch.__new__(QuantileSketch)
+        c.gamma, c._log_gamma, c.count, c.zeros = self.gamma, self._log_gamma, self.count, self.zeros
+        c.buckets = dict(self.buckets)
+        c._keys = None
+        c._cumulative = []
+        return c
+
+    def _index(self):
+        keys = sorted(self.buckets)
+        running, cumulative = self.zeros, []
+        for k in keys:
+            running += self.buckets[k]
+            cumulative.append(running)
+        self._keys, self._cumulative = keys, cumulative
+
+    def rank(self, value: float) -> float:
+        """Share of the values below `value`, counting its own bucket (and ties) as half."""
+        if not self.count:
+            return 0.0
+        if self._keys is None:
+            self._index()
+        if value <= _MIN_VALUE:
+            return self.zeros / 2 / self.count
+        k = self._bucket(value)
+        i = bisect.bisect_left(self._keys, k)
+        below = self._cumulative[i - 1] if i else self.zeros
+        same = self.buckets.get(k, 0)
+        return (below + same / 2) / self.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate value at quantile q in [0, 1], None when empty."""
+        if not self.count:
+            return None
+        if self._keys is None:
+            self._index()
+        target = q * (self.count - 1)
+        if target < self.zeros:
+            return 0.0
+        i = min(bisect.bisect_right(self._cumulative, target), len(self._keys) - 1)
+        return 2 * self.gamma ** self._keys[i] / (self.gamma + 1)
+
+    def to_json(self) -> str:
+        return json.dumps({"gamma": self.gamma, "zeros": self.zeros,
+                           "buckets": sorted(self.buckets.items())}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: str) -> "QuantileSketch":
+        raw = json.loads(data)
+        sketch = cls()
+        if not math.isclose(raw["gamma"], sketch.gamma):
+            raise ValueError("sketch stored with a different SKETCH_RELATIVE_ACCURACY")
+        sketch.zeros = raw["zeros"]
+        sketch.buckets = {int(k): int(n) for k, n in raw["buckets"]}
+        sketch.count = sketch.zeros + sum(sketch.buckets.values())
+        return sketch
+
+
+class SketchStore:
+    """This worker's view of the sketches: the table's rows plus its own unflushed values."""
+
+    def __init__(self, session_factory=SessionLocal, flush_seconds: float = SKETCH_FLUSH_SECONDS):
+        self.session_factory = session_factory
+        self.interval = flush_seconds
+        self._lock = threading.Lock()
+        self._merged: Dict[Key, QuantileSketch] = {}   # table rows + pending: what ranks are read from
+        self._pending: Dict[Key, QuantileSketch] = {}  # committed here, not yet in the table
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = SharedStats("sketches", {
+            "flushes": "count",
+            "failed_flushes": "count",
+            "values_flushed": "count",
+            "last_flush_ms": "last",
+        })
+
+    def percentile(self, category: str, item_type: str, value: float) -> Optional[float]:
+        """Percent of the stored entries of this item below `value`, or None with too few."""
+        with self._lock:
+            sketch = self._merged.get((category, item_type))
+            if sketch is None or sketch.count < SKETCH_MIN_VALUES:
+                return None
+            return round(100 * sketch.rank(value), 1)
+
+    def add(self, values: Iterable[Tuple[str, str, float]]):
+        with self._lock:
+            for category, item_type, value in values:
+                key = (category, item_type)
+                for sketches in (self._pending, self._merged):
+                    sketch = sketches.get(key)
+                    if sketch is None:
+                        sketch = sketches[key] = QuantileSketch()
+                    sketch.add(value)
+
+    def load(self, db: Session):
+        """Replace the view with the table's sketches (plus what is still pending here)."""
+        merged = {}
+        for category, item_type, data in db.execute(
+                select(UsageSketch.category, UsageSketch.item_type, UsageSketch.sketch)):
+            try:
+                merged[(category, item_type)] = QuantileSketch.from_json(data)
+            except ValueError:
+                logger.warning("sketch %s/%s is unreadable, run `python sketches.py rebuild`", category, item_type)
+        with self._lock:
+            for key, sketch in self._pending.items():
+                if key in merged:
+                    merged[key].merge(sketch)
+                else:
+                    merged[key] = sketch.copy()
+            self._merged = merged
+
+    def _flush_key(self, db: Session, key: Key, delta: QuantileSketch):
+        t = UsageSketch.__table__
+        category, item_type = key
+        where = (t.c.category == category) & (t.c.item_type == item_type)
+        for _ in range(_FLUSH_RETRIES):
+            row = db.execute(select(t.c.value_count, t.c.sketch).where(where)).first()
+            if row is None:
+                try:
+                    db.execute(insert(t).values(category=category, item_type=item_type, value_count=delta.count,
+                                                sketch=delta.to_json()))
+                    db.commit()
+                    return
+                except IntegrityError:  # another worker created it first
+                    db.rollback()
+                    continue
+            try:
+                sketch = QuantileSketch.from_json(row.sketch)
+            except ValueError:
+                sketch = QuantileSketch()  # unreadable: start over rather than block every flush
+            sketch.merge(delta)
+            done = db.execute(update(t).where(where, t.c.value_count == row.value_count)
+                              .values(value_count=sketch.count, sketch=sketch.to_json())).rowcount
+            db.commit()
+            if done:
+                return
+        raise RuntimeError(f"sketch {category}/{item_type} kept changing during the flush")
+
+    def flush(self):
+        """Add the pending values to the table rows, then reload every row."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        started = time.perf_counter()
+        values = sum(sketch.count for sketch in pending.values())
+        db = self.session_factory()
+        try:
+            for key in sorted(pending):
+                self._flush_key(db, key, pending[key])
+                del pending[key]
+            self.load(db)
+        except Exception:
+            db.rollback()
+            # Keep what did not make it for the next flush
+            with self._lock:
+                for key, sketch in pending.items():
+                    if key in self._pending:
+                        self._pending[key].merge(sketch)
+                    else:
+                        self._pending[key] = sketch
+            self._stats.incr("failed_flushes")
+            raise
+        finally:
+            db.close()
+        if values:
+            self._stats.record(flushes=1, values_flushed=values, last_flush_ms=(time.perf_counter() - started) * 1000)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Load the table's sketches and start flushing every SKETCH_FLUSH_SECONDS."""
+        db = self.session_factory()
+        try:
+            self.load(db)
+        finally:
+            db.close()
+        if self.running or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ecosense-sketches", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flush thread, then flush what is left."""
+        if self.running:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("sketch flush failed")
+
+    def stats(self) -> dict:
+        s = self._stats.snapshot()
+        s["last_flush_ms"] = round(s["last_flush_ms"], 3)
+        with self._lock:
+            s["sketches"] = len(self._merged)
+            s["values"] = sum(sketch.count for sketch in self._merged.values())
+            s["pending_values"] = sum(sketch.count for sketch in self._pending.values())  # this worker's
+        s["running"] = self.running
+        return s
+
+
+store = SketchStore()
+
+
+def _batch_values(batch: LogBatch) -> List[Tuple[str, str, float]]:
+    return ([("electricity", e.appliance_type, e.monthly_kwh) for e in batch.electricity]
+            + [("water", w.activity_type, w.daily_liters) for w in batch.water])
+
+
+@on_logs_inserted
+def collect_batch(conn, batch: LogBatch):
+    # Held on the connection until its transaction ends: only committed rows are sketched
+    values = _batch_values(batch)
+    if values:
+        conn.info.setdefault("sketch_values", []).extend(values)
+
+
+@event.listens_for(Engine, "commit")
+def _committed(conn):
+    values = conn.info.pop("sketch_values", None)
+    if values:
+        store.add(values)
+
+
+@event.listens_for(Engine, "rollback")
+def _rolled_back(conn):
+    conn.info.pop("sketch_values", None)
+
+
+def build(db: Session) -> Dict[Key, QuantileSketch]:
+    """Sketches of every raw log row."""
+    sketches: Dict[Key, QuantileSketch] = {}
+    for category, (model, item_column, value_column) in SKETCHED.items():
+        for item_type, value in db.execute(select(item_column, value_column).execution_options(yield_per=5000)):
+            sketch = sketches.get((category, item_type))
+            if sketch is None:
+                sketch = sketches[(category, item_type)] = QuantileSketch()
+            sketch.add(value)
+    return sketches
+
+
+def rebuild(db: Session) -> Dict[Key, QuantileSketch]:
+    """Replace every stored sketch with one built from the raw logs."""
+    sketches = build(db)
+    db.execute(delete(UsageSketch))
+    if sketches:
+        db.execute(insert(UsageSketch), [
+            dict(category=category, item_type=item_type, value_count=s.count, sketch=s.to_json())
+            for (category, item_type), s in sorted(sketches.items())
+        ])
+    db.commit()
+    return sketches
+
+
+def main(argv=None):
+    from bootstrap import ensure_schema
+
+    parser = argparse.ArgumentParser(description="Rebuild or inspect the EcoSense percentile sketches")
+    parser.add_argument("command", choices=["rebuild", "show"])
+    args = parser.parse_args(argv)
+
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            sketches = rebuild(db)
+            print(f"✅ Rebuilt {len(sketches)} sketch(es) from {sum(s.count for s in sketches.values()):,} log rows")
+            return 0
+        store.load(db)
+        for (category, item_type), s in sorted(store._merged.items()):
+            p10, p50, p90 = (s.quantile(q) for q in (0.1, 0.5, 0.9))
+            print(f"   {category:<12} {item_type:<16} {s.count:>9,}  p10 {p10:>10.2f}  p50 {p50:>10.2f}  "
+                  f"p90 {p90:>10.2f}")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Daily-activity streaks behind the consistent_user badge ("Logged activity 7 days in a row").
+
+Each household has one `activity_streaks` row: the UTC day of its latest log, the run of
+consecutive active days ending on that day, and the longest run so far. A log insert
+moves it with a single UPDATE — same day: unchanged, next day: +1, later: back to 1 — so
+badge evaluation is a primary-key read and never touches the raw logs.
+
+A batch that lands before the last active day (a bulk import of backdated readings), or
+the first log of a household, recomputes the row from the household's day rollups, which
+already form its activity calendar and survive the retention job.
+
+Rebuild every household's row from the day rollups:
+    python streaks.py backfill
+(run `python rollups.py backfill` first if the rollups themselves are stale)
+"""
+import argparse
+import sys
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.orm import Session
+from database import insert_or_update
+from log_hooks import LogBatch, on_logs_inserted
+from models import ActivityStreak, UsageRollup
+from query_budget import first_write
+from rollups import _created_day  # also registers the rollup handler ahead of ours
+
+
+def _runs(days: Iterable[date]) -> Tuple[Optional[date], int, int]:
+    """(last day, run ending on it, longest run) for ascending, distinct days."""
+    last, current, longest = None, 0, 0
+    for day in days:
+        current = current + 1 if last is not None and day - last == timedelta(days=1) else 1
+        longest = max(longest, current)
+        last = day
+    return last, current, longest
+
+
+def _calendar(conn, household: str) -> list:
+    """The household's active days, ascending (one per day rollup)."""
+    r = UsageRollup
+    return list(conn.execute(
+        select(r.bucket_start).where(r.household_id == household, r.bucket == "day")
+        .group_by(r.bucket_start).order_by(r.bucket_start)
+    ).scalars())
+
+
+def _recompute(conn, household: str):
+    last, current, longest = _runs(_calendar(conn, household))
+    if last is None:
+        return
+    t = ActivityStreak.__table__
+    values = dict(last_active_day=last, current_streak=current, longest_streak=longest)
+    if conn.execute(update(t).where(t.c.household_id == household).values(values)).rowcount == 0:
+        # Two first writes of a household can race to create the row: the later recompute wins
+        insert_or_update(conn, t, dict(household_id=household, **values), ["household_id"],
+                         lambda inserted: [(t.c[k], inserted[k]) for k in values])
+
+
+@on_logs_inserted
+def apply_batch(conn, batch: LogBatch):
+    t = ActivityStreak.__table__
+    for household, part in batch.by_household().items():
+        days = {_created_day(log) for logs in part for log in logs}
+        if len(days) == 1:
+            day = days.pop()
+            prev = day - timedelta(days=1)
+            extends = t.c.last_active_day == prev
+            # MySQL evaluates SET left to right with the new values, so the columns are
+            # assigned in dependency order: longest, then current, then last_active_day
+            result = conn.execute(
+                update(t)
+                .where(t.c.household_id == household, t.c.last_active_day <= day)
+                .ordered_values(
+                    (t.c.longest_streak, case(
+                        (extends & (t.c.current_streak + 1 > t.c.longest_streak), t.c.current_streak + 1),
+                        else_=t.c.longest_streak,
+                    )),
+                    (t.c.current_streak, case(
+                        (extends, t.c.current_streak + 1),
+                        (t.c.last_active_day == day, t.c.current_streak),
+                        else_=1,
+                    )),
+                    (t.c.last_active_day, day),
+                )
+            )
+            if result.rowcount:
+                continue
+        # First log of the household, a backdated day or a batch spanning several days:
+        # walk the day rollups, which already include this flush
+        first_write()
+        _recompute(conn, household)
+
+
+def evaluate(row: Optional[ActivityStreak], today: Optional[date] = None) -> Dict[str, int]:
+    """Current and longest streak as of today (UTC): a run is still current while its
+    last day is today or yesterday."""
+    if row is None:
+        return {"current_streak": 0, "longest_streak": 0}
+    today = today or datetime.now(timezone.utc).date()
+    current = row.current_streak if row.last_active_day >= today - timedelta(days=1) else 0
+    return {"current_streak": current, "longest_streak": row.longest_streak}
+
+
+def read_streak(db: Session, household: str) -> Dict[str, int]:
+    return evaluate(db.get(ActivityStreak, household))
+
+
+async def read_streak_async(db, household: str) -> Dict[str, int]:
+    return evaluate(await db.get(ActivityStreak, household))
+
+
+def backfill(db: Session) -> int:
+    """Rebuild every household's streak row from the day rollups; returns the row count."""
+    r = UsageRollup
+    days = db.execute(
+        select(r.household_id, r.bucket_start).where(r.bucket == "day")
+        .group_by(r.household_id, r.bucket_start).order_by(r.household_id, r.bucket_start)
+        .execution_options(yield_per=5000)
+    )
+    rows = []
+    for household, group in groupby(days, key=lambda row: row[0]):
+        last, current, longest = _runs(row[1] for row in group)
+        rows.append(dict(household_id=household, last_active_day=last, current_streak=current,
+                         longest_streak=longest))
+    db.execute(delete(ActivityStreak))
+    if rows:
+        db.execute(insert(ActivityStreak), rows)
+    db.commit()
+    return len(rows)
+
+
+def main(argv=None):
+    from bootstrap import ensure_schema
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Backfill the EcoSense activity streaks")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args(argv)
+
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        print(f"✅ Streaks rebuilt for {backfill(db)} household(s)")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
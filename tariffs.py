@@ -0,0 +1,394 @@
+"""Slabbed, time-of-use electricity and water tariffs and grid emission factors per region.
+
+Utilities bill in slabs (the first 100 kWh of the month at one rate, the next 200 at a
+higher one, ...), some scale the rate by time-of-day bands, and the grid's kg CO₂/kWh
+differs by state. TARIFF_FILE (tariffs.json by default) holds, per region, a list of
+versioned schedules, each in force from its `effective_from` date:
+
+    "IN-MH": {"electricity": [{"version": "MH-2025-04", "effective_from": "2025-04-01",
+                               "carbon_factor": 0.79,
+                               "slabs": [[100, 4.7], [300, 8.1], [null, 12.0]],   # [upto kWh, ₹/kWh]
+                               "time_of_use": [[0, 0.85], [6, 1.0], [18, 1.15]]}],  # [from hour, rate x]
+              "water": [{"version": ..., "effective_from": ..., "slabs": [[15, 6.0], [null, 35.0]]}]}  # kL, ₹/kL
+
+The file is parsed once into a TariffBook of sorted arrays: the cumulative charge at
+each slab boundary and the rate-weighted hours at each band start. Costing an entry is
+then a few binary searches, with no database query:
+
+  * the schedule: bisect the region's effective_from dates (the first version also
+    covers earlier dates);
+  * the charge: an entry is billed at the margin of the household's month, i.e.
+    charge(month so far + entry) - charge(month so far), where "month so far" is what the
+    household's entries logged this month add up to (its month rollups);
+  * time of use: the charge is scaled by the average band multiplier over the entry's
+    daily hours from `start_hour`, or over the whole day without one.
+
+Batches and bulk imports are costed column-wise (np.searchsorted). A request's own
+`tariff` / `water_rate` still overrides the slabs with a flat rate.
+
+The file is re-read when it changes (checked every TARIFF_RELOAD_SECONDS by each worker;
+0: only at startup). A file that fails validation is logged and ignored, so the
+schedules in force stay in force.
+
+    python tariffs.py check [path]      # validate a schedule file before deploying it
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from shared_state import SharedStats
+
+logger = logging.getLogger("ecosense.tariffs")
+
+TARIFF_FILE = os.getenv("TARIFF_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tariffs.json"))
+TARIFF_RELOAD_SECONDS = float(os.getenv("TARIFF_RELOAD_SECONDS", "5"))
+TARIFF_REGION = os.getenv("TARIFF_REGION") or None  # default region; else the file's default_region
+
+KINDS = ("electricity", "water")
+
+
+class TariffError(ValueError):
+    """An invalid schedule file, or a region it has no schedule for."""
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+class Slabs:
+    """Increasing-block charge: each rate applies to the units between the previous bound and its own."""
+
+    def __init__(self, slabs: Sequence[Sequence]):
+        if not slabs:
+            raise TariffError("no slabs")
+        starts, rates = [0.0], []
+        for i, (upto, rate) in enumerate(slabs):
+            last = i == len(slabs) - 1
+            if (upto is None) != last:
+                raise TariffError("only the last slab is open-ended (upper bound null)")
+            if rate < 0:
+                raise TariffError(f"negative slab rate {rate}")
+            rates.append(float(rate))
+            if not last:
+                if upto <= starts[-1]:
+                    raise TariffError("slab bounds must increase")
+                starts.append(float(upto))
+        charged = [0.0]  # the charge for all units below each slab's start
+        for i in range(1, len(starts)):
+            charged.append(charged[-1] + (starts[i] - starts[i - 1]) * rates[i - 1])
+        self.starts, self.rates, self.charged = starts, rates, charged
+        self._starts, self._rates, self._charged = np.array(starts), np.array(rates), np.array(charged)
+
+    def charge(self, units: float) -> float:
+        """The charge for a month's first `units` units."""
+        i = bisect.bisect_right(self.starts, units) - 1
+        return self.charged[i] + (units - self.starts[i]) * self.rates[i]
+
+    def rate(self, units: float) -> float:
+        """The rate of the next unit after `units`."""
+        return self.rates[bisect.bisect_right(self.starts, units) - 1]
+
+    def charges(self, units: np.ndarray) -> np.ndarray:
+        i = np.searchsorted(self._starts, units, side="right") - 1
+        return self._charged[i] + (units - self._starts[i]) * self._rates[i]
+
+    def rates_at(self, units: np.ndarray) -> np.ndarray:
+        return self._rates[np.searchsorted(self._starts, units, side="right") - 1]
+
+
+class TimeOfUse:
+    """Rate multipliers by hour of day, each band running until the next one starts."""
+
+    def __init__(self, bands: Sequence[Sequence]):
+        bands = bands or [[0, 1.0]]
+        starts = [float(start) for start, _ in bands]
+        multipliers = [float(m) for _, m in bands]
+        if starts[0] != 0 or starts[-1] >= 24 or any(b <= a for a, b in zip(starts, starts[1:])):
+            raise TariffError("time_of_use bands must start at hour 0 and increase below 24")
+        if any(m <= 0 for m in multipliers):
+            raise TariffError("time_of_use multipliers must be positive")
+        weighted = [0.0]  # multiplier-weighted hours from midnight to each band's start
+        for i in range(1, len(starts)):
+            weighted.append(weighted[-1] + (starts[i] - starts[i - 1]) * multipliers[i - 1])
+        self.starts, self.multipliers, self.weighted = starts, multipliers, weighted
+        self._starts, self._multipliers, self._weighted = np.array(starts), np.array(multipliers), np.array(weighted)
+        self.day = self._until(24.0)
+        self.mean = self.day / 24
+
+    def _until(self, hour: float) -> float:
+        i = bisect.bisect_right(self.starts, hour) - 1
+        return self.weighted[i] + (hour - self.starts[i]) * self.multipliers[i]
+
+    def _until_many(self, hour: np.ndarray) -> np.ndarray:
+        i = np.searchsorted(self._starts, hour, side="right") - 1
+        return self._weighted[i] + (hour - self._starts[i]) * self._multipliers[i]
+
+    def factor(self, start: Optional[float], hours: float) -> float:
+        """Average multiplier over `hours` from `start` (wrapping past midnight); the day's without a start."""
+        if start is None:
+            return self.mean
+        if hours <= 0:
+            return self.multipliers[bisect.bisect_right(self.starts, start) - 1]
+        end = start + hours
+        if end <= 24:
+            return (self._until(end) - self._until(start)) / hours
+        return (self.day - self._until(start) + self._until(end - 24)) / hours
+
+    def factors(self, start: np.ndarray, hours: np.ndarray) -> np.ndarray:
+        """factor() per entry; NaN starts get the day's mean."""
+        known = ~np.isnan(start)
+        s = np.where(known, start, 0.0)
+        h = np.where(hours > 0, hours, 1.0)
+        end = s + h
+        wrapped = end > 24
+        area = np.where(wrapped, self.day - self._until_many(s) + self._until_many(np.where(wrapped, end - 24, 0.0)),
+                        self._until_many(np.where(wrapped, 0.0, end)) - self._until_many(s))
+        at_start = self._multipliers[np.searchsorted(self._starts, s, side="right") - 1]
+        return np.where(known, np.where(hours > 0, area / h, at_start), self.mean)
+
+
+class Schedule:
+    """One version of a region's electricity or water tariff."""
+
+    def __init__(self, region: str, kind: str, spec: dict):
+        self.region = region
+        self.kind = kind
+        try:
+            self.version = str(spec["version"])
+            self.effective_from = date.fromisoformat(spec["effective_from"])
+            self.slabs = Slabs(spec["slabs"])
+            self.time_of_use = TimeOfUse(spec.get("time_of_use") if kind == "electricity" else None)
+            self.carbon_factor = float(spec["carbon_factor"]) if kind == "electricity" else 0.0
+        except (KeyError, TypeError, ValueError) as e:
+            raise TariffError(f"{region} {kind} {spec.get('version', '?')}: {e}") from None
+        if self.carbon_factor < 0:
+            raise TariffError(f"{region} {kind} {self.version}: negative carbon_factor")
+
+    def quote(self, units: float, month_units: float = 0.0, start_hour: Optional[float] = None,
+              hours: float = 0.0) -> Tuple[float, float]:
+        """(charge, rate per unit) for `units` billed on top of `month_units` already this month."""
+        factor = self.time_of_use.factor(start_hour, hours)
+        if units > 0:
+            charge = (self.slabs.charge(month_units + units) - self.slabs.charge(month_units)) * factor
+            return charge, charge / units
+        return 0.0, self.slabs.rate(month_units) * factor
+
+    def quotes(self, units: np.ndarray, month_units: np.ndarray, start_hour: np.ndarray,
+               hours: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        factor = self.time_of_use.factors(start_hour, hours)
+        charge = (self.slabs.charges(month_units + units) - self.slabs.charges(month_units)) * factor
+        rate = np.where(units > 0, charge / np.where(units > 0, units, 1.0), self.slabs.rates_at(month_units) * factor)
+        return charge, rate
+
+
+class TariffBook:
+    """Every region's schedules, parsed and validated; read-only once built."""
+
+    def __init__(self, data: dict, default_region: Optional[str] = None):
+        if not isinstance(data, dict) or not isinstance(data.get("regions"), dict) or not data["regions"]:
+            raise TariffError("expected {\"regions\": {region: {\"electricity\": [...], \"water\": [...]}}}")
+        self.version = str(data.get("version", ""))
+        self.default_region = default_region or data.get("default_region")
+        self._schedules: Dict[Tuple[str, str], Tuple[List[date], List[Schedule]]] = {}
+        for region, kinds in data["regions"].items():
+            for kind in KINDS:
+                versions = sorted((Schedule(region, kind, spec) for spec in kinds.get(kind, [])),
+                                  key=lambda s: s.effective_from)
+                if not versions:
+                    continue
+                dates = [s.effective_from for s in versions]
+                if len(set(dates)) != len(dates):
+                    raise TariffError(f"{region} {kind}: two versions effective from the same day")
+                self._schedules[(region, kind)] = (dates, versions)
+        for kind in KINDS:
+            if (self.default_region, kind) not in self._schedules:
+                raise TariffError(f"default region {self.default_region!r} has no {kind} schedule")
+
+    @property
+    def regions(self) -> List[str]:
+        return sorted({region for region, _ in self._schedules})
+
+    def schedule(self, kind: str, region: Optional[str] = None, day: Optional[date] = None) -> Schedule:
+        """The version of `region`'s schedule in force on `day` (today by default)."""
+        region = region or self.default_region
+        found = self._schedules.get((region, kind))
+        if found is None:
+            raise TariffError(f"No {kind} tariff for region {region!r}; known: {', '.join(self.regions)}")
+        dates, versions = found
+        return versions[max(0, bisect.bisect_right(dates, day or _today()) - 1)]
+
+    def electricity(self, region: Optional[str] = None, day: Optional[date] = None) -> Schedule:
+        return self.schedule("electricity", region, day)
+
+    def water(self, region: Optional[str] = None, day: Optional[date] = None) -> Schedule:
+        return self.schedule("water", region, day)
+
+    def quotes(self, kind: str, units: np.ndarray, month_units: np.ndarray, regions: Sequence[Optional[str]],
+               days: Optional[Sequence[Optional[date]]] = None, start_hour: Optional[np.ndarray] = None,
+               hours: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, List[Schedule]]:
+        """quote() per entry, column-wise: (charges, rates, the schedule of each entry)."""
+        n = len(units)
+        days = days or [None] * n
+        start_hour = np.full(n, np.nan) if start_hour is None else start_hour
+        hours = np.zeros(n) if hours is None else hours
+        today = _today()
+        schedules = [self.schedule(kind, region, day or today) for region, day in zip(regions, days)]
+        charges, rates = np.zeros(n), np.zeros(n)
+        groups: Dict[int, List[int]] = {}
+        for i, s in enumerate(schedules):
+            groups.setdefault(id(s), []).append(i)
+        for rows in groups.values():
+            idx = np.array(rows)
+            charges[idx], rates[idx] = schedules[rows[0]].quotes(units[idx], month_units[idx], start_hour[idx],
+                                                                 hours[idx])
+        return charges, rates, schedules
+
+
+def load_book(path: str) -> TariffBook:
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise TariffError(f"{path}: {e}") from None
+    return TariffBook(data, TARIFF_REGION)
+
+
+class TariffStore:
+    """This worker's TariffBook, swapped for a new one when the file changes."""
+
+    def __init__(self, path: str = TARIFF_FILE, reload_seconds: float = TARIFF_RELOAD_SECONDS):
+        self.path = path
+        self.interval = reload_seconds
+        self._book: Optional[TariffBook] = None
+        self._signature = None
+        self._loaded_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = SharedStats("tariffs", {"reloads": "count", "failed_reloads": "count"})
+
+    @property
+    def book(self) -> TariffBook:
+        book = self._book
+        if book is None:
+            with self._lock:
+                if self._book is None:
+                    self._load(self._file_signature())
+                book = self._book
+        return book
+
+    def _file_signature(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self, signature):
+        self._book = load_book(self.path)  # a single reference swap: requests see the old or the new book
+        self._signature = signature
+        self._loaded_at = time.time()
+        self._last_error = None
+
+    def reload(self) -> bool:
+        """Load the file again if it changed; returns whether a new book is in force."""
+        try:
+            signature = self._file_signature()
+        except OSError as e:
+            signature = None
+            error = str(e)
+        else:
+            if signature == self._signature:
+                return False
+            error = None
+        with self._lock:
+            if error is None:
+                try:
+                    self._load(signature)
+                    self._stats.incr("reloads")
+                    logger.info("tariffs reloaded from %s (version %s)", self.path, self._book.version)
+                    return True
+                except (OSError, TariffError) as e:
+                    error = str(e)
+            if error != self._last_error:
+                self._stats.incr("failed_reloads")
+                logger.error("tariff reload failed, keeping version %s: %s",
+                             self._book.version if self._book else None, error)
+            self._signature = signature  # don't retry until the file changes again
+            self._last_error = error
+        return False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Load the file (failing startup if it is invalid) and watch it every TARIFF_RELOAD_SECONDS."""
+        logger.info("tariffs loaded from %s (version %s)", self.path, self.book.version)
+        if self.running or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ecosense-tariffs", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self.running:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("tariff reload failed")
+
+    def stats(self) -> dict:
+        s = self._stats.snapshot()
+        book = self._book
+        s.update(
+            file=self.path,
+            version=book.version if book else None,  # this worker's
+            default_region=book.default_region if book else None,
+            regions=book.regions if book else [],
+            loaded_at=datetime.fromtimestamp(self._loaded_at, timezone.utc).isoformat() if self._loaded_at else None,
+            last_error=self._last_error,
+            running=self.running,
+        )
+        return s
+
+
+store = TariffStore()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate an EcoSense tariff file")
+    parser.add_argument("command", choices=["check"])
+    parser.add_argument("path", nargs="?", default=TARIFF_FILE)
+    args = parser.parse_args(argv)
+
+    try:
+        book = load_book(args.path)
+    except (OSError, TariffError) as e:
+        print(f"⚠️  {e}")
+        return 1
+    for region in book.regions:
+        for kind in KINDS:
+            found = book._schedules.get((region, kind))
+            for s in found[1] if found else []:
+                extra = f"  {s.carbon_factor} kg CO₂/kWh" if kind == "electricity" else ""
+                print(f"   {region:<8} {kind:<12} {s.version:<14} from {s.effective_from}  "
+                      f"{len(s.slabs.rates)} slab(s){extra}")
+    print(f"✅ {args.path}: version {book.version or '-'}, {len(book.regions)} region(s), "
+          f"default {book.default_region}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Test setup: every module reads its configuration from the environment at import time, so the
+app runs against a throwaway SQLite database configured here, before anything imports it.
+
+Tests that need a different configuration (DB_ASYNC=1, write-behind) boot the app in a
+subprocess through the `run_app` fixture.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.TemporaryDirectory(prefix="ecosense-tests-")
+TEST_ENV = {
+    "DATABASE_URL": f"sqlite:///{os.path.join(_tmp.name, 'ecosense.db')}",
+    "QUERY_BUDGETS": "raise",
+    "RESPONSE_CACHE": "0",
+    "WRITE_BEHIND": "0",
+    "ADMISSION_RATE": "0",
+    "METRICS": "0",
+}
+os.environ.update(TEST_ENV)
+
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+
+    return main.app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def household():
+    """A fresh household, so a test sees none of the rows other tests logged."""
+    return {"X-Household-ID": f"test-{uuid.uuid4().hex[:12]}"}
+
+
+@pytest.fixture
+def db(client):
+    from database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def run_app(tmp_path):
+    """Run a snippet in a fresh interpreter against its own database, with TEST_ENV overridden by
+    keyword arguments; fails with the snippet's output if it exits non-zero."""
+    def run(code: str, **env) -> subprocess.CompletedProcess:
+        full_env = dict(os.environ, **TEST_ENV, **env)
+        full_env["DATABASE_URL"] = f"sqlite:///{tmp_path / 'ecosense.db'}"
+        full_env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, full_env.get("PYTHONPATH")]))
+        proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=full_env,
+                              capture_output=True, text=True, timeout=120)
+        assert proc.returncode == 0, f"exit {proc.returncode}\n{proc.stdout}\n{proc.stderr}"
+        return proc
+
+    return run
@@ -0,0 +1,26 @@
+def _import(client, household, days):
+    csv = "appliance_type,hours,created_at\n" + "".join(f"ac,2,{day}T12:00:00\n" for day in days)
+    resp = client.post("/api/import", params={"table": "electricity", "format": "csv"}, content=csv,
+                       headers=household)
+    assert resp.json()["imported"] == len(days), resp.text
+
+
+def test_trends_to_is_exclusive(client, household):
+    _import(client, household, ["2025-01-14", "2025-01-15", "2025-01-16"])
+    resp = client.get("/api/analysis/trends", params={"bucket": "day", "from": "2025-01-14", "to": "2025-01-16"},
+                      headers=household)
+    assert [p["bucket_start"] for p in resp.json()["points"]] == ["2025-01-14", "2025-01-15"]
+
+
+def test_trends_from_includes_the_bucket_containing_it(client, household):
+    _import(client, household, ["2025-03-03", "2025-03-12"])  # Mondays of two weeks
+    resp = client.get("/api/analysis/trends", params={"bucket": "week", "from": "2025-03-05", "to": "2025-03-10"},
+                      headers=household)
+    assert [p["bucket_start"] for p in resp.json()["points"]] == ["2025-03-03"]
+
+
+def test_history_to_is_exclusive(client, household):
+    _import(client, household, ["2025-02-01", "2025-02-02"])
+    resp = client.get("/api/analysis/history", params={"category": "electricity", "from": "2025-02-01T12:00:00",
+                                                       "to": "2025-02-02T12:00:00"}, headers=household)
+    assert [item["created_at"] for item in resp.json()["electricity"]] == ["2025-02-01T12:00:00"]
@@ -0,0 +1,36 @@
+BOOT = """
+from fastapi.testclient import TestClient
+import main
+
+with TestClient(main.app) as client:
+    resp = client.post("/api/electricity/calculate", json={"appliance_type": "ac", "hours": 2})
+    assert resp.status_code == 200, resp.text
+    resp = client.get("/api/analysis/summary")
+    assert resp.status_code == 200, resp.text
+"""
+
+
+def test_async_engine_boots_and_serves(run_app):
+    # The async pool settings once crashed engine creation on SQLAlchemy 2.0.x (aiosqlite's NullPool)
+    run_app(BOOT, DB_ASYNC="1")
+
+
+def test_async_boot_check_fails_startup_on_a_bad_engine(run_app):
+    code = """
+import main
+from fastapi.testclient import TestClient
+
+async def broken():
+    raise RuntimeError("no async driver")
+
+main.check_async_engines = broken
+try:
+    with TestClient(main.app):
+        pass
+except RuntimeError as e:
+    assert "no async driver" in str(e)
+else:
+    raise AssertionError("startup should have failed")
+"""
+    proc = run_app(code, DB_ASYNC="1")
+    assert "DB_ASYNC=1" in proc.stdout
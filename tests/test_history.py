@@ -0,0 +1,51 @@
+def _pages(client, headers, **params):
+    seen, cursor = [], None
+    for _ in range(50):
+        resp = client.get("/api/analysis/history", params=dict(params, **({"cursor": cursor} if cursor else {})),
+                          headers=headers)
+        assert resp.status_code == 200, resp.text
+        body = resp.json()
+        seen += [(item["created_at"], item["id"]) for item in body["electricity"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return seen
+    raise AssertionError(f"pagination didn't end: {seen}")
+
+
+def test_history_pages_each_row_once_in_keyset_order(client, household):
+    # Rows logged within the same second, plus imported ones (some sharing a timestamp) to
+    # interleave with them
+    for hours in range(1, 8):
+        client.post("/api/electricity/calculate", json={"appliance_type": "fan", "hours": hours}, headers=household)
+    csv = "appliance_type,hours,created_at\n" + "".join(
+        f"ac,{h},2025-01-15T20:00:0{h % 3}\n" for h in range(1, 7))
+    resp = client.post("/api/import", params={"table": "electricity", "format": "csv"}, content=csv,
+                       headers=household)
+    assert resp.json()["imported"] == 6, resp.text
+
+    seen = _pages(client, household, category="electricity", limit=2)
+    assert len(seen) == 13 and len(set(seen)) == 13
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_history_rejects_a_malformed_cursor(client, household):
+    import base64
+
+    for cursor in ("not-base64!", base64.urlsafe_b64encode(b'{"electricity": ["yesterday", 3]}').decode()):
+        resp = client.get("/api/analysis/history", params={"cursor": cursor}, headers=household)
+        assert resp.status_code == 400
+
+
+def test_upgrade_cuts_sqlite_fractional_timestamps(client, household, db):
+    import bootstrap
+    from sqlalchemy import text
+
+    resp = client.post("/api/electricity/calculate", json={"appliance_type": "tv", "hours": 3}, headers=household)
+    log_id = resp.json()["saved_id"]
+    # As written by a bulk import before timestamps were bound in whole seconds
+    db.execute(text("UPDATE electricity_logs SET created_at = '2025-01-15 20:00:00.250000' WHERE id = :id"),
+               {"id": log_id})
+    db.commit()
+    assert any(step.startswith("cut 1 timestamps") for step in bootstrap.upgrade())
+    stored = db.execute(text("SELECT created_at FROM electricity_logs WHERE id = :id"), {"id": log_id}).scalar()
+    assert stored == "2025-01-15 20:00:00"
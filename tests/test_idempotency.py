@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import event, false, func, select
+
+import admission
+from models import CleaningLog, ElectricityLog
+
+BODY = {"appliance_type": "fan", "hours": 2}
+
+
+def _keyed(household, key="k1"):
+    return dict(household, **{"Idempotency-Key": key})
+
+
+def _count(db, model, household):
+    return db.execute(select(func.count()).where(model.household_id == household["X-Household-ID"])).scalar()
+
+
+def test_repeat_replays_the_first_response(client, db, household):
+    first = client.post("/api/electricity/calculate", json=BODY, headers=_keyed(household))
+    again = client.post("/api/electricity/calculate", json=BODY, headers=_keyed(household))
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert _count(db, ElectricityLog, household) == 1
+
+
+def test_key_reused_for_another_request_is_rejected(client, household):
+    client.post("/api/electricity/calculate", json=BODY, headers=_keyed(household))
+    resp = client.post("/api/electricity/calculate", json=dict(BODY, hours=3), headers=_keyed(household))
+    assert resp.status_code == 422
+
+
+def test_concurrent_retry_replays_the_winner(client, db, household, monkeypatch):
+    winner = client.post("/api/electricity/calculate", json=BODY, headers=_keyed(household)).json()
+    real = admission.Admission._lookup
+    calls = []
+
+    def lookup(self):
+        # The first lookup runs before the winner commits: it finds nothing
+        calls.append(1)
+        return real(self).where(false()) if len(calls) == 1 else real(self)
+
+    monkeypatch.setattr(admission.Admission, "_lookup", lookup)
+    resp = client.post("/api/electricity/calculate", json=BODY, headers=_keyed(household))
+    assert resp.status_code == 200 and len(calls) == 2  # looked up again after the key INSERT failed
+    assert resp.json() == winner
+    assert _count(db, ElectricityLog, household) == 1  # the loser's log row was rolled back
+
+
+def test_other_integrity_errors_are_raised(client, db, household):
+    def break_insert(mapper, conn, target):
+        target.product_type = None  # NOT NULL violation on the log insert, not a key race
+
+    body = {"product_type": "bleach", "usage_frequency": "daily"}
+    event.listen(CleaningLog, "before_insert", break_insert)
+    try:
+        with pytest.raises(Exception, match="NOT NULL"):
+            client.post("/api/cleaning/analyze", json=body, headers=_keyed(household, "c1"))
+    finally:
+        event.remove(CleaningLog, "before_insert", break_insert)
+    # Nothing was stored under the key: a retry writes the log
+    resp = client.post("/api/cleaning/analyze", json=body, headers=_keyed(household, "c1"))
+    assert resp.status_code == 200 and resp.json()["saved_id"] is not None
+    assert _count(db, CleaningLog, household) == 1
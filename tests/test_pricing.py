@@ -0,0 +1,44 @@
+def _cost(client, headers, **body):
+    resp = client.post("/api/electricity/calculate", json=dict({"appliance_type": "ac", "hours": 8}, **body),
+                       headers=headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_household_slabs_follow_its_month_to_date_usage(client, household):
+    costs = [_cost(client, household)["monthly_cost"] for _ in range(4)]
+    assert costs == sorted(costs) and costs[-1] > costs[0]
+
+
+def test_default_household_is_priced_from_zero(client, household):
+    first = _cost(client, {})["monthly_cost"]
+    _cost(client, household)  # other households' usage doesn't move it either
+    assert [_cost(client, {})["monthly_cost"] for _ in range(3)] == [first] * 3
+
+
+def test_flat_tariff_ignores_the_schedule(client, household):
+    result = _cost(client, household, tariff=8)
+    assert result["monthly_cost"] == round(result["monthly_kwh"] * 8, 2)
+    assert result["tariff_version"] is None
+
+
+def test_water_default_household_is_priced_from_zero(client):
+    body = {"activity": "shower", "flow_rate": 12, "duration": 30}
+    costs = {client.post("/api/water/calculate", json=body).json()["monthly_cost"] for _ in range(3)}
+    assert len(costs) == 1
+
+
+def test_simulate_prices_like_calculate(client):
+    grid = client.post("/api/electricity/simulate", json={"appliance_type": "ac", "hours": [2, 8]}).json()
+    assert grid["tariff_version"] is not None
+    for hours, cost in zip(grid["hours"], grid["monthly_cost"]):
+        assert _cost(client, {}, hours=hours)["monthly_cost"] == cost
+
+
+def test_simulate_slabs_on_month_to_date_usage(client):
+    def grid(**body):
+        body = dict({"appliance_type": "ac", "hours": [4]}, **body)
+        return client.post("/api/electricity/simulate", json=body).json()
+
+    assert grid(month_kwh=500)["tariff"][0] > grid()["tariff"][0]
+    assert grid(tariff=8)["monthly_cost"] == [round(grid()["monthly_kwh"][0] * 8, 2)]
@@ -0,0 +1,26 @@
+import pytest
+
+
+@pytest.mark.parametrize("db_async", ["0", "1"])
+def test_every_route_within_its_query_budget(run_app, db_async):
+    proc = run_app("import sys, query_budget; sys.exit(query_budget.main(['check']))", DB_ASYNC=db_async)
+    assert "routes within their query budgets" in proc.stdout
+
+
+def test_budget_check_fails_on_a_route_over_budget(run_app):
+    code = """
+import query_budget
+from query_budget import QueryBudget, QueryBudgetExceeded
+import electricity
+
+for i, (r, method, path, budget) in enumerate(query_budget._declared):
+    if r is electricity.router and (method, path) == ("POST", "/calculate"):
+        query_budget._declared[i] = (r, method, path, QueryBudget(statements=2))
+try:
+    query_budget.main(["check"])
+except QueryBudgetExceeded as e:
+    assert "POST /api/electricity/calculate" in str(e), e
+else:
+    raise AssertionError("the check should have failed")
+"""
+    run_app(code)
@@ -0,0 +1,61 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import mysql, postgresql
+
+import database
+import rollups
+import totals
+from models import AnalysisTotals, UsageRollup
+
+
+def test_totals_first_write_merges_into_a_row_created_meanwhile(client, household, monkeypatch):
+    real = totals.compute_totals
+    t = AnalysisTotals.__table__
+
+    def rival_commits_first(conn, household_id):
+        # Another request's first write for this household created the row after our UPDATE missed it
+        conn.execute(t.insert().values(household_id=household_id,
+                                       **dict(dict.fromkeys(totals.TOTAL_FIELDS, 0), cleaning_count=5)))
+        return real(conn, household_id)
+
+    monkeypatch.setattr(totals, "compute_totals", rival_commits_first)
+    resp = client.post("/api/cleaning/analyze", json={"product_type": "bleach", "usage_frequency": "weekly"},
+                       headers=household)
+    assert resp.status_code == 200, resp.text
+    monkeypatch.undo()
+    assert client.get("/api/analysis/summary", headers=household).json()["cleaning_count"] == 6
+
+
+def test_rollup_rows_created_twice_add_up(db):
+    row = dict(household_id="test-upsert-rollups", bucket="day", bucket_start=date(2025, 1, 15),
+               category="electricity", item_type="ac", entry_count=1, kwh=2.0, cost=10.0, carbon_kg=1.5, liters=0.0)
+    conn = db.connection()
+    rollups._insert_or_add(conn, [row])
+    rollups._insert_or_add(conn, [row])  # a concurrent transaction's insert of the same new bucket
+    db.commit()
+    stored = db.execute(select(UsageRollup).where(UsageRollup.household_id == row["household_id"])).scalars().all()
+    assert [(r.entry_count, r.kwh, r.cost) for r in stored] == [(2, 4.0, 20.0)]
+
+
+class _Recorder:
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.statement = None
+
+    def execute(self, stmt, rows):
+        self.statement = str(stmt.compile(dialect=self.dialect))
+
+
+@pytest.mark.parametrize("dialect, clause", [
+    (mysql.dialect(), "ON DUPLICATE KEY UPDATE entry_count = (usage_rollups.entry_count + VALUES(entry_count))"),
+    (postgresql.dialect(), "ON CONFLICT (household_id, bucket, bucket_start, category, item_type) DO UPDATE SET "
+                           "entry_count = (usage_rollups.entry_count + excluded.entry_count)"),
+])
+def test_upsert_statement_per_dialect(dialect, clause):
+    conn = _Recorder(dialect)
+    t = UsageRollup.__table__
+    database.insert_or_update(conn, t, [], rollups.KEY_COLUMNS,
+                              lambda inserted: [(t.c.entry_count, t.c.entry_count + inserted.entry_count)])
+    assert clause in conn.statement
@@ -0,0 +1,214 @@
+"""Running totals for /api/analysis/summary and /api/achievements.
+
+Each household's `analysis_totals` row is bumped in the same transaction as every log
+insert, so its summary and badge progress are one primary-key read instead of aggregates
+over its rows.
+
+Recompute from the raw log tables (plus the monthly archives of rows the retention job
+compacted away) after a manual import or a crash:
+    python totals.py verify     # report drift, exit 1 if any
+    python totals.py rebuild    # overwrite every household's row with freshly computed totals
+"""
+import argparse
+import sys
+from typing import Dict, List, Optional
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+from database import gather_rows, insert_or_update
+from log_hooks import LogBatch, on_logs_inserted
+from models import AnalysisTotals, ElectricityLog, LogArchive, WaterLog, CleaningLog
+from query_budget import first_write, unbudgeted
+
+TOTAL_FIELDS = (
+    "electricity_count",
+    "total_kwh",
+    "total_electricity_cost",
+    "total_carbon_kg",
+    "efficient_count",
+    "water_count",
+    "total_liters",
+    "total_water_cost",
+    "good_water_count",
+    "cleaning_count",
+)
+DRIFT_TOLERANCE = 0.01
+
+
+def _batch_deltas(batch: LogBatch) -> Dict[str, float]:
+    return {
+        "electricity_count": len(batch.electricity),
+        "total_kwh": sum(e.monthly_kwh for e in batch.electricity),
+        "total_electricity_cost": sum(e.monthly_cost for e in batch.electricity),
+        "total_carbon_kg": sum(e.carbon_kg for e in batch.electricity),
+        "efficient_count": sum(1 for e in batch.electricity if e.efficiency == "Efficient"),
+        "water_count": len(batch.water),
+        "total_liters": sum(w.monthly_liters for w in batch.water),
+        "total_water_cost": sum(w.monthly_cost for w in batch.water),
+        "good_water_count": sum(1 for w in batch.water if w.comparison_rating == "Good"),
+        "cleaning_count": len(batch.cleaning),
+    }
+
+
+@on_logs_inserted
+def apply_batch(conn, batch: LogBatch):
+    t = AnalysisTotals.__table__
+    for household, part in batch.by_household().items():
+        deltas = {k: v for k, v in _batch_deltas(part).items() if v}
+        result = conn.execute(
+            update(t)
+            .where(t.c.household_id == household)
+            .values({t.c[k]: t.c[k] + v for k, v in deltas.items()})
+        )
+        if result.rowcount == 0:
+            # No totals row yet (new household or pre-existing history): seed it from the
+            # raw tables, which already contain the rows from this flush. If a concurrent
+            # first write created the row meanwhile, add this flush's deltas to it instead
+            first_write()
+            insert_or_update(conn, t, dict(household_id=household, **compute_totals(conn, household)),
+                             ["household_id"], lambda inserted: [(t.c[k], t.c[k] + v) for k, v in deltas.items()])
+
+
+def _scan_statements(household: str):
+    """One aggregate per raw log table — the slow path the totals row replaces."""
+    return (
+        select(
+            func.count(ElectricityLog.id),
+            func.coalesce(func.sum(ElectricityLog.monthly_kwh), 0),
+            func.coalesce(func.sum(ElectricityLog.monthly_cost), 0),
+            func.coalesce(func.sum(ElectricityLog.carbon_kg), 0),
+            func.coalesce(func.sum(case((ElectricityLog.efficiency == "Efficient", 1), else_=0)), 0),
+        ).where(ElectricityLog.household_id == household),
+        select(
+            func.count(WaterLog.id),
+            func.coalesce(func.sum(WaterLog.monthly_liters), 0),
+            func.coalesce(func.sum(WaterLog.monthly_cost), 0),
+            func.coalesce(func.sum(case((WaterLog.comparison_rating == "Good", 1), else_=0)), 0),
+        ).where(WaterLog.household_id == household),
+        select(func.count(CleaningLog.id)).where(CleaningLog.household_id == household),
+        # Rows already compacted by the retention job
+        select(*(func.coalesce(func.sum(col), 0) for col in (
+            _archived("electricity", LogArchive.entry_count),
+            LogArchive.kwh,
+            _archived("electricity", LogArchive.cost),
+            LogArchive.carbon_kg,
+            LogArchive.efficient_count,
+            _archived("water", LogArchive.entry_count),
+            LogArchive.liters,
+            _archived("water", LogArchive.cost),
+            LogArchive.good_water_count,
+            _archived("cleaning", LogArchive.entry_count),
+        ))).where(LogArchive.household_id == household),
+    )
+
+
+def _archived(category: str, column):
+    return case((LogArchive.category == category, column), else_=0)
+
+
+def _from_scan(e, w, c, a) -> Dict[str, float]:
+    return {
+        "electricity_count": e[0] + int(a[0]),
+        "total_kwh": float(e[1]) + float(a[1]),
+        "total_electricity_cost": float(e[2]) + float(a[2]),
+        "total_carbon_kg": float(e[3]) + float(a[3]),
+        "efficient_count": int(e[4]) + int(a[4]),
+        "water_count": w[0] + int(a[5]),
+        "total_liters": float(w[1]) + float(a[6]),
+        "total_water_cost": float(w[2]) + float(a[7]),
+        "good_water_count": int(w[3]) + int(a[8]),
+        "cleaning_count": (c[0] or 0) + int(a[9]),
+    }
+
+
+def compute_totals(db, household: str) -> Dict[str, float]:
+    """Scan of one household's raw log rows and archives (db may be a Session or a Connection)."""
+    return _from_scan(*(db.execute(stmt).one() for stmt in _scan_statements(household)))
+
+
+def read_totals(db: Session, household: str) -> Dict[str, float]:
+    row: Optional[AnalysisTotals] = db.get(AnalysisTotals, household)
+    if row is None:
+        # Nothing logged yet, or a database from before the totals table
+        with unbudgeted():
+            return compute_totals(db, household)
+    return {k: getattr(row, k) for k in TOTAL_FIELDS}
+
+
+async def read_totals_async(db, household: str) -> Dict[str, float]:
+    """read_totals for the async routers; the fallback scans run concurrently."""
+    row: Optional[AnalysisTotals] = await db.get(AnalysisTotals, household)
+    if row is None:
+        with unbudgeted():
+            e, w, c, a = await gather_rows(*_scan_statements(household))
+        return _from_scan(e[0], w[0], c[0], a[0])
+    return {k: getattr(row, k) for k in TOTAL_FIELDS}
+
+
+def households(db: Session) -> List[str]:
+    """Every household with raw rows, archives or a totals row."""
+    ids = set()
+    for model in (ElectricityLog, WaterLog, CleaningLog, LogArchive, AnalysisTotals):
+        ids.update(db.execute(select(model.household_id).distinct()).scalars())
+    return sorted(ids)
+
+
+def verify(db: Session) -> Dict[str, Dict[str, dict]]:
+    """Compare each stored row against a fresh scan;
+    returns {household: {field: {stored, actual}}} for drifted fields."""
+    drift = {}
+    for household in households(db):
+        row = db.get(AnalysisTotals, household)
+        actual = compute_totals(db, household)
+        for k in TOTAL_FIELDS:
+            stored = getattr(row, k) if row is not None else None
+            if stored is None or abs(stored - actual[k]) > DRIFT_TOLERANCE:
+                drift.setdefault(household, {})[k] = {"stored": stored, "actual": actual[k]}
+    return drift
+
+
+def rebuild(db: Session) -> Dict[str, Dict[str, float]]:
+    rebuilt = {}
+    for household in households(db):
+        actual = rebuilt[household] = compute_totals(db, household)
+        row = db.get(AnalysisTotals, household)
+        if row is None:
+            db.add(AnalysisTotals(household_id=household, **actual))
+        else:
+            for k, v in actual.items():
+                setattr(row, k, v)
+    db.commit()
+    return rebuilt
+
+
+def main(argv=None):
+    from bootstrap import ensure_schema
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Verify or rebuild the EcoSense running totals")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args(argv)
+
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rebuilt = rebuild(db)
+            print(f"✅ Totals rebuilt for {len(rebuilt)} household(s)")
+            for household, totals in rebuilt.items():
+                print(f"   {household}: {totals}")
+            return 0
+        drift = verify(db)
+        if not drift:
+            print("✅ Totals match the raw log tables")
+            return 0
+        print("⚠️  Totals drifted — run `python totals.py rebuild`")
+        for household, fields in drift.items():
+            for k, v in fields.items():
+                print(f"   {household} {k}: stored={v['stored']} actual={v['actual']}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,30 @@
+from datetime import date
+from typing import List, Optional, Tuple
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
+from calculations import (
+    BENCHMARKS, DEFAULT_WATER_BENCHMARK, expand_grid, liters_per_month, sweep_values, water_metrics, water_rating,
+    water_ratings,
+)
+from database import get_async_db, get_db
+from query_budget import LOG_WRITE, QueryBudget, declare_budgets
+import rollups
+import tariffs
+from admission import Admission, admit_write
+from households import DEFAULT_HOUSEHOLD, current_household
+from sketches import store as sketches
 from models import WaterLog
-from schemas import WaterRequest, WaterResponse
+from schemas import WaterRequest, WaterResponse, WaterSimulationRequest, WaterSimulationResponse
 
 router = APIRouter()
+async_router = APIRouter()  # same routes on the AsyncEngine, mounted when DB_ASYNC=1
 
-# Benchmark liters per session (based on Indian averages)
-BENCHMARKS = {
-    "shower":    60,
-    "bath":      20,
-    "dishwash":  35,
-    "laundry":   70,
-    "gardening": 150,
-    "cooking":   8,
-    "flushing":  9,
-    "cleaning":  50,
-}
+QUERY_BUDGETS = declare_budgets(router, async_router, {
+    ("POST", "/calculate"): LOG_WRITE,
+    ("POST", "/simulate"): QueryBudget(statements=0),
+})
 
 ACTIVITY_TIPS = {
     "shower": [
@@ -54,26 +62,47 @@ ACTIVITY_TIPS = {
 }
 
 
-@router.post("/calculate", response_model=WaterResponse)
-def calculate_water(req: WaterRequest, db: Session = Depends(get_db)):
-    liters_per_session = req.flow_rate * req.duration
-    daily_liters = liters_per_session * req.sessions
-    days_per_month = (req.days_per_week / 7) * 30
-    monthly_liters = daily_liters * days_per_month
-    monthly_cost = (monthly_liters / 1000) * req.water_rate
-
-    benchmark = BENCHMARKS.get(req.activity, 50)
-    benchmark_per_day = benchmark * req.sessions
-    ratio = daily_liters / benchmark_per_day if benchmark_per_day > 0 else 1.0
-
-    if ratio < 1.2:
-        comparison_rating = "Good"
+def _slabbed(household: str, req: WaterRequest) -> bool:
+    # As in electricity.py: the shared default household's slabs start from zero
+    return household != DEFAULT_HOUSEHOLD and req.water_rate is None
+
+
+def _month_liters(db: Session, household: str, req: WaterRequest) -> float:
+    return rollups.month_total(db, household, "water") if _slabbed(household, req) else 0.0
+
+
+async def _month_liters_async(db: AsyncSession, household: str, req: WaterRequest) -> float:
+    return await rollups.month_total_async(db, household, "water") if _slabbed(household, req) else 0.0
+
+
+def _schedule(region: Optional[str]) -> tariffs.Schedule:
+    try:
+        return tariffs.store.book.water(region)
+    except tariffs.TariffError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _calculate(req: WaterRequest, month_liters: float = 0.0) -> Tuple[WaterLog, WaterResponse]:
+    """month_liters: the household's liters logged so far this month, which the entry is billed on top of."""
+    benchmark = BENCHMARKS.get(req.activity, DEFAULT_WATER_BENCHMARK)
+    schedule = _schedule(req.region)
+    water_rate = req.water_rate
+    if water_rate is None:
+        kl = liters_per_month(req.flow_rate, req.duration, req.sessions, req.days_per_week) / 1000
+        _, water_rate = schedule.quote(kl, month_liters / 1000)
+    m = water_metrics(req.flow_rate, req.duration, req.sessions, req.days_per_week, water_rate, benchmark)
+    daily_liters = m["daily_liters"]
+    monthly_liters = m["monthly_liters"]
+    monthly_cost = m["monthly_cost"]
+    benchmark_per_day = m["benchmark_per_day"]
+    ratio = m["ratio"]
+
+    comparison_rating = water_rating(ratio)
+    if comparison_rating == "Good":
         comparison_desc = "Within recommended range 👍"
-    elif ratio < 1.8:
-        comparison_rating = "Average"
+    elif comparison_rating == "Average":
         comparison_desc = f"{round((ratio - 1) * 100)}% above benchmark"
     else:
-        comparison_rating = "High"
         comparison_desc = f"{round((ratio - 1) * 100)}% above — improvement needed"
 
     # Build tips
@@ -87,25 +116,20 @@ def calculate_water(req: WaterRequest, db: Session = Depends(get_db)):
     if not tips:
         tips = ["✅ Great job! Your water usage is efficient", "💡 Check for leaking taps — a drip wastes 20L/day"]
 
-    # Save to DB
     log = WaterLog(
         activity_type=req.activity,
         flow_rate=req.flow_rate,
         duration_minutes=req.duration,
         sessions_per_day=req.sessions,
         days_per_week=req.days_per_week,
-        water_rate=req.water_rate,
+        water_rate=round(water_rate, 4),  # ₹/kL this entry was billed at
         daily_liters=round(daily_liters, 2),
         monthly_liters=round(monthly_liters, 2),
         monthly_cost=round(monthly_cost, 2),
         comparison_rating=comparison_rating,
         ratio=round(ratio, 2),
     )
-    db.add(log)
-    db.commit()
-    db.refresh(log)
-
-    return WaterResponse(
+    response = WaterResponse(
         daily_liters=round(daily_liters, 2),
         monthly_liters=round(monthly_liters, 2),
         monthly_cost=round(monthly_cost, 2),
@@ -113,5 +137,107 @@ def calculate_water(req: WaterRequest, db: Session = Depends(get_db)):
         comparison_desc=comparison_desc,
         ratio=round(ratio, 2),
         tips=tips,
-        saved_id=log.id,
+        region=schedule.region,
+        tariff_version=schedule.version if req.water_rate is None else None,
     )
+    return log, response
+
+
+def build_logs(reqs: List[WaterRequest], days: Optional[List[date]] = None) -> List[WaterLog]:
+    """Column-wise version of _calculate's log rows, for bulk imports: each entry billed on
+    its own, by the schedule version in force on its day."""
+    benchmark = np.array([BENCHMARKS.get(r.activity, DEFAULT_WATER_BENCHMARK) for r in reqs], dtype=float)
+    flow_rate = np.array([r.flow_rate for r in reqs], dtype=float)
+    duration = np.array([r.duration for r in reqs], dtype=float)
+    sessions = np.array([r.sessions for r in reqs], dtype=float)
+    days_per_week = np.array([r.days_per_week for r in reqs], dtype=float)
+    flat = np.array([np.nan if r.water_rate is None else r.water_rate for r in reqs], dtype=float)
+
+    kl = liters_per_month(flow_rate, duration, sessions, days_per_week) / 1000
+    _, rates, _ = tariffs.store.book.quotes("water", kl, np.zeros(len(reqs)), [r.region for r in reqs], days)
+    water_rate = np.where(np.isnan(flat), rates, flat)
+    m = water_metrics(flow_rate, duration, sessions, days_per_week, water_rate, benchmark)
+    rows = zip(m["daily_liters"].tolist(), m["monthly_liters"].tolist(), m["monthly_cost"].tolist(),
+               m["ratio"].tolist(), water_ratings(m["ratio"]).tolist(), water_rate.tolist())
+    return [
+        WaterLog(
+            activity_type=r.activity,
+            flow_rate=r.flow_rate,
+            duration_minutes=r.duration,
+            sessions_per_day=r.sessions,
+            days_per_week=r.days_per_week,
+            water_rate=round(rate, 4),
+            daily_liters=round(daily, 2),
+            monthly_liters=round(monthly, 2),
+            monthly_cost=round(cost, 2),
+            comparison_rating=rating,
+            ratio=round(ratio, 2),
+        )
+        for r, (daily, monthly, cost, ratio, rating, rate) in zip(reqs, rows)
+    ]
+
+
+@router.post("/calculate", response_model=WaterResponse)
+def calculate_water(req: WaterRequest, durable: bool = False,
+                    household: str = Depends(current_household), admission: Admission = Depends(admit_write),
+                    db: Session = Depends(get_db)):
+    log, response = _calculate(req, _month_liters(db, household, req))
+    log.household_id = household
+    response.percentile = sketches.percentile("water", req.activity, response.daily_liters)
+    return admission.save_log(db, log, req, response, durable=durable)
+
+
+@async_router.post("/calculate", response_model=WaterResponse)
+async def calculate_water_async(req: WaterRequest, durable: bool = False,
+                                household: str = Depends(current_household),
+                                admission: Admission = Depends(admit_write),
+                                db: AsyncSession = Depends(get_async_db)):
+    log, response = _calculate(req, await _month_liters_async(db, household, req))
+    log.household_id = household
+    response.percentile = sketches.percentile("water", req.activity, response.daily_liters)
+    return await admission.save_log_async(db, log, req, response, durable=durable)
+
+
+def _simulate(req: WaterSimulationRequest) -> WaterSimulationResponse:
+    benchmark = BENCHMARKS.get(req.activity, DEFAULT_WATER_BENCHMARK)
+    schedule = _schedule(req.region)
+    spec = req.model_dump()
+    try:
+        # Same bounds as WaterRequest
+        grid = expand_grid({
+            "flow_rate": sweep_values("flow_rate", spec["flow_rate"], 1, 100),
+            "duration": sweep_values("duration", spec["duration"], 1, 120),
+            "sessions": sweep_values("sessions", spec["sessions"], 1, 20, integer=True),
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if req.water_rate is None:  # each point's rate from the schedule, as _calculate quotes it
+        kl = liters_per_month(grid["flow_rate"], grid["duration"], grid["sessions"], req.days_per_week) / 1000
+        _, water_rate = schedule.quotes(kl, np.full(kl.size, req.month_liters / 1000), np.full(kl.size, np.nan),
+                                        np.zeros(kl.size))
+    else:
+        water_rate = np.full(grid["flow_rate"].size, req.water_rate)
+    m = water_metrics(grid["flow_rate"], grid["duration"], grid["sessions"], req.days_per_week, water_rate, benchmark)
+    return WaterSimulationResponse(
+        activity=req.activity,
+        points=grid["flow_rate"].size,
+        flow_rate=grid["flow_rate"].tolist(),
+        duration=grid["duration"].tolist(),
+        sessions=grid["sessions"].tolist(),
+        daily_liters=np.round(m["daily_liters"], 2).tolist(),
+        monthly_liters=np.round(m["monthly_liters"], 2).tolist(),
+        monthly_cost=np.round(m["monthly_cost"], 2).tolist(),
+        water_rate=np.round(water_rate, 4).tolist(),
+        ratio=np.round(m["ratio"], 2).tolist(),
+        comparison_rating=water_ratings(m["ratio"]).tolist(),
+        region=schedule.region,
+        tariff_version=schedule.version if req.water_rate is None else None,
+    )
+
+
+# Pure computation, nothing saved — see electricity.simulate_electricity
+@router.post("/simulate", response_model=WaterSimulationResponse)
+@async_router.post("/simulate", response_model=WaterSimulationResponse)
+def simulate_water(req: WaterSimulationRequest):
+    return _simulate(req)
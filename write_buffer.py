@@ -0,0 +1,188 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Optional
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from shared_state import SharedStats
+
+logger = logging.getLogger("ecosense.write_buffer")
+
+# Write-behind mode: when enabled, /calculate and /analyze enqueue their log rows and
+# return immediately with saved_id=None; a background thread group-commits the queue.
+# A group commit that fails is retried row by row, so only the rows that fail on their
+# own are lost: each is logged with its values and counted in rows_failed.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_INTERVAL_MS = int(os.getenv("WRITE_BEHIND_INTERVAL_MS", "50"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+
+
+class WriteBuffer:
+    """Bounded in-process queue of ORM log rows, flushed in batches by size or time window."""
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 interval_ms: int = WRITE_BEHIND_INTERVAL_MS, max_queue: int = WRITE_BEHIND_MAX_QUEUE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Summed over all workers; the queue itself (depth, running) is this worker's
+        self._stats = SharedStats("write_buffer", {
+            "enqueued": "count",
+            "rejected_full": "count",
+            "flushes": "count",
+            "rows_flushed": "count",
+            "rows_failed": "count",
+            "flushes_retried": "count",
+            "last_flush_ms": "last",
+            "max_flush_ms": "max",
+            "total_flush_ms": "sum",
+        })
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ecosense-write-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop accepting work and drain everything still queued before returning."""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, log) -> bool:
+        """Queue a row for the next group commit. Returns False when the buffer is full or stopped."""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(log)
+        except queue.Full:
+            self._stats.incr("rejected_full")
+            return False
+        self._stats.incr("enqueued")
+        return True
+
+    def stats(self) -> dict:
+        s = self._stats.snapshot()
+        s["last_flush_ms"] = round(s["last_flush_ms"], 3)
+        s["max_flush_ms"] = round(s["max_flush_ms"], 3)
+        s["enabled"] = WRITE_BEHIND
+        s["running"] = self.running
+        s["queue_depth"] = self._queue.qsize()
+        s["queue_capacity"] = self._queue.maxsize
+        s["avg_flush_ms"] = round(s["total_flush_ms"] / s["flushes"], 3) if s["flushes"] else 0.0
+        s["total_flush_ms"] = round(s["total_flush_ms"], 3)
+        return s
+
+    def _take_batch(self) -> list:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.interval))
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, rows: list) -> Optional[Exception]:
+        """Insert and commit rows in one transaction; returns the error if it was rolled back."""
+        db = self.session_factory()
+        try:
+            db.add_all(rows)
+            db.commit()
+            return None
+        except Exception as e:
+            db.rollback()  # the rows are transient again, ready for another attempt
+            return e
+        finally:
+            db.close()
+
+    def _flush(self, batch: list):
+        started = time.perf_counter()
+        lost = []
+        error = self._commit(batch)
+        if error is not None:
+            # These clients were already answered: one bad row must not take the others down
+            # with it, so retry the group one row at a time and lose only the rows that fail
+            logger.warning("write-behind flush of %d rows failed (%s), retrying row by row", len(batch), error)
+            self._stats.incr("flushes_retried")
+            for log in batch:
+                error = self._commit([log])
+                if error is not None:
+                    lost.append(log)
+                    logger.error("write-behind row lost: %s %s: %s", log.__tablename__, _fields(log), error)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats.record(flushes=1, last_flush_ms=elapsed_ms, max_flush_ms=elapsed_ms, total_flush_ms=elapsed_ms,
+                           rows_flushed=len(batch) - len(lost), rows_failed=len(lost))
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+        # Shutdown: drain whatever is left in batch-sized chunks
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                break
+            self._flush(batch)
+
+
+def _fields(log) -> dict:
+    """A lost row's column values, enough to find the request or re-enter it by hand."""
+    return {c.name: getattr(log, c.name) for c in log.__table__.columns if c.name not in ("id", "created_at")}
+
+
+buffer = WriteBuffer()
+
+
+def save_log(db: Session, log, durable: bool = False) -> Optional[int]:
+    """Persist a log row and return its id.
+
+    In write-behind mode the row is queued instead and None is returned as the
+    saved_id placeholder — the row becomes durable on the next group commit.
+    Pass durable=True (or run with WRITE_BEHIND off) to commit inline.
+    """
+    if WRITE_BEHIND and not durable and buffer.submit(log):
+        return None
+    db.add(log)
+    db.flush()
+    saved_id = log.id  # read before commit expires the instance — no refresh round trip
+    db.commit()
+    return saved_id
+
+
+async def save_log_async(db, log, durable: bool = False) -> Optional[int]:
+    """save_log for the async routers (db is an AsyncSession)."""
+    if WRITE_BEHIND and not durable and buffer.submit(log):
+        return None
+    db.add(log)
+    await db.flush()
+    saved_id = log.id
+    await db.commit()
+    return saved_id